@@ -1,43 +1,49 @@
 import logging
-from pathlib import Path
 from fastapi import APIRouter, Depends, Response, UploadFile, HTTPException
-from fastapi.responses import JSONResponse
-from data.database import get_db_session
-from langchain_openai import ChatOpenAI
-from langchain.schema import HumanMessage
+from fastapi.responses import JSONResponse, StreamingResponse
+from data.database import get_db_session, get_async_db_session, create_async_session
 from models.meal_plan import MealPlan
 from models.meal_plan_item import MealPlanItem
 from models.user import User
 from models.health_report import HealthReport
+from models.meal_plan_job import MealPlanJob
 from pydantic import BaseModel
-from sqlalchemy import desc
+from sqlalchemy import desc, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from datetime import date
-from ..services.recipe_embedding_service import load_vectordb, get_qa_chain, LocalServerEmbeddings
-from ..services.meal_plan_formatter import strip_json_prefix, strip_json_suffix
+from ..services.llm_service import LLMQueueFullError
+from ..services.meal_plan_service import (
+    generate_meal_plan, stream_meal_plan, get_latest_meal_plan, regenerate_meal_plans, restore_meal_plan_version,
+    GENERATION_MODES, UserNotFoundError, regenerate_batch_size,
+)
+from ..services.meal_plan_formatter import MealPlanFormatError
+from ..services.meal_plan_versions import list_meal_plan_versions, get_meal_plan_version, HISTORY_PAGE_SIZE
+from ..services.meal_plan_jobs import MealPlanJobQueue, job_to_dict, batch_status
+from ..services.plan_cache import plan_cache
+from ..services.resources import resources
 import json
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/meal_plans", tags=["MealPlans"], include_in_schema=False)
-BASE_DIR = Path(__file__).resolve().parent.parent.parent    # -> backend/
-CHROMA_DIR = BASE_DIR / "chroma_recipes"
-base_url = "http://127.0.0.1:1234/v1"
+meal_plan_temperature = 0.25
 
-embeddings = LocalServerEmbeddings(base_url=base_url)
 
+async def generate_in_background(db_session: AsyncSession, user_id: str, use_cache: bool, mode: str | None):
+    return await generate_meal_plan(
+        resources.llm(temperature=meal_plan_temperature), db_session, user_id,
+        use_cache=use_cache, retriever=await resources.recipe_retriever(), mode=mode,
+    )
 
-recipes_db = load_vectordb(
-    persist_directory=str(CHROMA_DIR),
-    embedding=embeddings,
-)
-api_key = "lm-studio"
-llm_model = "phi-4"
-
-llm = ChatOpenAI(
-    base_url=base_url,
-    api_key=api_key,
-    temperature=0.25,
-    model=llm_model
-)
+
+async def regenerate_in_background(db_session: AsyncSession, user_ids: list, use_cache: bool):
+    return await regenerate_meal_plans(
+        resources.llm(temperature=meal_plan_temperature), db_session, user_ids,
+        use_cache=use_cache, retriever=await resources.recipe_retriever(),
+    )
+
+
+job_queue = MealPlanJobQueue(handler=generate_in_background, batch_handler=regenerate_in_background,
+                             batch_size=regenerate_batch_size)
 
 
 class MealPlanResponse(BaseModel):
@@ -62,161 +68,138 @@ class MealItemResponse(BaseModel):
         from_attributes = True
 
 
+class RegenerateMealPlansRequest(BaseModel):
+    user_ids: list[str]
+
+
 @router.get("/get_user_meal_plan")
-def get_user_most_recent_meal_plan(user_id : str, db_session=Depends(get_db_session)):
+async def get_user_most_recent_meal_plan(user_id : str, db_session: AsyncSession = Depends(get_async_db_session)):
     logger.info(f"Getting User {user_id} most recent meal plan")
 
-    latest_plan = db_session.query(MealPlan).filter(MealPlan.user_id == user_id).first()
+    content = await get_latest_meal_plan(db_session, user_id)
 
-    if latest_plan is None:
+    if content is None:
         logger.exception(f"No meal plan for user_id {user_id} found")
         raise HTTPException(status_code=404, detail="Meal plan not found")
 
-    items = (
-        db_session.query(MealPlanItem)
-        .filter(MealPlanItem.meal_plan_id == latest_plan.id)
-        .all()
-    )
+    return content
 
-    items_data = [
-        {
-            "id": item.id,
-            "breakfast": item.breakfast,
-            "lunch": item.lunch,
-            "dinner": item.dinner,
-            "snack": item.snack,
-            "meal_slot": item.meal_slot,
-            "macros": item.macros,
-        }
-        for item in items
-    ]
-    content = {
-        "meal_plan_id": latest_plan.id,
-        "name": latest_plan.name,
-        "description": latest_plan.description,
-        "date_created": str(latest_plan.date_created),
-        "plan": items_data
-    }
+
+@router.post("/create_meal_plan")
+async def create_meal_plan(user_id: str, background: bool = False, use_cache: bool = True, mode: str | None = None,
+                           db_session: AsyncSession = Depends(get_async_db_session)):
+    if mode is not None and mode not in GENERATION_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {', '.join(GENERATION_MODES)}")
+
+    if background:
+        job = await job_queue.submit(db_session, user_id, use_cache=use_cache, mode=mode)
+        return JSONResponse(status_code=202, content=job_to_dict(job))
+
+    try:
+        return await generate_meal_plan(
+            resources.llm(temperature=meal_plan_temperature), db_session, user_id,
+            use_cache=use_cache, retriever=await resources.recipe_retriever(), mode=mode,
+        )
+    except UserNotFoundError:
+        logger.exception(f"User {user_id} not found")
+        raise HTTPException(status_code=404, detail="User not found")
+    except LLMQueueFullError as e:
+        logger.warning(f"Meal plan generation for user_id {user_id} rejected: {e}")
+        raise HTTPException(status_code=503, detail="Meal plan generation is busy, please try again later")
+    except MealPlanFormatError:
+        logger.exception(f"Meal plan generation for user_id {user_id} returned an invalid plan")
+        raise HTTPException(status_code=502, detail="Meal plan generation returned an invalid plan")
+
+
+@router.get("/history")
+async def get_meal_plan_history(user_id: str, before: int | None = None, limit: int = HISTORY_PAGE_SIZE,
+                                db_session: AsyncSession = Depends(get_async_db_session)):
+    logger.info(f"Getting User {user_id} meal plan history")
+
+    return await list_meal_plan_versions(db_session, user_id, before, limit)
+
+
+@router.get("/history/{version_id}")
+async def get_meal_plan_history_version(user_id: str, version_id: int,
+                                        db_session: AsyncSession = Depends(get_async_db_session)):
+    content = await get_meal_plan_version(db_session, user_id, version_id)
+
+    if content is None:
+        logger.exception(f"Meal plan version {version_id} for user_id {user_id} not found")
+        raise HTTPException(status_code=404, detail="Meal plan version not found")
 
     return content
 
 
-@router.post("/create_meal_plan")
-def create_meal_plan(user_id: str, db_session = Depends(get_db_session)):
-    user = db_session.query(User).filter(User.id == user_id).first()
-    health_report = db_session.query(HealthReport).filter(HealthReport.user_id == user_id).first()
-    health_report_text = None
-    if health_report is None:
-        health_report_text = "None"
-    else:
-        health_report_text = health_report.report_text
-
-    PROMPT = """
-    You are a helpful assistant specialized in nutrition.
-Make a personalized meal plan for every day of the week that includes on each day breakfast, lunch, dinner and a snack
-User Information:
-Weight (in Kg): """ + str(user.weight) + """
-Height (in cm): """ + str(user.height) + """
-Age: """ + str(user.age) + """
-BMI:""" + str(user.bmi) + """
-Gender: """ + user.sex + """
-Fitness Goal: """ + user.fitness_goal + """
-Activity Level: """ + user.activity_level + """
-Dietary Preferences: """ + user.dietary_preferences + """
-Medical Conditions: """ + user.medical_conditions + """
-
-Medical History (can be empty): """ + health_report_text + """
-Response Format:
-Provide a JSON that contains 3 objects, the last one being a list of JSON objects in the following format:
-name: (string) The name of the weekly meal plan.
-description: (string) A very short and concise description of the weekly plan.
-plan: (dict) A JSON that contains the following objects:
-    meal_slot: (string) The week day (e.g. Monday)
-    breakfast: (string) The name of the meal for breakfast
-    lunch: (string) The name of the meal for lunch
-    dinner: (string) The name of the meal for dinner
-    snack: (string) The name of the snack meal
-    macros: (string) An estimate of the total macros (carbohydrates, protein, fats and calories) computed from all the meals of that day
-
-
-Example:
-User Information:
-Weight: 90
-Height: 180
-BMI: 27.8
-Gender: Male
-Fitness Goal: Lose weight
-Activity Level: sedentary
-Dietary Preferences: vegan
-Medical Conditions: diabetes
-Medical History: previous diagnosis of mild anemia, recent MRI showing slight brain white matter changes
-The response should have the following json format, and only respond like it. All responses should be in valid json format.
-{
-    "name": str
-    "description": str
-    "plan": [
-    {
-        "meal_slot": "str",
-        "breakfast": "str",        
-        "lunch": "str",
-        "dinner": "str",
-        "snack": "str",
-        "macros": "str",
-    },
-    ]
-}
-Remember to respond always with a plan that has 7 items (one unique plan for each day of the week) in the order of the week days!
-Remember to respond always with a valid JSON format!
-    """
-    # rag_query = (
-    #     f"You are a nutrition assistant. Based on the context, pick 7 suitable recipes "
-    #     "(one per weekday) and assemble a daily meal plan with breakfast, lunch, dinner, and a snack. "
-    #     "Provide macros estimates. Respond in JSON with keys: name, description, plan. "
-    #     f"Instruction: {PROMPT}"
-    # )
-    # qa_chain = get_qa_chain(llm, recipes_db)
-    # response = qa_chain({"query": rag_query})
-    # response_text = response["result"]
-
-    response = llm.invoke([HumanMessage(content=PROMPT)])
-    response_text = response.content
-    print(response_text)
-    response_text = strip_json_suffix(strip_json_prefix(response_text))
-    json_response_text = json.loads(response_text)
-
-    old_plan = db_session.query(MealPlan).filter(MealPlan.user_id == user_id).first()
-    if old_plan:
-        old_plan_id = old_plan.id
-        all_meal_items = db_session.query(MealPlanItem).filter(MealPlanItem.meal_plan_id == old_plan_id).all()
-        for meal_item in all_meal_items:
-            db_session.delete(meal_item)
-        db_session.delete(old_plan)
-
-        db_session.commit()
-        print("Old plan DELETED")
-
-
-    plan_name = json_response_text["name"]
-    plan_descr = json_response_text["description"]
-
-    new_plan = MealPlan(user_id, plan_name, plan_descr, date.today())
-
-    db_session.add(new_plan)
-    db_session.flush() # needed to access the new_plan id before commiting
-
-    plan_id = new_plan.id
-    plan_list = json_response_text["plan"]
-    for plan in plan_list:
-        day = plan["meal_slot"]
-        breakfast = plan["breakfast"]
-        lunch = plan["lunch"]
-        dinner = plan["dinner"]
-        snack = plan["snack"]
-        macros = plan["macros"]
-
-        new_meal_item = MealPlanItem(breakfast, lunch, dinner, snack, day, macros, plan_id)
-        db_session.add(new_meal_item)
-
-    db_session.commit()
-
-    return json_response_text
+@router.post("/history/{version_id}/restore")
+async def restore_meal_plan(user_id: str, version_id: int, db_session: AsyncSession = Depends(get_async_db_session)):
+    logger.info(f"Restoring meal plan version {version_id} for user_id {user_id}")
+
+    try:
+        return await restore_meal_plan_version(db_session, user_id, version_id)
+    except LookupError:
+        logger.exception(f"Meal plan version {version_id} for user_id {user_id} not found")
+        raise HTTPException(status_code=404, detail="Meal plan version not found")
+
+
+@router.post("/regenerate_meal_plans")
+async def regenerate_user_meal_plans(request: RegenerateMealPlansRequest, use_cache: bool = True,
+                                     db_session: AsyncSession = Depends(get_async_db_session)):
+    logger.info(f"Queueing meal plan regeneration for {len(request.user_ids)} users")
+
+    batch = await job_queue.submit_batch(db_session, request.user_ids, use_cache=use_cache)
+    return JSONResponse(status_code=202, content=batch)
+
+
+@router.get("/create_meal_plan_stream")
+async def create_meal_plan_stream(user_id: str, use_cache: bool = True):
+    async def events():
+        db_session = await create_async_session()
+        try:
+            async for event, data in stream_meal_plan(resources.llm(temperature=meal_plan_temperature), db_session,
+                                                     user_id, use_cache=use_cache,
+                                                     retriever=await resources.recipe_retriever()):
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        except UserNotFoundError:
+            logger.exception(f"User {user_id} not found")
+            yield f"event: error\ndata: {json.dumps({'detail': 'User not found'})}\n\n"
+        except LLMQueueFullError as e:
+            logger.warning(f"Meal plan generation for user_id {user_id} rejected: {e}")
+            yield f"event: error\ndata: {json.dumps({'detail': 'Meal plan generation is busy, please try again later'})}\n\n"
+        except MealPlanFormatError:
+            logger.exception(f"Streaming meal plan generation for user_id {user_id} returned an invalid plan")
+            yield f"event: error\ndata: {json.dumps({'detail': 'Meal plan generation returned an invalid plan'})}\n\n"
+        except Exception:
+            logger.exception(f"Streaming meal plan generation for user_id {user_id} failed")
+            yield f"event: error\ndata: {json.dumps({'detail': 'Meal plan generation failed'})}\n\n"
+        finally:
+            await db_session.close()
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+
+@router.get("/cache_stats")
+def get_cache_stats():
+    return {**plan_cache.stats(), "query_embeddings": resources.embeddings().stats()}
+
+
+@router.get("/jobs/batches/{batch_id}")
+async def get_meal_plan_batch(batch_id: str, db_session: AsyncSession = Depends(get_async_db_session)):
+    status = await batch_status(db_session, batch_id)
+
+    if status is None:
+        logger.exception(f"Meal plan batch {batch_id} not found")
+        raise HTTPException(status_code=404, detail="Meal plan batch not found")
+
+    return status
+
+
+@router.get("/jobs/{job_id}")
+async def get_meal_plan_job(job_id: str, db_session: AsyncSession = Depends(get_async_db_session)):
+    job = await db_session.get(MealPlanJob, job_id)
+
+    if job is None:
+        logger.exception(f"Meal plan job {job_id} not found")
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    return job_to_dict(job)
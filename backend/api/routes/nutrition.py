@@ -0,0 +1,35 @@
+import logging
+
+from fastapi import APIRouter, Depends, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from data.database import get_async_db_session
+from ..services.nutrition_service import weekly_totals, user_averages, cohort_stats, COHORT_FIELDS
+
+logger = logging.getLogger(__name__)
+router = APIRouter(prefix="/api/nutrition", tags=["Nutrition"], include_in_schema=False)
+
+
+@router.get("/weekly_totals")
+async def get_weekly_totals(user_id: str, db_session: AsyncSession = Depends(get_async_db_session)):
+    totals = await weekly_totals(db_session, user_id)
+
+    if totals is None:
+        logger.exception(f"No meal plan for user_id {user_id} found")
+        raise HTTPException(status_code=404, detail="Meal plan not found")
+
+    return totals
+
+
+@router.get("/user_averages")
+async def get_user_averages(after: str | None = None, limit: int = 100,
+                            db_session: AsyncSession = Depends(get_async_db_session)):
+    return await user_averages(db_session, after, limit)
+
+
+@router.get("/cohort_stats")
+async def get_cohort_stats(group_by: str = "fitness_goal", db_session: AsyncSession = Depends(get_async_db_session)):
+    if group_by not in COHORT_FIELDS:
+        raise HTTPException(status_code=400, detail=f"group_by must be one of {', '.join(COHORT_FIELDS)}")
+
+    return await cohort_stats(db_session, group_by)
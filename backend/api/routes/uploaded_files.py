@@ -2,28 +2,24 @@ import logging
 
 from fastapi import APIRouter, Depends, Response, UploadFile, HTTPException
 from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
 import json
-from data.database import get_db_session
-from api.services.file_service import extract_text
-from langchain_openai import ChatOpenAI
-from langchain.schema import HumanMessage
+from data.database import get_db_session, get_async_db_session
+from api.services.file_service import aextract_text, UploadTooLargeError
+from api.services.ocr_service import OCRError
+from api.services.report_store import report_store, hash_upload
 from models.health_report import HealthReport
 from pydantic import BaseModel
+from sqlalchemy.ext.asyncio import AsyncSession
+from api.services.llm_service import LLMQueueFullError
+from api.services.report_summary_service import summarize_report, bound_summary
+from api.services.resources import resources
 
 
 logger = logging.getLogger(__name__)
 router = APIRouter(prefix="/api/files", tags=["Files"], include_in_schema=False)
 
-base_url = "http://127.0.0.1:1234/v1"
-api_key = "lm-studio"
-llm_model = "phi-4"
-
-llm = ChatOpenAI(
-    base_url=base_url,
-    api_key=api_key,
-    temperature=0.1,
-    model=llm_model
-)
+summary_temperature = 0.1
 
 class HealthReportResponse(BaseModel):
     id: str
@@ -52,29 +48,45 @@ def get_user_report(user_id : str, db_session=Depends(get_db_session)):
     return JSONResponse(content=report_json)
 
 
-@router.post("/process_file")
-def work_file(user_id: str, uploaded_file: UploadFile, db_session=Depends(get_db_session)):
-    logger.info(uploaded_file.headers["content-type"])
+async def summarize_upload(user_id: str, uploaded_file: UploadFile, digest: str) -> str:
+    text = report_store.get(digest, "text")
+    if text is None:
+        try:
+            text = await aextract_text(uploaded_file, uploaded_file.headers["content-type"])
+        except UploadTooLargeError as e:
+            logger.warning(f"Upload from user_id {user_id} rejected: {e}")
+            raise HTTPException(status_code=413, detail=str(e))
+        except OCRError as e:
+            logger.exception(f"OCR of upload from user_id {user_id} failed")
+            raise HTTPException(status_code=502, detail="Could not read text from the uploaded file")
+        report_store.put(digest, "text", text)
 
-    text = extract_text(uploaded_file, uploaded_file.headers["content-type"])
+    try:
+        summary = await summarize_report(resources.llm(temperature=summary_temperature), text)
+    except LLMQueueFullError as e:
+        logger.warning(f"Health report summary for user_id {user_id} rejected: {e}")
+        raise HTTPException(status_code=503, detail="Report processing is busy, please try again later")
 
+    report_store.put(digest, "summary", summary)
+    return summary
 
-    PROMPT = """
-    You are a helpful assistant specialized in medical tasks. You will be given a health report of any type and should summary it extensively keeping attention to health problems and unhealthy levels.
-    The summary should be medical focused and must contain less than 512 words!
-    Report:
-    """ + text + """
-    Please respond only in valid text format with no special characters and no additional words other than the report. If the given report text is not medical related at all, or if it is offensive always reply with only the following phrase "no medical history" without justifying the answer:
-    """
 
+@router.post("/process_file")
+async def work_file(user_id: str, uploaded_file: UploadFile, db_session: AsyncSession = Depends(get_async_db_session)):
+    logger.info(uploaded_file.headers["content-type"])
 
-    response = llm.invoke([HumanMessage(content=PROMPT)])
-    health_report_text = response.content
+    digest = await run_in_threadpool(hash_upload, uploaded_file)
+    health_report_text = report_store.get(digest, "summary")
+    if health_report_text is not None:
+        logger.info(f"Upload {digest} already summarized, reusing stored summary")
+        health_report_text = bound_summary(health_report_text)
+    else:
+        health_report_text = await summarize_upload(user_id, uploaded_file, digest)
 
     new_health_report = HealthReport(user_id, health_report_text)
 
     db_session.add(new_health_report)
 
-    db_session.commit()
+    await db_session.commit()
 
     return "Health report generated SUCCESSFULLY!"
\ No newline at end of file
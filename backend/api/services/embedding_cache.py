@@ -0,0 +1,316 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import List
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+
+from .cache import TTLCache
+from .recipe_embedding_service import EmbeddingError
+
+try:
+    import fcntl
+except ImportError:  # Windows: no inter-process lock, share a cache directory between threads only
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Disk-backed embedding cache for one embedding model.
+    Vectors are appended as float32 rows to a memory-mapped matrix file and a small
+    SQLite index maps the hash of each text to its row. Writes hold a lock file, so several
+    processes can share the directory: the row of an appended vector is taken from the size
+    of the matrix file under the lock, and a partial row left by a crashed write is cut off.
+    """
+    def __init__(self, directory: str, model: str):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.model = model
+        slug = re.sub(r"[^A-Za-z0-9_.-]+", "_", model)
+        self.matrix_path = self.directory / f"{slug}.f32"
+        self.lock_path = self.directory / f"{slug}.lock"
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(str(self.directory / f"{slug}.idx.sqlite"), check_same_thread=False,
+                                           timeout=30)
+        with self._file_lock():
+            self._connection.execute("CREATE TABLE IF NOT EXISTS rows (key TEXT PRIMARY KEY, row INTEGER NOT NULL)")
+            self._connection.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+            self._connection.commit()
+            self.dim = self._stored_dim()
+            if self.dim is not None and self.matrix_path.exists():
+                with open(self.matrix_path, "r+b") as matrix_file:
+                    self._trim(matrix_file)
+        self._matrix = None
+        self._rows = self._row_count()
+
+    @contextmanager
+    def _file_lock(self):
+        with open(self.lock_path, "a+b") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _stored_dim(self) -> int | None:
+        dim = self._connection.execute("SELECT value FROM meta WHERE name = 'dim'").fetchone()
+        return int(dim[0]) if dim else None
+
+    def _trim(self, matrix_file) -> int:
+        """
+        Cut a partial last row (a crash during an append) off the matrix file and return its row count.
+        """
+        row_bytes = 4 * self.dim
+        size = os.fstat(matrix_file.fileno()).st_size
+        if size % row_bytes:
+            logger.warning(f"Cutting a partial row off {self.matrix_path}")
+            matrix_file.truncate(size - size % row_bytes)
+        return size // row_bytes
+
+    def _row_count(self) -> int:
+        if self.dim is None or not self.matrix_path.exists():
+            return 0
+        return self.matrix_path.stat().st_size // (4 * self.dim)
+
+    def _view(self) -> np.ndarray:
+        # re-map only when rows were appended since the last mapping
+        if self._matrix is None or self._matrix.shape[0] != self._rows:
+            self._matrix = np.memmap(self.matrix_path, dtype=np.float32, mode="r", shape=(self._rows, self.dim))
+        return self._matrix
+
+    def __len__(self):
+        return self._rows
+
+    def get_many(self, texts: List[str]) -> List[List[float] | None]:
+        keys = [text_hash(text) for text in texts]
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), 500):
+                chunk = keys[start : start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                found.update(self._connection.execute(
+                    f"SELECT key, row FROM rows WHERE key IN ({placeholders})", chunk
+                ).fetchall())
+            if not found:
+                return [None] * len(texts)
+            if self.dim is None or max(found.values()) >= self._rows:
+                # rows appended by another process
+                self.dim = self.dim or self._stored_dim()
+                self._rows = self._row_count()
+            matrix = self._view()
+            return [matrix[found[key]].tolist() if key in found and found[key] < self._rows else None for key in keys]
+
+    def put_many(self, texts: List[str], vectors: List[List[float]]):
+        if not texts:
+            return
+        with self._lock, self._file_lock():
+            if self.dim is None:
+                self.dim = self._stored_dim()
+            if self.dim is None:
+                self.dim = len(vectors[0])
+                self._connection.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('dim', ?)", (str(self.dim),))
+                self._connection.commit()
+
+            new_keys, new_vectors, seen = [], [], set()
+            for text, vector in zip(texts, vectors):
+                key = text_hash(text)
+                if key in seen:
+                    continue
+                seen.add(key)
+                new_keys.append(key)
+                new_vectors.append(vector)
+            existing = set()
+            for start in range(0, len(new_keys), 500):
+                chunk = new_keys[start : start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                existing.update(row[0] for row in self._connection.execute(
+                    f"SELECT key FROM rows WHERE key IN ({placeholders})", chunk
+                ))
+            rows = [(key, vector) for key, vector in zip(new_keys, new_vectors) if key not in existing]
+            if not rows:
+                return
+
+            matrix = np.asarray([vector for _, vector in rows], dtype=np.float32)
+            with open(self.matrix_path, "ab") as matrix_file:
+                first_row = self._trim(matrix_file)
+                matrix_file.write(matrix.tobytes())
+            self._connection.executemany(
+                "INSERT INTO rows (key, row) VALUES (?, ?)",
+                [(key, first_row + i) for i, (key, _) in enumerate(rows)],
+            )
+            self._connection.commit()
+            self._rows = first_row + len(rows)
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an Embeddings client so documents already embedded by the same model are read from an EmbeddingCache.
+    """
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.hits = 0
+        self.misses = 0
+
+    def _split(self, texts: List[str]):
+        cached = self.cache.get_many(texts)
+        missing = list(dict.fromkeys(text for text, vector in zip(texts, cached) if vector is None))
+        self.hits += len(texts) - sum(vector is None for vector in cached)
+        self.misses += len(missing)
+        return cached, missing
+
+    def _merge(self, texts, cached, missing, missing_vectors, error: EmbeddingError | None = None):
+        # failed texts (None) are not cached, so they are embedded again next time
+        embedded = [(text, vector) for text, vector in zip(missing, missing_vectors) if vector is not None]
+        self.cache.put_many([text for text, _ in embedded], [vector for _, vector in embedded])
+        computed = dict(zip(missing, missing_vectors))
+        vectors = [vector if vector is not None else computed[text] for text, vector in zip(texts, cached)]
+        if error is not None:
+            raise EmbeddingError(str(error), vectors) from error
+        return vectors
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        cached, missing = self._split(texts)
+        try:
+            missing_vectors = self.embeddings.embed_documents(missing) if missing else []
+        except EmbeddingError as e:
+            return self._merge(texts, cached, missing, e.vectors, e)
+        return self._merge(texts, cached, missing, missing_vectors)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        cached, missing = self._split(texts)
+        try:
+            missing_vectors = await self.embeddings.aembed_documents(missing) if missing else []
+        except EmbeddingError as e:
+            return self._merge(texts, cached, missing, e.vectors, e)
+        return self._merge(texts, cached, missing, missing_vectors)
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self.embeddings.aembed_query(text)
+
+
+class QueryBatcher:
+    """
+    Micro-batches query embeddings: concurrent calls arriving within window seconds
+    are merged into a single aembed_queries request (aembed_documents for clients without it).
+    """
+    def __init__(self, embeddings: Embeddings, window: float = 0.005, max_batch: int = 64):
+        self.embeddings = embeddings
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = []
+        self._timer = None
+
+    async def embed(self, text: str) -> List[float]:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+        if len(self._pending) >= self.max_batch:
+            batch, self._pending = self._pending, []
+            asyncio.ensure_future(self._run(batch))
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window, self._on_timer)
+        return await future
+
+    def _on_timer(self):
+        self._timer = None
+        batch, self._pending = self._pending, []
+        if batch:
+            asyncio.ensure_future(self._run(batch))
+
+    async def _run(self, batch):
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        embed = getattr(self.embeddings, "aembed_queries", None) or self.embeddings.aembed_documents
+        try:
+            vectors = dict(zip(texts, await embed(texts)))
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for text, future in batch:
+            if not future.done():
+                future.set_result(vectors[text])
+
+
+class CachedQueryEmbeddings(Embeddings):
+    """
+    Query embedding cache: an in-memory LRU in front of an optional on-disk EmbeddingCache,
+    with async misses micro-batched through a QueryBatcher. Documents are passed through unchanged.
+    """
+    def __init__(self, embeddings: Embeddings, max_entries: int = 4096, persistent: EmbeddingCache | None = None,
+                 batch_window: float = 0.005, max_batch: int = 64):
+        self.embeddings = embeddings
+        self.memory = TTLCache(max_entries)
+        self.persistent = persistent
+        self.batcher = QueryBatcher(embeddings, batch_window, max_batch)
+        self.hits = 0
+        self.misses = 0
+
+    def _lookup(self, text: str) -> List[float] | None:
+        vector = self.memory.get(text)
+        if vector is None and self.persistent is not None:
+            vector = self.persistent.get_many([text])[0]
+            if vector is not None:
+                self.memory.set(text, vector)
+        if vector is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return vector
+
+    def _store(self, text: str, vector: List[float]):
+        # an empty or all-zero vector is a failed embedding, caching it would poison every later lookup
+        if not vector or not any(vector):
+            return
+        self.memory.set(text, vector)
+        if self.persistent is not None:
+            self.persistent.put_many([text], [vector])
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.embeddings.aembed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        vector = self._lookup(text)
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self._store(text, vector)
+        return vector
+
+    async def aembed_query(self, text: str) -> List[float]:
+        vector = self._lookup(text)
+        if vector is None:
+            vector = await self.batcher.embed(text)
+            self._store(text, vector)
+        return vector
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "memory_entries": len(self.memory),
+            "persistent": self.persistent is not None,
+        }
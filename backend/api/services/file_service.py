@@ -1,37 +1,126 @@
+import asyncio
 import io
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
 from PyPDF2 import PdfReader
 from dotenv import load_dotenv
+from starlette.concurrency import run_in_threadpool
 
 import os
-import requests
+
+from .ocr_service import get_ocr_backend, IMAGE_SUFFIXES
 
 load_dotenv()
 
-ocr_key = os.getenv('OCR_API_KEY')
+logger = logging.getLogger(__name__)
+
+pdf_max_pages = int(os.getenv('PDF_MAX_PAGES', '100'))
+pdf_max_chars = int(os.getenv('PDF_MAX_CHARS', '200000'))
+upload_max_bytes = int(os.getenv('UPLOAD_MAX_BYTES', str(50 * 1024 * 1024)))
+pdf_time_budget = float(os.getenv('PDF_TIME_BUDGET', '30'))
+pdf_workers = int(os.getenv('PDF_WORKERS', '2'))
+
+_pdf_pool = None
+
+
+class UploadTooLargeError(ValueError):
+    """
+    Raised when an upload is bigger than the configured extraction limit.
+    """
+
+
+def iter_pdf_pages(stream, max_pages: int = pdf_max_pages, time_budget: float = pdf_time_budget):
+    """
+    Lazily yield the text of each PDF page, stopping at max_pages or once time_budget seconds are spent.
+    """
+    reader = PdfReader(stream)
+    deadline = time.monotonic() + time_budget
+    for index, page in enumerate(reader.pages):
+        if index >= max_pages:
+            logger.warning(f"PDF has more than {max_pages} pages, ignoring the rest")
+            break
+        if time.monotonic() > deadline:
+            logger.warning(f"PDF extraction exceeded {time_budget}s, stopped after {index} pages")
+            break
+        yield page.extract_text() or ""
+
+
+def read_pdf_text(stream, max_pages: int = pdf_max_pages, max_chars: int = pdf_max_chars,
+                  time_budget: float = pdf_time_budget) -> str:
+    parts = []
+    length = 0
+    for text in iter_pdf_pages(stream, max_pages, time_budget):
+        parts.append(text[:max_chars - length])
+        length += len(parts[-1])
+        if length >= max_chars:
+            logger.warning(f"PDF text truncated to {max_chars} characters")
+            break
+    return "".join(parts)
+
+
+def _read_pdf_bytes(data: bytes, max_pages: int, max_chars: int, time_budget: float) -> str:
+    # runs inside the process pool
+    with io.BytesIO(data) as opened_pdf_file:
+        return read_pdf_text(opened_pdf_file, max_pages, max_chars, time_budget)
+
+
+def _get_pdf_pool() -> ProcessPoolExecutor:
+    global _pdf_pool
+    if _pdf_pool is None:
+        _pdf_pool = ProcessPoolExecutor(max_workers=pdf_workers)
+    return _pdf_pool
+
+
+def _upload_size(uploaded_file) -> int:
+    uploaded_file.file.seek(0, io.SEEK_END)
+    size = uploaded_file.file.tell()
+    uploaded_file.file.seek(0)
+    return size
+
 
 def extract_text(uploaded_file, type):
+    """
+    Extract text from PDF text layers and plain text files. Images and scanned PDFs need OCR, see aextract_text.
+    """
     data = ""
     extracted_bytes = ""
     if type == "application/pdf":
-        extracted_bytes = uploaded_file.file.read()
-        with io.BytesIO(extracted_bytes) as opened_pdf_file:
-            reader = PdfReader(opened_pdf_file)
-            for page in reader.pages:
-                data += page.extract_text()
+        uploaded_file.file.seek(0)
+        data = read_pdf_text(uploaded_file.file)
     if type == "text/plain":
         extracted_bytes = uploaded_file.file.read()
         data = extracted_bytes.decode("utf-8")
-    if type == "image/png":
-       payload = {'isOverlayRequired': False,
-           'apikey': str(ocr_key),
-           'language': "eng",
-        }
-       res = requests.post('https://api.ocr.space/parse/image',
-                          files={uploaded_file.filename: uploaded_file.file},
-                          data=payload,
-                          )
-       results = res.json()["ParsedResults"]
-       extracted_bytes = uploaded_file.file.read()
-       for result in results:
-           data += result["ParsedText"]
     return data
+
+
+async def aextract_text(uploaded_file, type):
+    """
+    Async extract_text. PDF parsing is CPU bound, so it runs in a process pool
+    instead of holding the GIL of the request worker. Images (PNG, JPEG, TIFF) and
+    PDFs without a text layer go through the configured OCR backend.
+    """
+    if type not in IMAGE_SUFFIXES:
+        return await run_in_threadpool(extract_text, uploaded_file, type)
+
+    if _upload_size(uploaded_file) > upload_max_bytes:
+        raise UploadTooLargeError(f"Upload is larger than {upload_max_bytes} bytes")
+
+    data = await run_in_threadpool(uploaded_file.file.read)
+    if type == "application/pdf":
+        loop = asyncio.get_running_loop()
+        text = await loop.run_in_executor(
+            _get_pdf_pool(), _read_pdf_bytes, data, pdf_max_pages, pdf_max_chars, pdf_time_budget
+        )
+        if text.strip():
+            return text
+        logger.info(f"PDF {uploaded_file.filename} has no text layer, falling back to OCR")
+
+    return await get_ocr_backend().extract(data, type, uploaded_file.filename or "upload")
+
+
+def shutdown_pdf_pool():
+    global _pdf_pool
+    if _pdf_pool is not None:
+        _pdf_pool.shutdown(cancel_futures=True)
+        _pdf_pool = None
@@ -0,0 +1,263 @@
+import json
+import logging
+import math
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import List
+
+import pandas as pd
+from langchain.embeddings.base import Embeddings
+from langchain.schema import Document
+
+from .recipe_embedding_service import (
+    iter_recipe_batches, iter_recipe_chunks, split_documents, load_vectordb, chunk_id, EmbeddingError,
+)
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+class IndexCheckpoint:
+    """
+    Records which CSV batches are fully written to the vector store, so an interrupted build can resume.
+    """
+    def __init__(self, path: str, csv_path: str, batch_size: int):
+        self.path = Path(path)
+        self.csv_path = str(csv_path)
+        self.batch_size = batch_size
+        self.completed = set()
+        self.chunks_written = 0
+
+    def load(self):
+        if not self.path.exists():
+            return
+        state = json.loads(self.path.read_text())
+        if state.get("csv_path") != self.csv_path or state.get("batch_size") != self.batch_size:
+            logger.warning(f"Checkpoint {self.path} belongs to a different build, ignoring it")
+            return
+        self.completed = set(state["completed_batches"])
+        self.chunks_written = state.get("chunks_written", 0)
+
+    def mark_done(self, batch_no: int, chunks: int):
+        self.completed.add(batch_no)
+        self.chunks_written += chunks
+        tmp_path = self.path.with_name(self.path.name + ".tmp")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path.write_text(json.dumps({
+            "csv_path": self.csv_path,
+            "batch_size": self.batch_size,
+            "completed_batches": sorted(self.completed),
+            "chunks_written": self.chunks_written,
+        }))
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        self.path.unlink(missing_ok=True)
+
+
+class ProgressReporter:
+    """
+    Logs throughput (chunks/s) and an ETA based on the share of CSV batches done.
+    """
+    def __init__(self, total_batches: int, done_batches: int, interval: float = 5.0):
+        self.total_batches = total_batches
+        self.done_batches = done_batches
+        self.initial_batches = done_batches
+        self.chunks = 0
+        self.interval = interval
+        self.started = time.monotonic()
+        self._last_report = 0.0
+
+    def update(self, chunks: int):
+        self.done_batches += 1
+        self.chunks += chunks
+        self.report()
+
+    def report(self, force: bool = False):
+        now = time.monotonic()
+        if not force and now - self._last_report < self.interval:
+            return
+        self._last_report = now
+        elapsed = now - self.started
+        rate = self.chunks / elapsed if elapsed else 0.0
+        batches_this_run = self.done_batches - self.initial_batches
+        remaining = self.total_batches - self.done_batches
+        eta = elapsed / batches_this_run * max(remaining, 0) if batches_this_run else float("nan")
+        logger.info(
+            f"{self.done_batches}/{self.total_batches} batches, {self.chunks} chunks written, "
+            f"{rate:.1f} chunks/s, ETA {eta / 60:.1f} min"
+        )
+
+
+def count_recipes(csv_path: str) -> int:
+    """
+    Number of named recipes in the CSV, reading only the name column.
+    """
+    return sum(
+        int(df['name'].notna().sum())
+        for df in pd.read_csv(csv_path, usecols=['name'], dtype={'name': str}, chunksize=50_000)
+    )
+
+
+class IndexBuilder:
+    """
+    Pipelined recipe index build: CSV batches are split in a process pool, embedded by concurrent
+    workers and upserted into Chroma in batches by a single writer, which checkpoints every finished CSV batch.
+    Chunks already present in the store (same deterministic id) are not embedded again.
+    """
+    def __init__(
+        self,
+        csv_path: str,
+        persist_directory: str,
+        embedding: Embeddings,
+        batch_size: int = 2000,
+        split_workers: int = 2,
+        embed_workers: int = 2,
+        write_batch_size: int = 1000,
+        checkpoint_path: str | None = None,
+        chunk_size: int = 1000,
+        chunk_overlap: int = 100,
+    ):
+        self.csv_path = csv_path
+        self.persist_directory = persist_directory
+        self.embedding = embedding
+        self.batch_size = batch_size
+        self.split_workers = split_workers
+        self.embed_workers = embed_workers
+        self.write_batch_size = write_batch_size
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.checkpoint = IndexCheckpoint(
+            checkpoint_path or os.path.join(persist_directory, "index_checkpoint.json"), csv_path, batch_size
+        )
+        self._error = None
+        self._incomplete = 0
+
+    def _fail(self, error: BaseException):
+        if self._error is None:
+            self._error = error
+
+    def _embed_worker(self, split_queue: queue.Queue, write_queue: queue.Queue, existing_ids: set):
+        while True:
+            item = split_queue.get()
+            if item is _DONE:
+                return
+            batch_no, future = item
+            try:
+                chunks: List[Document] = future.result()
+                batch_docs = {}
+                for doc in chunks:
+                    doc_id = chunk_id(doc)
+                    if doc_id not in existing_ids:
+                        batch_docs.setdefault(doc_id, doc)
+                ids, docs = list(batch_docs), list(batch_docs.values())
+                complete = True
+                try:
+                    vectors = self.embedding.embed_documents([doc.page_content for doc in docs]) if docs else []
+                except EmbeddingError as e:
+                    # write what was embedded; the batch stays unfinished so a rerun retries the rest
+                    logger.warning(f"Batch {batch_no}: {e}")
+                    embedded = [i for i, vector in enumerate(e.vectors) if vector is not None]
+                    ids = [ids[i] for i in embedded]
+                    docs = [docs[i] for i in embedded]
+                    vectors = [e.vectors[i] for i in embedded]
+                    complete = False
+                write_queue.put((batch_no, ids, docs, vectors, complete))
+            except BaseException as e:
+                self._fail(e)
+                write_queue.put((batch_no, None, None, None, False))
+
+    def _writer(self, write_queue: queue.Queue, collection, progress: ProgressReporter):
+        while True:
+            item = write_queue.get()
+            if item is _DONE:
+                return
+            batch_no, ids, docs, vectors, complete = item
+            if ids is None or self._error is not None:
+                continue
+            try:
+                for i in range(0, len(ids), self.write_batch_size):
+                    collection.upsert(
+                        ids=ids[i : i + self.write_batch_size],
+                        embeddings=vectors[i : i + self.write_batch_size],
+                        documents=[doc.page_content for doc in docs[i : i + self.write_batch_size]],
+                        metadatas=[doc.metadata for doc in docs[i : i + self.write_batch_size]],
+                    )
+                if complete:
+                    self.checkpoint.mark_done(batch_no, len(ids))
+                else:
+                    self._incomplete += 1
+                progress.update(len(ids))
+            except BaseException as e:
+                self._fail(e)
+
+    def run(self, resume: bool = True, prune: bool = False):
+        if resume:
+            self.checkpoint.load()
+        else:
+            self.checkpoint.clear()
+
+        total_batches = math.ceil(count_recipes(self.csv_path) / self.batch_size)
+        logger.info(f"Indexing {self.csv_path} in {total_batches} batches, "
+                    f"{len(self.checkpoint.completed)} already done")
+
+        vectordb = load_vectordb(self.persist_directory, self.embedding)
+        existing_ids = set(vectordb.get(include=[])["ids"])
+        progress = ProgressReporter(total_batches, len(self.checkpoint.completed))
+
+        split_queue = queue.Queue(maxsize=self.embed_workers * 2)
+        write_queue = queue.Queue(maxsize=self.embed_workers * 2)
+        embedders = [
+            threading.Thread(target=self._embed_worker, args=(split_queue, write_queue, existing_ids), daemon=True)
+            for _ in range(self.embed_workers)
+        ]
+        writer = threading.Thread(target=self._writer, args=(write_queue, vectordb._collection, progress), daemon=True)
+        for thread in embedders + [writer]:
+            thread.start()
+
+        with ProcessPoolExecutor(max_workers=self.split_workers) as split_pool:
+            for batch_no, docs in enumerate(iter_recipe_batches(self.csv_path, self.batch_size)):
+                if self._error is not None:
+                    break
+                if batch_no in self.checkpoint.completed:
+                    continue
+                future = split_pool.submit(split_documents, docs, self.chunk_size, self.chunk_overlap)
+                split_queue.put((batch_no, future))
+            for _ in embedders:
+                split_queue.put(_DONE)
+            for thread in embedders:
+                thread.join()
+        write_queue.put(_DONE)
+        writer.join()
+
+        if self._error is not None:
+            raise RuntimeError("Index build failed, rerun to resume from the last checkpoint") from self._error
+
+        progress.report(force=True)
+        if self._incomplete:
+            # keep the checkpoint: a rerun skips finished batches and the chunks already stored
+            logger.warning(f"Index build finished with {self._incomplete} batches not fully embedded, "
+                           f"rerun to retry them")
+            return vectordb
+        if prune:
+            self.prune(vectordb)
+        self.checkpoint.clear()
+        logger.info("Index build finished")
+        return vectordb
+
+    def prune(self, vectordb):
+        """
+        Delete chunks from the store that are no longer produced by the CSV.
+        """
+        wanted = set()
+        for chunks in iter_recipe_chunks(self.csv_path, self.batch_size, self.chunk_size, self.chunk_overlap):
+            wanted.update(chunk_id(doc) for doc in chunks)
+        removed_ids = list(set(vectordb.get(include=[])["ids"]) - wanted)
+        for i in range(0, len(removed_ids), self.write_batch_size):
+            vectordb.delete(ids=removed_ids[i : i + self.write_batch_size])
+        logger.info(f"Pruned {len(removed_ids)} stale chunks")
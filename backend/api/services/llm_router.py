@@ -0,0 +1,263 @@
+import asyncio
+import itertools
+import logging
+import os
+import threading
+import time
+from typing import Any, AsyncIterator, Callable, List
+
+import httpx
+from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
+from langchain_core.runnables import Runnable
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+eject_failures = int(os.getenv('LLM_EJECT_FAILURES', '3'))
+eject_seconds = float(os.getenv('LLM_EJECT_SECONDS', '30'))
+failover_attempts = int(os.getenv('LLM_FAILOVER_ATTEMPTS', '1'))
+
+
+def is_backend_failure(error: Exception) -> bool:
+    """
+    True for errors that say the server is down or broken (connection errors, timeouts, 5xx, embeddings
+    that failed for every text), False for errors caused by the request itself (4xx, some texts that could
+    not be embedded), which another server would answer the same way.
+    """
+    import requests
+    from openai import APIConnectionError
+    from .recipe_embedding_service import EmbeddingError
+
+    if isinstance(error, EmbeddingError):
+        return all(vector is None for vector in error.vectors)
+
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        status_code = getattr(getattr(error, "response", None), "status_code", None)
+    if status_code is not None:
+        return status_code >= 500
+    return isinstance(error, (APIConnectionError, httpx.TransportError, requests.ConnectionError,
+                              requests.Timeout, TimeoutError))
+
+
+class Backend:
+    """
+    One OpenAI-compatible server with its own client (and so its own connection pool).
+    """
+    def __init__(self, base_url: str, client):
+        self.base_url = base_url
+        self.client = client
+        self.outstanding = 0
+        self.failures = 0
+        self.ejected_until = 0.0
+        self.requests = 0
+        self.errors = 0
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self.ejected_until
+
+    def stats(self) -> dict:
+        return {
+            "base_url": self.base_url,
+            "available": self.available,
+            "outstanding": self.outstanding,
+            "requests": self.requests,
+            "errors": self.errors,
+            "consecutive_failures": self.failures,
+        }
+
+
+class BackendRouter:
+    """
+    Spreads requests over several OpenAI-compatible servers. Each request goes to the available backend
+    with the fewest outstanding requests (ties take turns); a request failing on a broken backend is retried
+    on another one (LLM_FAILOVER_ATTEMPTS). After LLM_EJECT_FAILURES consecutive failures of requests or
+    health checks a backend is ejected for LLM_EJECT_SECONDS, or until a health check succeeds again.
+    When every backend is ejected, the one coming back first is still used rather than failing outright.
+    """
+    def __init__(self, name: str, base_urls: List[str], make_client: Callable[[str], Any]):
+        if not base_urls:
+            raise ValueError(f"No {name} backend configured")
+        self.name = name
+        self.backends = [Backend(base_url, make_client(base_url)) for base_url in base_urls]
+        self._turn = itertools.count()
+        # sync calls run on worker threads, so the counters are updated under a lock
+        self._lock = threading.Lock()
+
+    def pick(self, exclude: List[Backend] = ()) -> Backend:
+        candidates = [backend for backend in self.backends if backend not in exclude] or self.backends
+        available = [backend for backend in candidates if backend.available]
+        if not available:
+            return min(candidates, key=lambda backend: backend.ejected_until)
+        fewest = min(backend.outstanding for backend in available)
+        tied = [backend for backend in available if backend.outstanding == fewest]
+        return tied[next(self._turn) % len(tied)]
+
+    def record_success(self, backend: Backend):
+        if backend.failures or not backend.available:
+            logger.info(f"{self.name} backend {backend.base_url} is back")
+        backend.failures = 0
+        backend.ejected_until = 0.0
+
+    def record_failure(self, backend: Backend, error):
+        backend.failures += 1
+        backend.errors += 1
+        if backend.failures >= eject_failures and backend.available:
+            backend.ejected_until = time.monotonic() + eject_seconds
+            logger.warning(f"Ejecting {self.name} backend {backend.base_url} for {eject_seconds}s "
+                           f"after {backend.failures} failures: {error}")
+
+    def _begin(self, exclude: List[Backend]) -> Backend:
+        with self._lock:
+            backend = self.pick(exclude=exclude)
+            backend.outstanding += 1
+            backend.requests += 1
+        return backend
+
+    def _end(self, backend: Backend):
+        with self._lock:
+            backend.outstanding -= 1
+
+    def _attempts(self) -> int:
+        return min(1 + failover_attempts, len(self.backends))
+
+    async def call(self, operation):
+        """
+        await operation(backend client) on the chosen backend, failing over to another one on backend failures.
+        """
+        tried = []
+        for attempt in range(self._attempts()):
+            backend = self._begin(tried)
+            tried.append(backend)
+            try:
+                result = await operation(backend.client)
+            except Exception as e:
+                if not is_backend_failure(e):
+                    raise
+                self.record_failure(backend, e)
+                if attempt + 1 == self._attempts():
+                    raise
+                logger.warning(f"{self.name} backend {backend.base_url} failed, retrying on another one: {e}")
+                continue
+            finally:
+                self._end(backend)
+            self.record_success(backend)
+            return result
+
+    def call_sync(self, operation):
+        tried = []
+        for attempt in range(self._attempts()):
+            backend = self._begin(tried)
+            tried.append(backend)
+            try:
+                result = operation(backend.client)
+            except Exception as e:
+                if not is_backend_failure(e):
+                    raise
+                self.record_failure(backend, e)
+                if attempt + 1 == self._attempts():
+                    raise
+                logger.warning(f"{self.name} backend {backend.base_url} failed, retrying on another one: {e}")
+                continue
+            finally:
+                self._end(backend)
+            self.record_success(backend)
+            return result
+
+    async def stream(self, operation) -> AsyncIterator:
+        """
+        Iterate operation(backend client); fails over only while nothing has been yielded yet.
+        """
+        tried = []
+        for attempt in range(self._attempts()):
+            backend = self._begin(tried)
+            tried.append(backend)
+            started = False
+            try:
+                async for item in operation(backend.client):
+                    started = True
+                    yield item
+            except Exception as e:
+                if not is_backend_failure(e):
+                    raise
+                self.record_failure(backend, e)
+                if started or attempt + 1 == self._attempts():
+                    raise
+                logger.warning(f"{self.name} backend {backend.base_url} failed, retrying on another one: {e}")
+                continue
+            finally:
+                self._end(backend)
+            self.record_success(backend)
+            return
+
+    async def _probe(self, client: httpx.AsyncClient, backend: Backend) -> dict:
+        try:
+            res = await client.get(f"{backend.base_url}/models")
+            res.raise_for_status()
+        except httpx.HTTPError as e:
+            self.record_failure(backend, e)
+            return {**backend.stats(), "ok": False, "detail": str(e) or type(e).__name__}
+        self.record_success(backend)
+        return {**backend.stats(), "ok": True}
+
+    async def check(self, client: httpx.AsyncClient) -> dict:
+        """
+        Probe every backend (a cheap /models request), ejecting or restoring them. ok when one of them is up.
+        """
+        backends = await asyncio.gather(*(self._probe(client, backend) for backend in self.backends))
+        return {"ok": any(backend["ok"] for backend in backends), "backends": backends}
+
+    def stats(self) -> List[dict]:
+        return [backend.stats() for backend in self.backends]
+
+
+class RoutedChatModel(Runnable):
+    """
+    Chat model that sends every call to a backend chosen by a BackendRouter of ChatOpenAI clients.
+    Supports bind (temperature, response_format, ...), ainvoke and astream like a single ChatOpenAI.
+    """
+    def __init__(self, router: BackendRouter):
+        self.router = router
+
+    def invoke(self, input, config=None, **kwargs):
+        return self.router.call_sync(lambda chat: chat.invoke(input, config, **kwargs))
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        return await self.router.call(lambda chat: chat.ainvoke(input, config, **kwargs))
+
+    async def astream(self, input, config=None, **kwargs):
+        async for chunk in self.router.stream(lambda chat: chat.astream(input, config, **kwargs)):
+            yield chunk
+
+
+class RoutedEmbeddings(Embeddings):
+    """
+    Embeddings sent to a backend chosen by a BackendRouter of LocalServerEmbeddings clients.
+    Those raise EmbeddingError instead of returning zero vectors, so a batch that failed entirely
+    counts as a backend failure (failover and ejection) while a partial failure is passed to the caller.
+    """
+    def __init__(self, router: BackendRouter):
+        self.router = router
+        self.model = router.backends[0].client.model
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.router.call_sync(lambda embeddings: embeddings.embed_documents(texts))
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await self.router.call(lambda embeddings: embeddings.aembed_documents(texts))
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.router.call_sync(lambda embeddings: embeddings.embed_query(text))
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await self.router.call(lambda embeddings: embeddings.aembed_query(text))
+
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        return await self.router.call(lambda embeddings: embeddings.aembed_queries(texts))
+
+    async def aclose(self):
+        for backend in self.router.backends:
+            await backend.client.aclose()
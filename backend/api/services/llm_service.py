@@ -0,0 +1,107 @@
+import asyncio
+import logging
+import os
+from typing import List
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+
+
+def parse_base_urls(value: str) -> List[str]:
+    return [url.strip().rstrip("/") for url in value.split(",") if url.strip()]
+
+
+llm_base_url = os.getenv('LLM_BASE_URL', 'http://127.0.0.1:1234/v1')
+# comma-separated OpenAI-compatible servers, requests are balanced over them
+llm_base_urls = parse_base_urls(os.getenv('LLM_BASE_URLS', llm_base_url))
+llm_max_concurrency = int(os.getenv('LLM_MAX_CONCURRENCY', '4'))    # per backend
+llm_max_queue = int(os.getenv('LLM_MAX_QUEUE', '256'))
+llm_queue_timeout = float(os.getenv('LLM_QUEUE_TIMEOUT', '300'))
+
+
+class LLMQueueFullError(Exception):
+    """
+    Raised when an LLM request cannot get a slot on the backend in time.
+    """
+
+
+class LLMLimiter:
+    """
+    Caps the number of concurrent requests sent to the LLM backends.
+    Callers beyond the cap wait in a bounded queue instead of piling up on the servers.
+    """
+    def __init__(self, max_concurrency: int, max_queue: int, queue_timeout: float):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.waiting = 0
+        self.in_flight = 0
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _acquire(self):
+        if self.waiting >= self.max_queue:
+            raise LLMQueueFullError(f"LLM queue is full ({self.waiting} requests waiting)")
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise LLMQueueFullError(f"Timed out after {self.queue_timeout}s waiting for an LLM slot")
+        finally:
+            self.waiting -= 1
+        self.in_flight += 1
+
+    def _release(self):
+        self.in_flight -= 1
+        self._semaphore.release()
+
+    async def ainvoke(self, llm, messages, **kwargs):
+        """
+        Run llm.ainvoke once a backend slot is free.
+        """
+        await self._acquire()
+        try:
+            return await llm.ainvoke(messages, **kwargs)
+        finally:
+            self._release()
+
+    async def astream(self, llm, messages, **kwargs):
+        """
+        Stream llm.astream chunks, holding a backend slot until the stream ends.
+        """
+        await self._acquire()
+        try:
+            async for chunk in llm.astream(messages, **kwargs):
+                yield chunk
+        finally:
+            self._release()
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "max_queue": self.max_queue,
+        }
+
+
+async def gather_or_cancel(*coroutines) -> list:
+    """
+    asyncio.gather that cancels the remaining requests as soon as one of them raises.
+    """
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+
+# LLM_MAX_CONCURRENCY slots for each of the LLM_BASE_URLS servers, so adding a server adds capacity;
+# the router sends each request to the server with the fewest in flight
+llm_limiter = LLMLimiter(llm_max_concurrency * len(llm_base_urls), llm_max_queue, llm_queue_timeout)
@@ -1,4 +1,20 @@
+import json
+import logging
 import re
+from typing import List
+
+from pydantic import BaseModel, Field, ValidationError, field_validator
+
+from models.meal_plan import MealPlan
+from models.meal_plan_item import MealPlanItem
+
+logger = logging.getLogger(__name__)
+
+# lengths of the columns plans are stored in; longer values would fail the insert on Postgres
+NAME_MAX_CHARS = MealPlan.__table__.c.name.type.length
+DESCRIPTION_MAX_CHARS = MealPlan.__table__.c.description.type.length
+MEAL_MAX_CHARS = MealPlanItem.__table__.c.breakfast.type.length
+MACROS_MAX_CHARS = MealPlanItem.__table__.c.macros.type.length
 
 def strip_json_prefix(text: str) -> str:
     return re.sub(r'^\s*(?:```json\s*|json\s*:?)[\r\n]*', '', text, flags=re.IGNORECASE)
@@ -13,4 +29,462 @@ def strip_json_suffix(text: str) -> str:
     if last_json_end_index != -1:
         return text[:last_json_end_index + 1]
     else:
-        return text
\ No newline at end of file
+        return text
+
+def extract_plan_header(text: str) -> dict:
+    """
+    Pull the top-level name and description out of a (possibly incomplete) plan JSON.
+    """
+    header = {}
+    for key in ("name", "description"):
+        match = re.search(r'"' + key + r'"\s*:\s*"((?:[^"\\]|\\.)*)"', text)
+        if match:
+            header[key] = json.loads('"' + match.group(1) + '"')
+    return bound_header(header)
+
+
+def bound_header(header: dict) -> dict:
+    """
+    Cut the plan name and description to their columns.
+    """
+    bounded = dict(header)
+    for key, max_chars in (("name", NAME_MAX_CHARS), ("description", DESCRIPTION_MAX_CHARS)):
+        if isinstance(bounded.get(key), str):
+            bounded[key] = bounded[key][:max_chars]
+    return bounded
+
+
+class IncrementalPlanParser:
+    """
+    Incremental parser for a streamed meal plan completion.
+    Feed it text chunks as they arrive and it returns every day object of the
+    "plan" array as soon as its closing brace has been seen. Each chunk is scanned once;
+    only the text of the day being read is kept together.
+    """
+    def __init__(self):
+        self._chunks = []
+        self._stack = []
+        self._in_string = False
+        self._escaped = False
+        self._object_parts = None
+
+    @property
+    def text(self) -> str:
+        return "".join(self._chunks)
+
+    def feed(self, chunk: str) -> list:
+        self._chunks.append(chunk)
+        days = []
+        # where the text of the open day object starts in this chunk
+        object_start = 0 if self._object_parts is not None else None
+        for i, char in enumerate(chunk):
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"' and self._stack:
+                self._in_string = True
+            elif char in "{[":
+                if char == "{" and self._stack == ["{", "["]:
+                    self._object_parts = []
+                    object_start = i
+                self._stack.append(char)
+            elif char in "}]" and self._stack:
+                self._stack.pop()
+                if char == "}" and self._stack == ["{", "["] and self._object_parts is not None:
+                    try:
+                        day = json.loads("".join(self._object_parts) + chunk[object_start:i + 1])
+                    except json.JSONDecodeError:
+                        day = None
+                    if isinstance(day, dict) and "meal_slot" in day:
+                        days.append(day)
+                    self._object_parts = None
+                    object_start = None
+        if self._object_parts is not None:
+            self._object_parts.append(chunk[object_start:])
+        return days
+
+
+MACRO_NAMES = {
+    "calories": r"calories|calorie|kcal|cal|energy",
+    "protein": r"proteins?",
+    "carbs": r"carbohydrates?|carbs?",
+    "fat": r"fats?",
+}
+# percentages ("Protein: 30%") are not amounts
+_NUMBER = r"(\d[\d,]*(?:\.\d+)?)(?:\s*(?:-|–|to)\s*(\d[\d,]*(?:\.\d+)?))?(?![\d,.]*\s*%)"
+
+
+def _macro_value(match) -> float:
+    low = float(match.group(1).replace(",", ""))
+    high = match.group(2)
+    # ranges like "60-70g" are stored as their midpoint
+    return (low + float(high.replace(",", ""))) / 2 if high else low
+
+
+def parse_macros(text) -> dict:
+    """
+    Numeric calories / protein (g) / carbs (g) / fat (g) out of the free-form macros string of a day,
+    e.g. "Carbs: 200g, Protein: 90g, Fats: 60g, Calories: 1800 kcal". Missing values are None.
+    """
+    macros = dict.fromkeys(MACRO_NAMES)
+    if not text:
+        return macros
+    if isinstance(text, dict):
+        text = ", ".join(f"{key}: {value}" for key, value in text.items())
+    text = str(text)
+    for key, names in MACRO_NAMES.items():
+        # "Protein: ~90g" / "protein 90 g" or "90g protein" / "1800 kcal"
+        match = re.search(rf"\b(?:{names})\b\s*(?:\([^)]*\))?\s*[:=]?\s*(?:~|about|approx\.?)?\s*{_NUMBER}", text,
+                          flags=re.IGNORECASE)
+        if match is None:
+            match = re.search(rf"{_NUMBER}\s*(?:g|grams?|kcal)?\s*(?:of\s+)?(?:{names})\b", text, flags=re.IGNORECASE)
+        if match is not None:
+            macros[key] = _macro_value(match)
+    return macros
+
+
+WEEK_DAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+MEAL_FIELDS = ("breakfast", "lunch", "dinner", "snack")
+
+
+class MealPlanFormatError(ValueError):
+    """
+    Raised when an LLM response cannot be turned into a valid meal plan.
+    """
+
+
+class MealPlanDay(BaseModel):
+    # meal_slot is normalized to its weekday, so only the stored fields are bounded;
+    # over-long days fail validation and are regenerated like any other invalid day
+    meal_slot: str = Field(min_length=1)
+    breakfast: str = Field(min_length=1, max_length=MEAL_MAX_CHARS)
+    lunch: str = Field(min_length=1, max_length=MEAL_MAX_CHARS)
+    dinner: str = Field(min_length=1, max_length=MEAL_MAX_CHARS)
+    snack: str = Field(min_length=1, max_length=MEAL_MAX_CHARS)
+    macros: str = Field(min_length=1, max_length=MACROS_MAX_CHARS)
+
+    @field_validator(*MEAL_FIELDS, mode="before")
+    @classmethod
+    def _join_meals(cls, value):
+        # "snack": ["apple", "almonds"]
+        if isinstance(value, list):
+            return ", ".join(str(item) for item in value)
+        return value
+
+    @field_validator("macros", mode="before")
+    @classmethod
+    def _macros_to_text(cls, value):
+        # "macros": {"carbs": "200g", ...} or a bare number of calories
+        if isinstance(value, dict):
+            return ", ".join(f"{key}: {item}" for key, item in value.items())
+        if isinstance(value, (int, float)):
+            return f"Calories: {value}"
+        return value
+
+
+class MealPlanSchema(BaseModel):
+    name: str = Field(max_length=NAME_MAX_CHARS)
+    description: str = Field(max_length=DESCRIPTION_MAX_CHARS)
+    plan: List[MealPlanDay]
+
+
+MEAL_PLAN_JSON_SCHEMA = MealPlanSchema.model_json_schema()
+
+
+class MealPlanOutline(BaseModel):
+    name: str = "Weekly Meal Plan"
+    description: str = ""
+    days: dict[str, str] = {}
+
+    @field_validator("days", mode="before")
+    @classmethod
+    def _days_to_dict(cls, value):
+        # "days": [{"meal_slot": "Monday", "theme": "..."}, ...]
+        if isinstance(value, list):
+            return {
+                str(item.get("meal_slot", "")): str(item.get("theme", ""))
+                for item in value if isinstance(item, dict)
+            }
+        return value
+
+
+MEAL_PLAN_OUTLINE_JSON_SCHEMA = MealPlanOutline.model_json_schema()
+
+_LITERALS = {"true": "true", "false": "false", "null": "null", "True": "true", "False": "false", "None": "null"}
+_NUMBER_TOKEN = re.compile(r"-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?")
+_CLOSERS = {"{": "}", "[": "]"}
+
+
+def _next_significant(text: str, i: int):
+    """
+    (index, saw_newline) of the first non-whitespace character at or after i.
+    """
+    newline = False
+    while i < len(text) and text[i] in " \t\r\n":
+        newline = newline or text[i] == "\n"
+        i += 1
+    return i, newline
+
+
+def repair_json(text: str) -> str:
+    """
+    Turn the first JSON object of an LLM response into valid JSON in a single pass.
+    Repairs the usual defects: prose or code fences around the object, trailing and missing commas,
+    single-quoted or unescaped strings, bare words (str, True, None), comments and a truncated end.
+    Raises MealPlanFormatError when the response contains no object at all.
+    """
+    start = text.find("{")
+    if start == -1:
+        raise MealPlanFormatError("LLM response does not contain a JSON object")
+
+    out = []
+    stack = []
+    # what the innermost container expects next: key, colon, value or after (a value just ended)
+    expect = "key"
+    pending_comma = False
+    i = start
+    n = len(text)
+
+    def begin_token():
+        # called before a key, value or container is written
+        nonlocal pending_comma, expect
+        if expect == "after":
+            pending_comma = True
+            expect = "key" if stack[-1] == "{" else "value"
+        if pending_comma:
+            out.append(",")
+            pending_comma = False
+        if expect == "colon":
+            out.append(":")
+            expect = "value"
+
+    def end_value():
+        nonlocal expect
+        expect = "after"
+
+    while i < n:
+        char = text[i]
+
+        if char in "\"'":
+            quote = char
+            begin_token()
+            is_key = expect == "key"
+            out.append('"')
+            i += 1
+            while i < n:
+                char = text[i]
+                if char == "\\" and i + 1 < n:
+                    escaped = text[i + 1]
+                    if escaped == "'" and quote == "'":
+                        out.append("'")
+                    elif escaped in '"\\/bfnrtu':
+                        out.append(char + escaped)
+                    else:
+                        out.append("\\\\" + escaped)
+                    i += 2
+                    continue
+                if char == quote:
+                    after, newline = _next_significant(text, i + 1)
+                    # a quote followed by text on the same line is part of the string (5" pancakes, it's),
+                    # one followed by another string is a missing comma
+                    if (after >= n or text[after] in ",:}]" or newline
+                            or (text[after] in "\"'" and after > i + 1)):
+                        break
+                    out.append('\\"' if quote == '"' else "'")
+                elif char == '"':
+                    out.append('\\"')
+                elif char == "\n":
+                    out.append("\\n")
+                elif char == "\t":
+                    out.append("\\t")
+                elif ord(char) < 0x20:
+                    out.append(f"\\u{ord(char):04x}")
+                else:
+                    out.append(char)
+                i += 1
+            out.append('"')
+            i += 1
+            expect = "colon" if is_key else "after"
+            continue
+
+        if char in " \t\r\n":
+            out.append(char)
+        elif char in "{[":
+            begin_token()
+            out.append(char)
+            stack.append(char)
+            expect = "key" if char == "{" else "value"
+        elif char in "}]":
+            if char in (_CLOSERS[opener] for opener in stack):
+                pending_comma = False  # trailing comma
+                if expect == "value" and stack[-1] == "{":
+                    out.append("null")
+                elif expect == "colon":
+                    out.append(":null")
+                while stack:
+                    opener = stack.pop()
+                    out.append(_CLOSERS[opener])
+                    if _CLOSERS[opener] == char:
+                        break
+                end_value()
+                if not stack:
+                    break
+        elif char == ",":
+            if expect == "after":
+                pending_comma = True
+                expect = "key" if stack[-1] == "{" else "value"
+        elif char == ":":
+            if expect == "colon":
+                out.append(":")
+                expect = "value"
+        elif char == "/" and text.startswith("//", i):
+            newline = text.find("\n", i)
+            i = n if newline == -1 else newline
+            continue
+        elif char == "/" and text.startswith("/*", i):
+            end = text.find("*/", i + 2)
+            i = n if end == -1 else end + 2
+            continue
+        elif char.isalnum() or char in "-_.+":
+            end = i
+            while end < n and (text[end].isalnum() or text[end] in "-_.+"):
+                end += 1
+            word = text[i:end]
+            begin_token()
+            if expect == "key":
+                out.append(json.dumps(word))
+                expect = "colon"
+            else:
+                if word in _LITERALS:
+                    out.append(_LITERALS[word])
+                elif _NUMBER_TOKEN.fullmatch(word):
+                    out.append(word)
+                else:
+                    out.append(json.dumps(word))
+                end_value()
+            i = end
+            continue
+        # anything else outside a string (stray backticks, prose between values) is dropped
+        i += 1
+
+    if stack:
+        # truncated response: close whatever is still open
+        if expect == "colon":
+            out.append(":null")
+        elif expect == "value" and stack[-1] == "{":
+            out.append("null")
+        out.extend(_CLOSERS[opener] for opener in reversed(stack))
+    return "".join(out)
+
+
+def load_json_object(text: str):
+    repaired = repair_json(text)
+    try:
+        return json.loads(repaired)
+    except json.JSONDecodeError as e:
+        raise MealPlanFormatError(f"LLM response is not repairable JSON: {e}") from e
+
+
+def _weekday(meal_slot: str) -> str | None:
+    slot = meal_slot.lower()
+    for day in WEEK_DAYS:
+        if day.lower() in slot or slot.strip() == day[:3].lower():
+            return day
+    return None
+
+
+def validate_meal_plan_day(raw_day, fallback_weekday: str | None = None) -> dict | None:
+    """
+    Schema-valid, normalized day dict, or None when raw_day fails validation or has no recognizable weekday
+    (fallback_weekday is used when its meal_slot names none).
+    """
+    try:
+        day = MealPlanDay.model_validate(raw_day)
+    except ValidationError as e:
+        logger.warning(f"Invalid meal plan day {fallback_weekday or ''}: {e.error_count()} errors")
+        return None
+    weekday = _weekday(day.meal_slot) or fallback_weekday
+    if weekday is None:
+        return None
+    return {**day.model_dump(), "meal_slot": weekday}
+
+
+def is_complete_meal_plan(plan) -> bool:
+    """
+    True when plan passes MealPlanSchema with one valid day per weekday, in week order.
+    """
+    try:
+        parsed = MealPlanSchema.model_validate(plan)
+    except ValidationError:
+        return False
+    return [_weekday(day.meal_slot) for day in parsed.plan] == WEEK_DAYS
+
+
+def parse_meal_plan(text: str, wanted_days: List[str] = WEEK_DAYS):
+    """
+    Parse an LLM meal plan response into (header, days): header holds the name and description,
+    days maps each weekday of wanted_days that has a schema-valid entry to its normalized day dict.
+    Invalid or missing days are simply absent, so the caller can regenerate just those.
+    """
+    data = load_json_object(text)
+    header = bound_header({key: data[key] for key in ("name", "description") if isinstance(data.get(key), str)})
+    raw_days = data.get("plan")
+    if isinstance(raw_days, dict):
+        raw_days = [raw_days]
+    if not isinstance(raw_days, list):
+        raw_days = []
+
+    days = {}
+    for position, raw_day in enumerate(raw_days):
+        # days without a recognizable weekday are taken in the order they were asked for
+        day = validate_meal_plan_day(raw_day, wanted_days[position] if position < len(wanted_days) else None)
+        if day is not None and day["meal_slot"] in wanted_days and day["meal_slot"] not in days:
+            days[day["meal_slot"]] = day
+    return header, days
+
+
+def parse_meal_plan_outline(text: str) -> dict:
+    """
+    Parse an outline response into {"name", "description", "days": weekday -> theme}.
+    Unrecognized weekdays are dropped.
+    """
+    data = load_json_object(text)
+    try:
+        outline = MealPlanOutline.model_validate(data)
+    except ValidationError as e:
+        raise MealPlanFormatError(f"Invalid meal plan outline: {e.error_count()} errors") from e
+
+    days = {}
+    for meal_slot, theme in outline.days.items():
+        weekday = _weekday(meal_slot)
+        if weekday is not None and theme:
+            days.setdefault(weekday, theme)
+    return {**bound_header({"name": outline.name, "description": outline.description}), "days": days}
+
+
+def _meal_key(meal: str) -> str:
+    return " ".join(re.sub(r"[^\w\s]", " ", meal.lower()).split())
+
+
+def repeated_meal_days(days: dict, fields=("breakfast", "lunch", "dinner")) -> List[str]:
+    """
+    Weekdays of days (weekday -> day dict), in week order, that serve a breakfast, lunch or dinner
+    already served on an earlier day. Meals are compared case and punctuation insensitively; snacks may repeat.
+    """
+    seen = set()
+    repeated = []
+    for weekday in WEEK_DAYS:
+        if days.get(weekday) is None:
+            continue
+        meals = {_meal_key(days[weekday][field]) for field in fields}
+        if meals & seen:
+            repeated.append(weekday)
+        else:
+            seen |= meals
+    return repeated
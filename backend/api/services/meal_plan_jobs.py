@@ -0,0 +1,270 @@
+import asyncio
+import json
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta
+
+from sqlalchemy import func, select, update
+
+from data.database import create_async_session
+from models.meal_plan_job import MealPlanJob
+from models.user import User
+
+logger = logging.getLogger(__name__)
+
+job_workers = int(os.getenv('MEAL_PLAN_JOB_WORKERS', '4'))
+# a running job not updated for this long is taken to have lost its worker (a crash or restart)
+job_stale_seconds = float(os.getenv('MEAL_PLAN_JOB_STALE_SECONDS', '1800'))
+# upper bound on the parameters of an IN clause
+LOOKUP_CHUNK = 500
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class MealPlanJobQueue:
+    """
+    In-process worker pool for meal plan generation.
+    Jobs are persisted in the meal_plan_jobs table so their status survives restarts, and unfinished jobs
+    are picked up again when the queue starts. Every uvicorn worker runs its own queue: a job is claimed
+    with a conditional update before it runs, so it runs once even when several queues hold it, and only
+    running jobs idle for MEAL_PLAN_JOB_STALE_SECONDS are taken back from their (lost) worker.
+    Batches (submit_batch) get one job per user and are run batch_size users at a time by a single worker.
+    """
+    def __init__(self, handler, batch_handler=None, num_workers: int = job_workers, batch_size: int = 32,
+                 stale_seconds: float = job_stale_seconds):
+        # handler: async (db_session, user_id, use_cache, mode) -> dict
+        # batch_handler: async (db_session, user_ids, use_cache) -> {"regenerated": {user_id: plan}, "failed": {user_id: error}}
+        self.handler = handler
+        self.batch_handler = batch_handler
+        self.num_workers = num_workers
+        self.batch_size = batch_size
+        self.stale_seconds = stale_seconds
+        self._queue: asyncio.Queue | None = None
+        self._workers: list[asyncio.Task] = []
+        self._submit_lock = asyncio.Lock()
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        db_session = await create_async_session()
+        try:
+            stale = await db_session.execute(
+                update(MealPlanJob)
+                .where(MealPlanJob.status == RUNNING,
+                       MealPlanJob.updated_at < datetime.now() - timedelta(seconds=self.stale_seconds))
+                .values(status=PENDING, updated_at=datetime.now())
+                .execution_options(synchronize_session=False)
+            )
+            await db_session.commit()
+            pending = (await db_session.scalars(
+                select(MealPlanJob.id)
+                .where(MealPlanJob.status == PENDING)
+                .order_by(MealPlanJob.created_at)
+            )).all()
+        finally:
+            await db_session.close()
+
+        # jobs of an interrupted batch are run one by one
+        for job_id in pending:
+            self._queue.put_nowait(job_id)
+        if pending:
+            logger.info(f"Queued {len(pending)} unfinished meal plan jobs ({stale.rowcount} stale running jobs reset)")
+
+        self._workers = [asyncio.create_task(self._work()) for _ in range(self.num_workers)]
+
+    async def stop(self):
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    async def submit(self, db_session, user_id: str, use_cache: bool = True, mode: str | None = None) -> MealPlanJob:
+        """
+        Queue a generation for the user, or return the job already pending for them.
+        """
+        async with self._submit_lock:
+            job = await db_session.scalar(
+                select(MealPlanJob)
+                .where(MealPlanJob.user_id == user_id, MealPlanJob.status.in_([PENDING, RUNNING]))
+            )
+            if job is not None:
+                logger.info(f"Merged meal plan request for user_id {user_id} into job {job.id}")
+                return job
+
+            job = MealPlanJob(str(uuid.uuid4()), user_id, PENDING, datetime.now())
+            job.use_cache = use_cache
+            job.mode = mode
+            db_session.add(job)
+            await db_session.commit()
+
+        self._queue.put_nowait(job.id)
+        logger.info(f"Queued meal plan job {job.id} for user_id {user_id}")
+        return job
+
+    async def submit_batch(self, db_session, user_ids: list[str], use_cache: bool = True) -> dict:
+        """
+        Queue the regeneration of many users as one batch, polled with batch_status.
+        Unknown users and users that already have a pending job are skipped.
+        """
+        user_ids = list(dict.fromkeys(user_ids))
+        batch_id = str(uuid.uuid4())
+        skipped = {}
+        async with self._submit_lock:
+            known, busy = set(), set()
+            for start in range(0, len(user_ids), LOOKUP_CHUNK):
+                chunk = user_ids[start : start + LOOKUP_CHUNK]
+                known.update(await db_session.scalars(select(User.id).where(User.id.in_(chunk))))
+                busy.update(await db_session.scalars(
+                    select(MealPlanJob.user_id)
+                    .where(MealPlanJob.user_id.in_(chunk), MealPlanJob.status.in_([PENDING, RUNNING]))
+                ))
+
+            now = datetime.now()
+            queued = 0
+            for user_id in user_ids:
+                if user_id not in known:
+                    skipped[user_id] = "User not found"
+                elif user_id in busy:
+                    skipped[user_id] = "Already queued"
+                else:
+                    job = MealPlanJob(str(uuid.uuid4()), user_id, PENDING, now)
+                    job.batch_id = batch_id
+                    job.use_cache = use_cache
+                    db_session.add(job)
+                    queued += 1
+            await db_session.commit()
+
+        if queued:
+            self._queue.put_nowait(("batch", batch_id))
+        logger.info(f"Queued meal plan batch {batch_id} with {queued} users ({len(skipped)} skipped)")
+        return {"batch_id": batch_id, "queued": queued, "skipped": skipped}
+
+    async def _work(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                if isinstance(job_id, tuple):
+                    await self._run_batch(job_id[1])
+                else:
+                    await self._run(job_id)
+            except Exception:
+                logger.exception(f"Meal plan job {job_id} crashed")
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str):
+        db_session = await create_async_session()
+        try:
+            if not await claim_job(db_session, job_id):
+                return
+            job = await db_session.get(MealPlanJob, job_id)
+
+            try:
+                result = await self.handler(db_session, job.user_id, job.use_cache is not False, job.mode)
+            except Exception as e:
+                await db_session.rollback()
+                logger.exception(f"Meal plan job {job_id} failed")
+                job = await db_session.get(MealPlanJob, job_id)
+                job.status = FAILED
+                job.error = str(e)[:512]
+            else:
+                job.status = DONE
+                job.result = json.dumps(result)
+            job.updated_at = datetime.now()
+            await db_session.commit()
+        finally:
+            await db_session.close()
+
+    async def _run_batch(self, batch_id: str):
+        db_session = await create_async_session()
+        try:
+            while True:
+                jobs = (await db_session.scalars(
+                    select(MealPlanJob)
+                    .where(MealPlanJob.batch_id == batch_id, MealPlanJob.status == PENDING)
+                    .order_by(MealPlanJob.id)
+                    .limit(self.batch_size)
+                )).all()
+                if not jobs:
+                    return
+                use_cache = jobs[0].use_cache is not False
+                claimed = [job for job in jobs if await claim_job(db_session, job.id, commit=False)]
+                await db_session.commit()
+                if not claimed:
+                    continue
+                job_ids = [job.id for job in claimed]
+                user_ids = [job.user_id for job in claimed]
+
+                try:
+                    outcome = await self.batch_handler(db_session, user_ids, use_cache)
+                except Exception as e:
+                    await db_session.rollback()
+                    logger.exception(f"Meal plan batch {batch_id} failed")
+                    outcome = {"regenerated": {}, "failed": {user_id: str(e) for user_id in user_ids}}
+
+                jobs = (await db_session.scalars(select(MealPlanJob).where(MealPlanJob.id.in_(job_ids)))).all()
+                for job in jobs:
+                    if job.user_id in outcome["regenerated"]:
+                        job.status = DONE
+                        job.result = json.dumps(outcome["regenerated"][job.user_id])
+                    else:
+                        job.status = FAILED
+                        job.error = outcome["failed"].get(job.user_id, "Not regenerated")[:512]
+                    job.updated_at = datetime.now()
+                await db_session.commit()
+        finally:
+            await db_session.close()
+
+
+async def claim_job(db_session, job_id: str, commit: bool = True) -> bool:
+    """
+    Mark a pending job running, in one conditional update; False when another worker claimed it first.
+    """
+    result = await db_session.execute(
+        update(MealPlanJob)
+        .where(MealPlanJob.id == job_id, MealPlanJob.status == PENDING)
+        .values(status=RUNNING, updated_at=datetime.now())
+        .execution_options(synchronize_session=False)
+    )
+    if commit:
+        await db_session.commit()
+    return result.rowcount == 1
+
+
+async def batch_status(db_session, batch_id: str) -> dict | None:
+    """
+    Job counts per status of a batch and the errors of its failed users, or None for an unknown batch.
+    """
+    counts = dict((await db_session.execute(
+        select(MealPlanJob.status, func.count())
+        .where(MealPlanJob.batch_id == batch_id)
+        .group_by(MealPlanJob.status)
+    )).all())
+    if not counts:
+        return None
+    failed = (await db_session.execute(
+        select(MealPlanJob.user_id, MealPlanJob.error)
+        .where(MealPlanJob.batch_id == batch_id, MealPlanJob.status == FAILED)
+    )).all()
+    return {
+        "batch_id": batch_id,
+        "total": sum(counts.values()),
+        **{status: counts.get(status, 0) for status in (PENDING, RUNNING, DONE, FAILED)},
+        "failed_users": dict(failed),
+    }
+
+
+def job_to_dict(job: MealPlanJob) -> dict:
+    return {
+        "job_id": job.id,
+        "batch_id": job.batch_id,
+        "user_id": job.user_id,
+        "status": job.status,
+        "error": job.error,
+        "created_at": str(job.created_at),
+        "updated_at": str(job.updated_at),
+        "result": json.loads(job.result) if job.result else None,
+    }
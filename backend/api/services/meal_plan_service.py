@@ -0,0 +1,649 @@
+import asyncio
+import copy
+import logging
+import os
+from datetime import date
+from typing import TYPE_CHECKING, List
+
+from dotenv import load_dotenv
+from sqlalchemy import delete, insert, select
+from sqlalchemy.orm import joinedload
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.meal_plan import MealPlan
+from models.meal_plan_item import MealPlanItem
+from models.user import User
+from models.health_report import HealthReport
+from .meal_plan_formatter import (
+    extract_plan_header, IncrementalPlanParser, parse_macros, parse_meal_plan, parse_meal_plan_outline,
+    repeated_meal_days, validate_meal_plan_day, is_complete_meal_plan, MealPlanFormatError, MEAL_PLAN_JSON_SCHEMA, MEAL_PLAN_OUTLINE_JSON_SCHEMA, WEEK_DAYS,
+)
+from .llm_service import llm_limiter, gather_or_cancel
+from .prompt_templates import PromptTemplate, with_instructions
+from .report_summary_service import bound_summary
+from .plan_cache import plan_cache, plan_cache_key, latest_plan_cache
+from .meal_plan_versions import add_meal_plan_versions, get_meal_plan_version
+
+if TYPE_CHECKING:
+    from langchain_core.messages import BaseMessage
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+regenerate_batch_size = int(os.getenv('MEAL_PLAN_BATCH_SIZE', '32'))
+repair_attempts = int(os.getenv('MEAL_PLAN_REPAIR_ATTEMPTS', '2'))
+llm_json_mode = os.getenv('LLM_JSON_MODE', 'json_schema')    # json_schema, json_object or off
+_json_mode_rejected = False
+# single: the whole week in one request; outline: a short outline first, then one request per day in parallel
+GENERATION_MODES = ("single", "outline")
+generation_mode = os.getenv('MEAL_PLAN_GENERATION_MODE', 'single')
+day_concurrency = int(os.getenv('MEAL_PLAN_DAY_CONCURRENCY', '7'))
+outline_max_tokens = int(os.getenv('MEAL_PLAN_OUTLINE_MAX_TOKENS', '400'))
+recipe_token_budget = int(os.getenv('PROMPT_RECIPE_TOKEN_BUDGET', '600'))
+
+
+class UserNotFoundError(LookupError):
+    """
+    Raised when a meal plan is requested for a user that does not exist.
+    """
+
+
+async def load_prompt_inputs(db_session: AsyncSession, user_id: str):
+    """
+    Fetch the user profile and health report text the meal plan prompt is built from.
+    """
+    user = await db_session.scalar(select(User).where(User.id == user_id))
+    if user is None:
+        raise UserNotFoundError(f"User {user_id} not found")
+
+    health_report = await db_session.scalar(select(HealthReport).where(HealthReport.user_id == user_id))
+    health_report_text = None
+    if health_report is None:
+        health_report_text = "None"
+    else:
+        health_report_text = health_report.report_text
+
+    return user, health_report_text
+
+
+async def load_prompt_inputs_many(db_session: AsyncSession, user_ids: List[str]) -> dict:
+    """
+    load_prompt_inputs for many users in two queries: user id -> (user, health report text).
+    Unknown user ids are left out.
+    """
+    users = (await db_session.scalars(select(User).where(User.id.in_(user_ids)))).all()
+    reports = {}
+    for report in (await db_session.scalars(select(HealthReport).where(HealthReport.user_id.in_(user_ids)))).all():
+        reports.setdefault(report.user_id, report.report_text)
+    return {user.id: (user, reports.get(user.id, "None")) for user in users}
+
+
+MEAL_PLAN_SYSTEM_PROMPT = """You are a helpful assistant specialized in nutrition.
+Make a personalized meal plan for every day of the week that includes on each day breakfast, lunch, dinner and a snack
+for the user described in the next message.
+Response Format:
+Provide a JSON that contains 3 objects, the last one being a list of JSON objects in the following format:
+name: (string) The name of the weekly meal plan.
+description: (string) A very short and concise description of the weekly plan.
+plan: (dict) A JSON that contains the following objects:
+    meal_slot: (string) The week day (e.g. Monday)
+    breakfast: (string) The name of the meal for breakfast
+    lunch: (string) The name of the meal for lunch
+    dinner: (string) The name of the meal for dinner
+    snack: (string) The name of the snack meal
+    macros: (string) An estimate of the total macros (carbohydrates, protein, fats and calories) computed from all the meals of that day
+
+
+Example:
+User Information:
+Weight: 90
+Height: 180
+BMI: 27.8
+Gender: Male
+Fitness Goal: Lose weight
+Activity Level: sedentary
+Dietary Preferences: vegan
+Medical Conditions: diabetes
+Medical History: previous diagnosis of mild anemia, recent MRI showing slight brain white matter changes
+The response should have the following json format, and only respond like it. All responses should be in valid json format.
+{
+    "name": str
+    "description": str
+    "plan": [
+    {
+        "meal_slot": "str",
+        "breakfast": "str",
+        "lunch": "str",
+        "dinner": "str",
+        "snack": "str",
+        "macros": "str",
+    },
+    ]
+}
+Remember to respond always with a plan that has 7 items (one unique plan for each day of the week) in the order of the week days!
+Remember to respond always with a valid JSON format!
+"""
+
+MEAL_PLAN_PROMPT = PromptTemplate(
+    system=MEAL_PLAN_SYSTEM_PROMPT,
+    sections=[
+        ("user", """User Information:
+Weight (in Kg): {weight}
+Height (in cm): {height}
+Age: {age}
+BMI: {bmi}
+Gender: {sex}
+Fitness Goal: {fitness_goal}
+Activity Level: {activity_level}
+Dietary Preferences: {dietary_preferences}
+Medical Conditions: {medical_conditions}
+"""),
+        ("health_report", """
+Medical History (can be empty): {health_report}
+"""),
+        ("recipes", """Recipe Suggestions (real recipes that match the user's diet, prefer them when they fit):
+{recipes}
+"""),
+    ],
+    optional=("recipes",),
+    budgets={"recipes": recipe_token_budget},
+)
+
+
+def build_meal_plan_prompt(user: User, health_report_text: str | None,
+                           recipe_context: str | None = None) -> List["BaseMessage"]:
+    messages, tokens = MEAL_PLAN_PROMPT.render(
+        weight=user.weight,
+        height=user.height,
+        age=user.age,
+        bmi=round(user.bmi, 1) if user.bmi is not None else None,
+        sex=user.sex,
+        fitness_goal=user.fitness_goal,
+        activity_level=user.activity_level,
+        dietary_preferences=user.dietary_preferences,
+        medical_conditions=user.medical_conditions,
+        # cut like the stored summaries, to the report_text column (only older or imported reports are longer)
+        health_report=bound_summary(health_report_text) if health_report_text else health_report_text,
+        recipes=recipe_context,
+    )
+    logger.debug(f"Meal plan prompt tokens for user_id {user.id}: {tokens}")
+    return messages
+
+
+def build_missing_days_prompt(prompt: List["BaseMessage"], days: List[str]) -> List["BaseMessage"]:
+    return with_instructions(prompt, f"""
+The plan for the other days is already done. Respond with the same JSON format, but the "plan" list must contain
+only these days, in this order: {", ".join(days)}
+""")
+
+
+def build_outline_prompt(prompt: List["BaseMessage"]) -> List["BaseMessage"]:
+    return with_instructions(prompt, """
+Before writing the plan, only outline it. Respond with a JSON that contains 3 objects:
+name: (string) The name of the weekly meal plan.
+description: (string) A very short and concise description of the weekly plan.
+days: (dict) For every week day (e.g. "Monday"), a short theme for that day (cuisine, main protein or focus).
+Give every day a different theme, so that no meal is repeated during the week.
+""")
+
+
+def build_day_prompt(prompt: List["BaseMessage"], outline: dict, day: str,
+                     avoid_meals: List[str] = ()) -> List["BaseMessage"]:
+    day_prompt = build_missing_days_prompt(prompt, [day])
+    if outline["days"]:
+        themes = "\n".join(f"{weekday}: {theme}" for weekday, theme in outline["days"].items())
+        day_prompt = with_instructions(day_prompt, f"""
+Weekly outline ({outline["name"]}):
+{themes}
+The meals of {day} must follow its theme.
+""")
+    if avoid_meals:
+        day_prompt = with_instructions(day_prompt, f"""
+These meals are already in the plan of the other days, do not repeat them: {"; ".join(avoid_meals)}
+""")
+    return day_prompt
+
+
+def parse_meal_plan_response(response_text: str, wanted_days: List[str] = WEEK_DAYS):
+    logger.debug(f"Meal plan response: {response_text}")
+    return parse_meal_plan(response_text, wanted_days)
+
+
+def with_json_mode(llm, schema: dict = MEAL_PLAN_JSON_SCHEMA, schema_name: str = "meal_plan"):
+    """
+    Ask the backend for JSON-constrained output (response_format), unless it is disabled or was rejected.
+    """
+    if llm_json_mode == "off" or _json_mode_rejected:
+        return llm
+    if llm_json_mode == "json_object":
+        return llm.bind(response_format={"type": "json_object"})
+    return llm.bind(response_format={
+        "type": "json_schema",
+        "json_schema": {"name": schema_name, "schema": schema},
+    })
+
+
+async def ainvoke_json(llm, messages, schema: dict = MEAL_PLAN_JSON_SCHEMA, schema_name: str = "meal_plan"):
+    global _json_mode_rejected
+    try:
+        return await llm_limiter.ainvoke(with_json_mode(llm, schema, schema_name), messages)
+    except Exception as e:
+        # 400 Bad Request: this backend does not support the requested response_format
+        if llm_json_mode == "off" or _json_mode_rejected or getattr(e, "status_code", None) != 400:
+            raise
+        logger.warning(f"LLM backend rejected response_format {llm_json_mode}, prompting without it: {e}")
+        _json_mode_rejected = True
+        return await llm_limiter.ainvoke(llm, messages)
+
+
+async def complete_meal_plan(llm, prompt: List["BaseMessage"], response_text: str) -> dict:
+    """
+    Parse a meal plan response; days that are missing or fail validation are regenerated on their own
+    (up to MEAL_PLAN_REPAIR_ATTEMPTS times) instead of the whole plan.
+    Raises MealPlanFormatError when some days are still invalid after that.
+    """
+    try:
+        header, days = parse_meal_plan_response(response_text)
+    except MealPlanFormatError as e:
+        logger.warning(f"Unusable meal plan response, regenerating every day: {e}")
+        header, days = {}, {}
+    return await repair_meal_plan(llm, prompt, header, days)
+
+
+async def repair_meal_plan(llm, prompt: List["BaseMessage"], header: dict, days: dict) -> dict:
+    """
+    Regenerate the weekdays missing from days (weekday -> valid day dict) and assemble the plan.
+    Raises MealPlanFormatError when some days are still invalid after MEAL_PLAN_REPAIR_ATTEMPTS.
+    """
+    days = dict(days)
+    for _ in range(repair_attempts):
+        missing_days = [day for day in WEEK_DAYS if day not in days]
+        if not missing_days:
+            break
+        logger.warning(f"Meal plan response has no valid {', '.join(missing_days)}, regenerating only those days")
+        response = await ainvoke_json(llm, build_missing_days_prompt(prompt, missing_days))
+        try:
+            retry_header, retry_days = parse_meal_plan_response(response.content, missing_days)
+        except MealPlanFormatError as e:
+            logger.warning(f"Unusable meal plan response for the missing days: {e}")
+            continue
+        header = {**retry_header, **header}
+        days.update(retry_days)
+
+    missing_days = [day for day in WEEK_DAYS if day not in days]
+    if missing_days:
+        raise MealPlanFormatError(f"No valid meal plan for {', '.join(missing_days)}")
+
+    return {
+        "name": header.get("name", "Weekly Meal Plan"),
+        "description": header.get("description", ""),
+        "plan": [days[day] for day in WEEK_DAYS],
+    }
+
+
+async def generate_outline(llm, prompt: List["BaseMessage"]) -> dict:
+    """
+    Short outline of the week (name, description and a theme per day), capped at MEAL_PLAN_OUTLINE_MAX_TOKENS.
+    An unusable outline is not fatal: the days are then generated without themes.
+    """
+    response = await ainvoke_json(
+        llm.bind(max_tokens=outline_max_tokens), build_outline_prompt(prompt),
+        MEAL_PLAN_OUTLINE_JSON_SCHEMA, "meal_plan_outline",
+    )
+    try:
+        return parse_meal_plan_outline(response.content)
+    except MealPlanFormatError as e:
+        logger.warning(f"Unusable meal plan outline, generating the days without it: {e}")
+        return {"name": "Weekly Meal Plan", "description": "", "days": {}}
+
+
+async def generate_day(llm, prompt: List["BaseMessage"], outline: dict, day: str, semaphore: asyncio.Semaphore,
+                       avoid_meals: List[str] = ()) -> dict | None:
+    """
+    One day of an outlined plan, retried up to MEAL_PLAN_REPAIR_ATTEMPTS times; None when it stays invalid.
+    """
+    async with semaphore:
+        for _ in range(1 + repair_attempts):
+            response = await ainvoke_json(llm, build_day_prompt(prompt, outline, day, avoid_meals))
+            try:
+                _, days = parse_meal_plan_response(response.content, [day])
+            except MealPlanFormatError as e:
+                logger.warning(f"Unusable meal plan response for {day}: {e}")
+                continue
+            if day in days:
+                return days[day]
+            logger.warning(f"Meal plan response has no valid {day}")
+    return None
+
+
+async def build_outlined_meal_plan(llm, prompt: List["BaseMessage"]) -> dict:
+    """
+    Outline-first generation: a short outline request, then the seven days as parallel requests
+    (at most MEAL_PLAN_DAY_CONCURRENCY at a time). Days that repeat a meal of an earlier day are
+    regenerated once with the meals of the other days to avoid.
+    Raises MealPlanFormatError when some days are still invalid after their retries.
+    """
+    outline = await generate_outline(llm, prompt)
+    semaphore = asyncio.Semaphore(day_concurrency)
+    days = dict(zip(WEEK_DAYS, await gather_or_cancel(
+        *(generate_day(llm, prompt, outline, day, semaphore) for day in WEEK_DAYS)
+    )))
+
+    repeated_days = repeated_meal_days(days)
+    if repeated_days:
+        logger.info(f"Meal plan repeats meals on {', '.join(repeated_days)}, regenerating those days")
+        avoid_meals = list(dict.fromkeys(
+            days[day][field]
+            for day in WEEK_DAYS if day not in repeated_days and days[day] is not None
+            for field in ("breakfast", "lunch", "dinner")
+        ))
+        regenerated = await gather_or_cancel(
+            *(generate_day(llm, prompt, outline, day, semaphore, avoid_meals) for day in repeated_days)
+        )
+        for day, regenerated_day in zip(repeated_days, regenerated):
+            if regenerated_day is not None:
+                days[day] = regenerated_day
+
+    missing_days = [day for day in WEEK_DAYS if days[day] is None]
+    if missing_days:
+        raise MealPlanFormatError(f"No valid meal plan for {', '.join(missing_days)}")
+
+    return {
+        "name": outline["name"],
+        "description": outline["description"],
+        "plan": [days[day] for day in WEEK_DAYS],
+    }
+
+
+async def delete_meal_plans(db_session: AsyncSession, user_ids: List[str]):
+    plan_ids = select(MealPlan.id).where(MealPlan.user_id.in_(user_ids))
+    await db_session.execute(delete(MealPlanItem).where(MealPlanItem.meal_plan_id.in_(plan_ids)))
+    await db_session.execute(delete(MealPlan).where(MealPlan.user_id.in_(user_ids)))
+
+
+def meal_plan_item_values(plan: dict, plan_id: int) -> dict:
+    return {
+        "meal_slot": plan["meal_slot"],
+        "breakfast": plan["breakfast"],
+        "lunch": plan["lunch"],
+        "dinner": plan["dinner"],
+        "snack": plan["snack"],
+        "macros": plan["macros"],
+        "meal_plan_id": plan_id,
+        **parse_macros(plan["macros"]),
+    }
+
+
+async def save_meal_plan(db_session: AsyncSession, user_id: str, json_response_text: dict):
+    """
+    Replace the user's current meal plan with the generated one.
+    """
+    await replace_meal_plans(db_session, {user_id: json_response_text})
+
+
+async def replace_meal_plans(db_session: AsyncSession, plans: dict, version_ids: dict | None = None):
+    """
+    Replace the current plan of every user in plans (user id -> generated plan) in one transaction:
+    bulk delete of the old plans and items, then bulk insert of the new ones, so a user never has no plan.
+    Each new plan is also stored in the history, unless it comes from it (version_ids: user id -> version id).
+    """
+    today = date.today()
+    try:
+        if version_ids is None:
+            version_ids = await add_meal_plan_versions(db_session, plans)
+        await delete_meal_plans(db_session, list(plans))
+        rows = (await db_session.execute(
+            insert(MealPlan).returning(MealPlan.id, MealPlan.user_id),
+            [
+                {
+                    "user_id": user_id,
+                    "name": plan["name"],
+                    "description": plan["description"],
+                    "date_created": today,
+                    "version_id": version_ids.get(user_id),
+                }
+                for user_id, plan in plans.items()
+            ],
+        )).all()
+        plan_ids = {user_id: plan_id for plan_id, user_id in rows}
+        items = [
+            meal_plan_item_values(day, plan_ids[user_id])
+            for user_id, plan in plans.items()
+            for day in plan["plan"]
+        ]
+        if items:
+            await db_session.execute(insert(MealPlanItem), items)
+        await db_session.commit()
+    except Exception:
+        await db_session.rollback()
+        raise
+    finally:
+        for user_id in plans:
+            latest_plan_cache.invalidate(user_id)
+
+
+def meal_plan_to_dict(plan: MealPlan) -> dict:
+    return {
+        "meal_plan_id": plan.id,
+        "version_id": plan.version_id,
+        "name": plan.name,
+        "description": plan.description,
+        "date_created": str(plan.date_created),
+        "plan": [
+            {
+                "id": item.id,
+                "breakfast": item.breakfast,
+                "lunch": item.lunch,
+                "dinner": item.dinner,
+                "snack": item.snack,
+                "meal_slot": item.meal_slot,
+                "macros": item.macros,
+                "calories": item.calories,
+                "protein": item.protein,
+                "carbs": item.carbs,
+                "fat": item.fat,
+            }
+            for item in plan.items
+        ],
+    }
+
+
+async def get_latest_meal_plan(db_session: AsyncSession, user_id: str) -> dict | None:
+    """
+    The user's most recent plan with its items, read through latest_plan_cache.
+    On a miss the plan and its items are loaded in one joined query; the result is cached only when
+    no plan was written for the user meanwhile (replace_meal_plans invalidates after its commit).
+    The cache is per process: another worker serves its cached plan until LATEST_PLAN_CACHE_TTL expires.
+    """
+    content = latest_plan_cache.get(user_id)
+    if content is not None:
+        return content
+    generation = latest_plan_cache.generation(user_id)
+
+    latest_plan = (await db_session.scalars(
+        select(MealPlan)
+        .where(MealPlan.user_id == user_id)
+        .order_by(MealPlan.date_created.desc(), MealPlan.id.desc())
+        .limit(1)
+        .options(joinedload(MealPlan.items))
+    )).unique().first()
+    if latest_plan is None:
+        return None
+
+    content = meal_plan_to_dict(latest_plan)
+    latest_plan_cache.set_if_current(user_id, content, generation)
+    return content
+
+
+def get_cached_plan(cache_key: str) -> dict | None:
+    cached_plan = plan_cache.get(cache_key)
+    if cached_plan is None:
+        return None
+    if not is_complete_meal_plan(cached_plan):
+        logger.warning(f"Discarding incomplete cached meal plan {cache_key}")
+        plan_cache.invalidate(cache_key)
+        return None
+    return copy.deepcopy(cached_plan)
+
+
+def cache_plan(cache_key: str, plan: dict):
+    """
+    Cache a generated plan, only when it is complete (all 7 days schema-valid).
+    """
+    if not is_complete_meal_plan(plan):
+        logger.warning(f"Not caching incomplete meal plan {cache_key}")
+        return
+    plan_cache.set(cache_key, copy.deepcopy(plan))
+
+
+async def make_prompt(user: User, health_report_text: str, retriever=None) -> List["BaseMessage"]:
+    """
+    Meal plan prompt, grounded in retrieved recipes when a RecipeRetriever is given.
+    """
+    recipe_context = await retriever.arecipe_context(user) if retriever is not None else None
+    return build_meal_plan_prompt(user, health_report_text, recipe_context)
+
+
+async def restore_meal_plan_version(db_session: AsyncSession, user_id: str, version_id: int) -> dict:
+    """
+    Make a plan from the user's history current again, without an LLM call.
+    Raises LookupError when the version does not exist for this user.
+    """
+    json_response_text = await get_meal_plan_version(db_session, user_id, version_id)
+    if json_response_text is None:
+        raise LookupError(f"Meal plan version {version_id} of user {user_id} not found")
+
+    await replace_meal_plans(db_session, {user_id: json_response_text}, version_ids={user_id: version_id})
+    return json_response_text
+
+
+async def build_meal_plan(llm, user: User, health_report_text: str, use_cache: bool = True,
+                          retriever=None, mode: str | None = None) -> dict:
+    """
+    Prompt the LLM for a weekly plan and parse it, without touching the database.
+    mode is one of GENERATION_MODES (default MEAL_PLAN_GENERATION_MODE).
+    Plans for users with the same normalized profile are served from plan_cache unless use_cache is False.
+    """
+    mode = mode or generation_mode
+    if mode not in GENERATION_MODES:
+        raise ValueError(f"Unknown meal plan generation mode {mode}")
+
+    cache_key = plan_cache_key(user, health_report_text) if use_cache else None
+    if cache_key is not None:
+        cached_plan = get_cached_plan(cache_key)
+        if cached_plan is not None:
+            logger.info(f"Meal plan for user_id {user.id} served from cache")
+            return cached_plan
+
+    PROMPT = await make_prompt(user, health_report_text, retriever)
+
+    if mode == "outline":
+        json_response_text = await build_outlined_meal_plan(llm, PROMPT)
+    else:
+        response = await ainvoke_json(llm, PROMPT)
+        json_response_text = await complete_meal_plan(llm, PROMPT, response.content)
+
+    if cache_key is not None:
+        cache_plan(cache_key, json_response_text)
+    return json_response_text
+
+
+async def generate_meal_plan(llm, db_session: AsyncSession, user_id: str, use_cache: bool = True,
+                             retriever=None, mode: str | None = None) -> dict:
+    """
+    Generate a weekly plan and persist it as the user's current plan.
+    Raises UserNotFoundError for unknown users, LLMQueueFullError when the LLM backend is saturated
+    and MealPlanFormatError when the LLM keeps returning invalid days.
+    """
+    user, health_report_text = await load_prompt_inputs(db_session, user_id)
+    json_response_text = await build_meal_plan(llm, user, health_report_text, use_cache, retriever, mode)
+    await save_meal_plan(db_session, user_id, json_response_text)
+    return json_response_text
+
+
+async def regenerate_meal_plans(llm, db_session: AsyncSession, user_ids: List[str], use_cache: bool = True,
+                                retriever=None, batch_size: int = regenerate_batch_size) -> dict:
+    """
+    Regenerate the plans of many users (e.g. a nightly refresh). Users are processed batch_size at a time:
+    the plans of a batch are generated concurrently and written in a single transaction.
+    Returns {"regenerated": {user_id: plan}, "failed": {user_id: error}}.
+    """
+    regenerated, failed = {}, {}
+    user_ids = list(dict.fromkeys(user_ids))
+    for start in range(0, len(user_ids), batch_size):
+        batch = user_ids[start : start + batch_size]
+        inputs = await load_prompt_inputs_many(db_session, batch)
+        for user_id in batch:
+            if user_id not in inputs:
+                failed[user_id] = "User not found"
+
+        outcomes = await asyncio.gather(
+            *(build_meal_plan(llm, user, health_report_text, use_cache, retriever)
+              for user, health_report_text in inputs.values()),
+            return_exceptions=True,
+        )
+        plans = {}
+        for user_id, outcome in zip(inputs, outcomes):
+            if isinstance(outcome, Exception):
+                logger.warning(f"Meal plan regeneration for user_id {user_id} failed: {outcome}")
+                failed[user_id] = str(outcome) or type(outcome).__name__
+            elif isinstance(outcome, BaseException):
+                raise outcome
+            else:
+                plans[user_id] = outcome
+
+        if plans:
+            await replace_meal_plans(db_session, plans)
+            regenerated.update(plans)
+        logger.info(f"Regenerated {len(regenerated)}/{len(user_ids)} meal plans")
+
+    return {"regenerated": regenerated, "failed": failed}
+
+
+async def stream_meal_plan(llm, db_session: AsyncSession, user_id: str, use_cache: bool = True, retriever=None):
+    """
+    Stream the weekly plan from the LLM, yielding ("day", item) for every day as soon as it is
+    complete and valid and ("done", plan) at the end. Missing or invalid days are regenerated as in
+    complete_meal_plan; the plan replaces the current one in a single transaction once all 7 days are valid.
+    Raises MealPlanFormatError when they are not.
+    """
+    user, health_report_text = await load_prompt_inputs(db_session, user_id)
+
+    cache_key = plan_cache_key(user, health_report_text) if use_cache else None
+    if cache_key is not None:
+        json_response_text = get_cached_plan(cache_key)
+        if json_response_text is not None:
+            logger.info(f"Meal plan for user_id {user_id} served from cache")
+            await save_meal_plan(db_session, user_id, json_response_text)
+            for day in json_response_text["plan"]:
+                yield "day", day
+            yield "done", json_response_text
+            return
+
+    PROMPT = await make_prompt(user, health_report_text, retriever)
+
+    # days are sent to the client as soon as they are valid, but only persisted once the whole week is
+    parser = IncrementalPlanParser()
+    days = {}
+    position = 0
+    async for chunk in llm_limiter.astream(llm, PROMPT):
+        for raw_day in parser.feed(chunk.content):
+            day = validate_meal_plan_day(raw_day, WEEK_DAYS[position] if position < len(WEEK_DAYS) else None)
+            position += 1
+            if day is None or day["meal_slot"] in days:
+                continue
+            days[day["meal_slot"]] = day
+            yield "day", day
+
+    json_response_text = await repair_meal_plan(llm, PROMPT, extract_plan_header(parser.text), days)
+    for day in json_response_text["plan"]:
+        if day["meal_slot"] not in days:
+            yield "day", day
+
+    await save_meal_plan(db_session, user_id, json_response_text)
+
+    if cache_key is not None:
+        cache_plan(cache_key, json_response_text)
+
+    yield "done", json_response_text
@@ -0,0 +1,86 @@
+import json
+import zlib
+from datetime import date, datetime
+
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.meal_plan_version import MealPlanVersion
+
+HISTORY_PAGE_SIZE = 20
+HISTORY_MAX_PAGE_SIZE = 100
+
+
+def compress_plan(plan: dict) -> bytes:
+    return zlib.compress(json.dumps(plan, separators=(",", ":")).encode("utf-8"), 9)
+
+
+def decompress_plan(payload: bytes) -> dict:
+    return json.loads(zlib.decompress(payload).decode("utf-8"))
+
+
+async def add_meal_plan_versions(db_session: AsyncSession, plans: dict) -> dict:
+    """
+    Store every plan (user id -> plan) as a new history entry, without committing.
+    Returns user id -> version id.
+    """
+    today = date.today()
+    created_at = datetime.now()
+    rows = (await db_session.execute(
+        insert(MealPlanVersion).returning(MealPlanVersion.id, MealPlanVersion.user_id),
+        [
+            {
+                "user_id": user_id,
+                "name": plan["name"],
+                "description": plan["description"],
+                "date_created": today,
+                "created_at": created_at,
+                "payload": compress_plan(plan),
+            }
+            for user_id, plan in plans.items()
+        ],
+    )).all()
+    return {user_id: version_id for version_id, user_id in rows}
+
+
+def version_to_dict(version: MealPlanVersion) -> dict:
+    return {
+        "version_id": version.id,
+        "name": version.name,
+        "description": version.description,
+        "date_created": str(version.date_created),
+    }
+
+
+async def list_meal_plan_versions(db_session: AsyncSession, user_id: str, before: int | None = None,
+                                  limit: int = HISTORY_PAGE_SIZE) -> dict:
+    """
+    One page of the user's plan history, newest first. Pages are keyset-paginated on the version id
+    (pass the returned next_before to get the following page), so deep pages cost the same as the first one.
+    """
+    limit = max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
+    query = select(
+        MealPlanVersion.id, MealPlanVersion.name, MealPlanVersion.description, MealPlanVersion.date_created
+    ).where(MealPlanVersion.user_id == user_id)
+    if before is not None:
+        query = query.where(MealPlanVersion.id < before)
+    rows = (await db_session.execute(query.order_by(MealPlanVersion.id.desc()).limit(limit + 1))).all()
+
+    versions = [version_to_dict(row) for row in rows[:limit]]
+    return {
+        "versions": versions,
+        "next_before": versions[-1]["version_id"] if len(rows) > limit else None,
+    }
+
+
+async def get_meal_plan_version(db_session: AsyncSession, user_id: str, version_id: int) -> dict | None:
+    """
+    The full plan stored in a history entry of the user, or None.
+    """
+    payload = await db_session.scalar(
+        select(MealPlanVersion.payload)
+        .where(MealPlanVersion.id == version_id, MealPlanVersion.user_id == user_id)
+    )
+    if payload is None:
+        return None
+    return decompress_plan(payload)
@@ -0,0 +1,147 @@
+import logging
+
+from sqlalchemy import func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models.meal_plan import MealPlan
+from models.meal_plan_item import MealPlanItem
+from models.user import User
+from .meal_plan_formatter import parse_macros
+
+logger = logging.getLogger(__name__)
+
+COHORT_FIELDS = {
+    "fitness_goal": User.fitness_goal,
+    "activity_level": User.activity_level,
+    "sex": User.sex,
+}
+MACRO_COLUMNS = (MealPlanItem.calories, MealPlanItem.protein, MealPlanItem.carbs, MealPlanItem.fat)
+
+
+def _round(value):
+    return round(value, 1) if value is not None else None
+
+
+async def backfill_macros(db_session: AsyncSession, batch_size: int = 1000) -> int:
+    """
+    Parse the macros string of items persisted before the numeric columns existed.
+    Walks the table in id order, batch_size rows per transaction, and returns the number of items updated.
+    """
+    last_id = 0
+    updated = 0
+    while True:
+        rows = (await db_session.execute(
+            select(MealPlanItem.id, MealPlanItem.macros)
+            .where(MealPlanItem.id > last_id, MealPlanItem.macros.is_not(None))
+            .where(*(column.is_(None) for column in MACRO_COLUMNS))
+            .order_by(MealPlanItem.id)
+            .limit(batch_size)
+        )).all()
+        if not rows:
+            break
+        last_id = rows[-1].id
+
+        values = []
+        for row in rows:
+            macros = parse_macros(row.macros)
+            if any(value is not None for value in macros.values()):
+                values.append({"id": row.id, **macros})
+        if values:
+            await db_session.execute(update(MealPlanItem), values)
+        await db_session.commit()
+        updated += len(values)
+        logger.info(f"Macros backfill: {updated} items updated, up to id {last_id}")
+    return updated
+
+
+async def weekly_totals(db_session: AsyncSession, user_id: str) -> dict | None:
+    """
+    Nutrition totals of the user's current plan, or None when the user has no plan.
+    """
+    latest_plan_id = (
+        select(MealPlan.id)
+        .where(MealPlan.user_id == user_id)
+        .order_by(MealPlan.date_created.desc(), MealPlan.id.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    row = (await db_session.execute(
+        select(func.count(MealPlanItem.id), *(func.sum(column) for column in MACRO_COLUMNS))
+        .where(MealPlanItem.meal_plan_id == latest_plan_id)
+    )).one()
+    if not row[0]:
+        return None
+    return {
+        "user_id": user_id,
+        "days": row[0],
+        "calories": _round(row[1]),
+        "protein": _round(row[2]),
+        "carbs": _round(row[3]),
+        "fat": _round(row[4]),
+    }
+
+
+async def user_averages(db_session: AsyncSession, after: str | None = None, limit: int = 100) -> dict:
+    """
+    Average daily calories and macros of every user's current plan, keyset-paginated on the user id.
+    """
+    limit = max(1, min(limit, 1000))
+    query = (
+        select(MealPlan.user_id, *(func.avg(column) for column in MACRO_COLUMNS))
+        .join(MealPlanItem, MealPlanItem.meal_plan_id == MealPlan.id)
+        .group_by(MealPlan.user_id)
+        .order_by(MealPlan.user_id)
+        .limit(limit + 1)
+    )
+    if after is not None:
+        query = query.where(MealPlan.user_id > after)
+    rows = (await db_session.execute(query)).all()
+
+    users = [
+        {
+            "user_id": row[0],
+            "calories": _round(row[1]),
+            "protein": _round(row[2]),
+            "carbs": _round(row[3]),
+            "fat": _round(row[4]),
+        }
+        for row in rows[:limit]
+    ]
+    return {"users": users, "next_after": users[-1]["user_id"] if len(rows) > limit else None}
+
+
+async def cohort_stats(db_session: AsyncSession, group_by: str = "fitness_goal") -> list:
+    """
+    Daily calorie and macro statistics of current plans, per cohort of users sharing group_by
+    (fitness_goal, activity_level or sex).
+    """
+    cohort = COHORT_FIELDS[group_by]
+    rows = (await db_session.execute(
+        select(
+            cohort,
+            func.count(func.distinct(MealPlan.user_id)),
+            func.avg(MealPlanItem.calories),
+            func.min(MealPlanItem.calories),
+            func.max(MealPlanItem.calories),
+            func.avg(MealPlanItem.protein),
+            func.avg(MealPlanItem.carbs),
+            func.avg(MealPlanItem.fat),
+        )
+        .join(MealPlan, MealPlan.user_id == User.id)
+        .join(MealPlanItem, MealPlanItem.meal_plan_id == MealPlan.id)
+        .group_by(cohort)
+        .order_by(cohort)
+    )).all()
+    return [
+        {
+            group_by: row[0],
+            "users": row[1],
+            "calories_avg": _round(row[2]),
+            "calories_min": _round(row[3]),
+            "calories_max": _round(row[4]),
+            "protein_avg": _round(row[5]),
+            "carbs_avg": _round(row[6]),
+            "fat_avg": _round(row[7]),
+        }
+        for row in rows
+    ]
@@ -0,0 +1,173 @@
+import abc
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+ocr_key = os.getenv('OCR_API_KEY')
+ocr_backend_name = os.getenv('OCR_BACKEND', 'ocrspace' if ocr_key else 'tesseract')
+ocr_language = os.getenv('OCR_LANGUAGE', 'eng')
+ocr_timeout = float(os.getenv('OCR_TIMEOUT', '60'))
+ocr_retries = int(os.getenv('OCR_RETRIES', '3'))
+ocr_max_processes = int(os.getenv('OCR_MAX_PROCESSES', '2'))
+tesseract_binary = os.getenv('TESSERACT_BINARY', 'tesseract')
+pdftoppm_binary = os.getenv('PDFTOPPM_BINARY', 'pdftoppm')
+
+IMAGE_SUFFIXES = {
+    "image/png": ".png",
+    "image/jpeg": ".jpg",
+    "image/jpg": ".jpg",
+    "image/tiff": ".tiff",
+    "application/pdf": ".pdf",
+}
+
+
+class OCRError(Exception):
+    """
+    Raised when an OCR backend cannot read a document.
+    """
+
+
+class OCRBackend(abc.ABC):
+    """
+    Turns image bytes (PNG, JPEG, multi-page TIFF) or a scanned PDF into text.
+    """
+    @abc.abstractmethod
+    async def extract(self, data: bytes, content_type: str, filename: str = "upload") -> str:
+        """
+        Text of the document; raises OCRError when it cannot be read.
+        """
+
+    async def aclose(self):
+        pass
+
+
+class TesseractOCR(OCRBackend):
+    """
+    Local, offline OCR running the tesseract binary in a bounded pool of subprocesses.
+    Scanned PDFs are rasterized with pdftoppm (poppler) first.
+    """
+    def __init__(self, binary: str = tesseract_binary, language: str = ocr_language,
+                 max_processes: int = ocr_max_processes, timeout: float = ocr_timeout):
+        self.binary = binary
+        self.language = language
+        self.timeout = timeout
+        self._semaphore = asyncio.Semaphore(max_processes)
+
+    async def _run(self, *args) -> str:
+        async with self._semaphore:
+            process = await asyncio.create_subprocess_exec(
+                *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+            )
+            try:
+                stdout, stderr = await asyncio.wait_for(process.communicate(), timeout=self.timeout)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                raise OCRError(f"{args[0]} timed out after {self.timeout}s")
+        if process.returncode != 0:
+            raise OCRError(f"{args[0]} failed: {stderr.decode(errors='replace').strip()}")
+        return stdout.decode("utf-8", errors="replace")
+
+    async def _ocr_file(self, path: Path) -> str:
+        # tesseract reads every frame of a multi-page TIFF by itself
+        return await self._run(self.binary, str(path), "stdout", "-l", self.language)
+
+    async def _ocr_pdf(self, path: Path, workdir: Path) -> str:
+        if shutil.which(pdftoppm_binary) is None:
+            raise OCRError(f"{pdftoppm_binary} is required to OCR scanned PDFs")
+        await self._run(pdftoppm_binary, "-r", "300", "-png", str(path), str(workdir / "page"))
+        pages = sorted(workdir.glob("page*.png"))
+        texts = await asyncio.gather(*(self._ocr_file(page) for page in pages))
+        return "\n".join(texts)
+
+    async def extract(self, data: bytes, content_type: str, filename: str = "upload") -> str:
+        if shutil.which(self.binary) is None:
+            raise OCRError(f"{self.binary} is not installed")
+
+        with tempfile.TemporaryDirectory(prefix="ocr-") as workdir:
+            workdir = Path(workdir)
+            path = workdir / ("upload" + IMAGE_SUFFIXES.get(content_type, ""))
+            path.write_bytes(data)
+            if content_type == "application/pdf":
+                return await self._ocr_pdf(path, workdir)
+            return await self._ocr_file(path)
+
+
+class OCRSpaceOCR(OCRBackend):
+    """
+    OCR through the api.ocr.space HTTP API, with a pooled async client, timeouts and retries.
+    """
+    def __init__(self, api_key: str, url: str = "https://api.ocr.space/parse/image",
+                 language: str = ocr_language, timeout: float = ocr_timeout, retries: int = ocr_retries):
+        self.api_key = api_key
+        self.url = url
+        self.language = language
+        self.retries = retries
+        self._client = httpx.AsyncClient(
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+        )
+
+    async def extract(self, data: bytes, content_type: str, filename: str = "upload") -> str:
+        payload = {
+            'isOverlayRequired': False,
+            'apikey': str(self.api_key),
+            'language': self.language,
+        }
+        if content_type == "application/pdf":
+            payload['filetype'] = "PDF"
+
+        last_error = None
+        for attempt in range(self.retries):
+            try:
+                res = await self._client.post(
+                    self.url,
+                    files={"file": (filename, data, content_type)},
+                    data=payload,
+                )
+                res.raise_for_status()
+                body = res.json()
+                if body.get("IsErroredOnProcessing"):
+                    raise OCRError(f"OCR.space error: {body.get('ErrorMessage')}")
+                return "".join(result["ParsedText"] for result in body.get("ParsedResults") or [])
+            except (httpx.HTTPError, OCRError) as e:
+                last_error = e
+                logger.warning(f"OCR attempt {attempt + 1}/{self.retries} failed: {e}")
+                if attempt + 1 < self.retries:
+                    await asyncio.sleep(0.5 * 2 ** attempt)
+        raise OCRError(f"OCR failed after {self.retries} attempts: {last_error}")
+
+    async def aclose(self):
+        await self._client.aclose()
+
+
+_ocr_backend = None
+
+
+def get_ocr_backend() -> OCRBackend:
+    global _ocr_backend
+    if _ocr_backend is None:
+        if ocr_backend_name == "ocrspace":
+            _ocr_backend = OCRSpaceOCR(ocr_key)
+        elif ocr_backend_name == "tesseract":
+            _ocr_backend = TesseractOCR()
+        else:
+            raise ValueError(f"Unknown OCR_BACKEND {ocr_backend_name}")
+    return _ocr_backend
+
+
+async def close_ocr_backend():
+    global _ocr_backend
+    if _ocr_backend is not None:
+        await _ocr_backend.aclose()
+        _ocr_backend = None
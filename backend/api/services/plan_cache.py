@@ -0,0 +1,67 @@
+import hashlib
+import json
+import os
+
+from dotenv import load_dotenv
+
+from models.user import User
+from .cache import TTLCache, SQLiteCache, TieredCache, GenerationCache
+
+load_dotenv()
+
+plan_cache_size = int(os.getenv('PLAN_CACHE_SIZE', '1024'))
+plan_cache_ttl = float(os.getenv('PLAN_CACHE_TTL', str(7 * 24 * 3600)))
+plan_cache_db = os.getenv('PLAN_CACHE_DB', '')  # e.g. data/plan_cache.db, empty disables the persistent tier
+# per-process, so the TTL bounds how long another worker can serve a plan replaced elsewhere;
+# LATEST_PLAN_CACHE_SIZE=0 turns the cache off when several workers serve requests
+latest_plan_cache_size = int(os.getenv('LATEST_PLAN_CACHE_SIZE', '10000'))
+latest_plan_cache_ttl = float(os.getenv('LATEST_PLAN_CACHE_TTL', '300'))
+
+AGE_BUCKET = 5
+BMI_BUCKET = 1.0
+NO_HEALTH_REPORT = "None"
+
+
+def _normalize_text(value: str | None) -> str:
+    return " ".join((value or "").lower().split())
+
+
+def _normalize_list(value: str | None) -> list:
+    items = [_normalize_text(item) for item in (value or "").replace(";", ",").split(",")]
+    return sorted(item for item in items if item and item not in ("none", "no", "n/a"))
+
+
+def _bucket(value, size):
+    if value is None:
+        return None
+    return int(value // size)
+
+
+def plan_cache_key(user: User, health_report_text: str) -> str | None:
+    """
+    Canonical cache key for the prompt inputs of a user, or None when the plan must not be shared
+    (users with an uploaded health report always get their own generation).
+    """
+    if health_report_text != NO_HEALTH_REPORT:
+        return None
+
+    profile = {
+        "sex": _normalize_text(user.sex),
+        "age": _bucket(user.age, AGE_BUCKET),
+        "bmi": _bucket(user.bmi, BMI_BUCKET),
+        "fitness_goal": _normalize_text(user.fitness_goal),
+        "activity_level": _normalize_text(user.activity_level),
+        "dietary_preferences": _normalize_list(user.dietary_preferences),
+        "medical_conditions": _normalize_list(user.medical_conditions),
+    }
+    canonical = json.dumps(profile, sort_keys=True, separators=(",", ":"))
+    return "meal_plan:" + hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+plan_cache = TieredCache(
+    TTLCache(plan_cache_size, plan_cache_ttl),
+    SQLiteCache(plan_cache_db, plan_cache_ttl) if plan_cache_db else None,
+)
+
+# user id -> the user's current plan as returned by /get_user_meal_plan
+latest_plan_cache = GenerationCache(latest_plan_cache_size, latest_plan_cache_ttl)
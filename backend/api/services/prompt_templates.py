@@ -0,0 +1,118 @@
+import logging
+import os
+import string
+from typing import TYPE_CHECKING, List
+
+from dotenv import load_dotenv
+
+# langchain takes a large part of the startup time, the message classes are imported when a prompt is rendered
+if TYPE_CHECKING:
+    from langchain_core.messages import BaseMessage
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# estimate (about 4 characters per token) or a tiktoken encoding name such as cl100k_base
+prompt_tokenizer = os.getenv('PROMPT_TOKENIZER', 'estimate')
+MISSING_VALUE = "Not specified"
+_encoding = None
+
+
+def _tiktoken_encoding():
+    global _encoding, prompt_tokenizer
+    if _encoding is None:
+        try:
+            import tiktoken
+
+            _encoding = tiktoken.get_encoding(prompt_tokenizer)
+        except Exception as e:
+            # the encoding files are downloaded on first use, which fails on offline deployments
+            logger.warning(f"Tokenizer {prompt_tokenizer} unavailable, estimating token counts: {e}")
+            prompt_tokenizer = "estimate"
+    return _encoding
+
+
+def count_tokens(text: str) -> int:
+    if not text:
+        return 0
+    if prompt_tokenizer != "estimate":
+        encoding = _tiktoken_encoding()
+        if encoding is not None:
+            return len(encoding.encode(text))
+    return (len(text) + 3) // 4
+
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """
+    Longest start of text within max_tokens, cut at a line, sentence or word boundary and marked with "...".
+    """
+    if count_tokens(text) <= max_tokens:
+        return text
+    low, high = 0, len(text)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if count_tokens(text[:middle]) <= max_tokens - 1:
+            low = middle
+        else:
+            high = middle - 1
+    cut = text[:low]
+    for separator in ("\n", ". ", " "):
+        index = cut.rfind(separator)
+        if index > len(cut) // 2:
+            cut = cut[:index + 1]
+            break
+    return cut.rstrip() + " ..."
+
+
+def _fill(value) -> str:
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return MISSING_VALUE
+    return str(value)
+
+
+class PromptTemplate:
+    """
+    Chat prompt split in a static prefix and per-call sections. The prefix is sent first, as the system message,
+    and is identical on every call so the LLM server can reuse its prefix (KV) cache; the sections follow in one
+    user message. Fields are filled safely (None and empty values become "Not specified"), optional sections
+    whose fields are all empty are left out and budgets (field -> max tokens) truncate long values.
+    """
+    def __init__(self, system: str, sections: List[tuple], optional: tuple = (), budgets: dict | None = None):
+        self.system = system
+        self.sections = sections
+        self.optional = optional
+        self.budgets = budgets or {}
+        self.system_tokens = count_tokens(system)
+
+    def render(self, **values) -> tuple[List["BaseMessage"], dict]:
+        """
+        (messages, tokens per section) for values.
+        """
+        from langchain_core.messages import HumanMessage, SystemMessage
+
+        tokens = {"system": self.system_tokens}
+        parts = []
+        for name, template in self.sections:
+            fields = [field for _, field, _, _ in string.Formatter().parse(template) if field]
+            if name in self.optional and all(_fill(values.get(field)) == MISSING_VALUE for field in fields):
+                continue
+            filled = {}
+            for field in fields:
+                value = _fill(values.get(field))
+                if field in self.budgets:
+                    value = truncate_to_tokens(value, self.budgets[field])
+                filled[field] = value
+            text = template.format(**filled)
+            tokens[name] = count_tokens(text)
+            parts.append(text)
+        return [SystemMessage(content=self.system), HumanMessage(content="".join(parts))], tokens
+
+
+def with_instructions(messages: List["BaseMessage"], instructions: str) -> List["BaseMessage"]:
+    """
+    Append instructions to the last (user) message, keeping the prefix of the prompt unchanged.
+    """
+    from langchain_core.messages import HumanMessage
+
+    return messages[:-1] + [HumanMessage(content=messages[-1].content + instructions)]
@@ -1,89 +1,290 @@
-import pandas as pd
+import asyncio
+import hashlib
+import json
+import logging
+import threading
 import requests
-from typing import List
+import httpx
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from requests.adapters import HTTPAdapter
+from typing import TYPE_CHECKING, Iterable, Iterator, List
 import time
 from langchain.schema import Document
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.embeddings.base import Embeddings
-from langchain.vectorstores import Chroma
-from langchain.chains import RetrievalQA
-from langchain_openai import ChatOpenAI
+
+if TYPE_CHECKING:
+    # chromadb, pandas and the OpenAI client are slow to import, they are loaded on first use
+    from langchain.vectorstores import Chroma
+    from langchain.chains import RetrievalQA
+    from langchain_openai import ChatOpenAI
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingError(Exception):
+    """
+    Raised when some texts could not be embedded.
+    vectors holds the embeddings in input order, with None for every text that failed.
+    """
+    def __init__(self, message: str, vectors: List[List[float] | None]):
+        super().__init__(message)
+        self.vectors = vectors
 
 
 class LocalServerEmbeddings(Embeddings):
     """
     Embeddings client wrapping a local LM Studio server.
+    Batches are sent concurrently over a pooled HTTP session, the batch size adapts to the
+    server's latency and errors, and failed batches are retried with backoff.
     """
-    def __init__(self, base_url: str, model: str = "text-embedding-nomic-embed-text-v1.5"):
+    def __init__(
+        self,
+        base_url: str,
+        model: str = "text-embedding-nomic-embed-text-v1.5",
+        max_in_flight: int = 4,
+        batch_size: int = 100,
+        min_batch_size: int = 8,
+        max_batch_size: int = 512,
+        target_latency: float = 2.0,
+        max_retries: int = 4,
+        timeout: float = 120.0,
+    ):
         self.base_url = base_url
         self.model = model
+        self.max_in_flight = max_in_flight
+        self.min_batch_size = min_batch_size
+        self.max_batch_size = max_batch_size
+        self.target_latency = target_latency
+        self.max_retries = max_retries
+        self.timeout = timeout
         self._dim = None  # will infer on first embed
+        self._batch_size = batch_size
+        self._lock = threading.Lock()
+
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max_in_flight)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+        self._async_client = None
+
+    @property
+    def batch_size(self) -> int:
+        return self._batch_size
+
+    def _get_async_client(self) -> httpx.AsyncClient:
+        if self._async_client is None:
+            self._async_client = httpx.AsyncClient(
+                timeout=self.timeout,
+                limits=httpx.Limits(max_connections=self.max_in_flight, max_keepalive_connections=self.max_in_flight),
+            )
+        return self._async_client
 
     def _infer_dim(self):
         # Embed a short test string to get dimension
-        resp = requests.post(
+        resp = self._session.post(
             f"{self.base_url}/embeddings",
             json={"model": self.model, "input": [""]},
+            timeout=self.timeout,
         )
         resp.raise_for_status()
         emb = resp.json()["data"][0]["embedding"]
         self._dim = len(emb)
         return self._dim
 
-    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+    def _record(self, ok: bool, latency: float):
         """
-        Attempt to batch-embed in chunks with fallback and error checking.
+        Adapt the batch size: halve it on errors, shrink it when the server is slow, grow it when fast.
         """
-        embeddings: List[List[float]] = []
-        batch_size = 100
-        for i in range(0, len(texts), batch_size):
-            print(i)
-            batch = texts[i : i + batch_size]
-            payload = {"model": self.model, "input": batch}
+        with self._lock:
+            if not ok:
+                self._batch_size = max(self.min_batch_size, self._batch_size // 2)
+            elif latency > self.target_latency:
+                self._batch_size = max(self.min_batch_size, int(self._batch_size * 0.75))
+            elif latency < self.target_latency / 2:
+                self._batch_size = min(self.max_batch_size, self._batch_size + max(1, self._batch_size // 4))
+
+    def _backoff(self, attempt: int) -> float:
+        return min(10.0, 0.5 * 2 ** attempt)
+
+    def _embed_batch(self, batch: List[str]) -> List[List[float] | None]:
+        payload = {"model": self.model, "input": batch}
+        for attempt in range(self.max_retries):
+            start = time.monotonic()
             try:
-                resp = requests.post(f"{self.base_url}/embeddings", json=payload)
+                resp = self._session.post(f"{self.base_url}/embeddings", json=payload, timeout=self.timeout)
                 resp.raise_for_status()
                 batch_embs = [item["embedding"] for item in resp.json()["data"]]
             except Exception as batch_err:
-                print(f"❌ Batch embedding failed for items {i}-{i+len(batch)-1}: {batch_err}")
-                # Fallback: embed individually
-                batch_embs = []
-                for j, text in enumerate(batch):
-                    try:
-                        emb = self.embed_query(text)
-                    except Exception as e:
-                        print(f"❌ Embedding failed for chunk {i+j}: {e}")
-                        if self._dim is None:
-                            self._infer_dim()
-                        emb = [0.0] * self._dim
-                    batch_embs.append(emb)
-            embeddings.extend(batch_embs)
-            time.sleep(0.1)  # avoid overwhelming the server
+                self._record(False, time.monotonic() - start)
+                logger.warning(f"Embedding batch of {len(batch)} failed (attempt {attempt + 1}/{self.max_retries}): {batch_err}")
+                time.sleep(self._backoff(attempt))
+                continue
+            self._record(True, time.monotonic() - start)
+            self._dim = len(batch_embs[0]) if batch_embs else self._dim
+            return batch_embs
+
+        # Bisect instead of falling back to one request per text, so a bad input is isolated in log(n) calls
+        if len(batch) > 1:
+            middle = len(batch) // 2
+            return self._embed_batch(batch[:middle]) + self._embed_batch(batch[middle:])
+        logger.error("Embedding failed for a chunk")
+        return [None]
+
+    async def _aembed_batch(self, batch: List[str]) -> List[List[float] | None]:
+        client = self._get_async_client()
+        payload = {"model": self.model, "input": batch}
+        for attempt in range(self.max_retries):
+            start = time.monotonic()
+            try:
+                resp = await client.post(f"{self.base_url}/embeddings", json=payload)
+                resp.raise_for_status()
+                batch_embs = [item["embedding"] for item in resp.json()["data"]]
+            except Exception as batch_err:
+                self._record(False, time.monotonic() - start)
+                logger.warning(f"Embedding batch of {len(batch)} failed (attempt {attempt + 1}/{self.max_retries}): {batch_err}")
+                await asyncio.sleep(self._backoff(attempt))
+                continue
+            self._record(True, time.monotonic() - start)
+            self._dim = len(batch_embs[0]) if batch_embs else self._dim
+            return batch_embs
+
+        if len(batch) > 1:
+            middle = len(batch) // 2
+            return await self._aembed_batch(batch[:middle]) + await self._aembed_batch(batch[middle:])
+        logger.error("Embedding failed for a chunk")
+        return [None]
+
+    def _check(self, embeddings: List[List[float] | None]) -> List[List[float]]:
+        failed = sum(vector is None for vector in embeddings)
+        if failed:
+            raise EmbeddingError(f"{failed} of {len(embeddings)} texts could not be embedded", embeddings)
         return embeddings
 
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed texts in adaptively sized batches, keeping up to max_in_flight batches in flight.
+        Raises EmbeddingError when some texts still fail after the retries.
+        """
+        embeddings: List[List[float]] = [None] * len(texts)
+        offset = 0
+        pending = {}
+        with ThreadPoolExecutor(max_workers=self.max_in_flight) as executor:
+            while offset < len(texts) or pending:
+                while offset < len(texts) and len(pending) < self.max_in_flight:
+                    batch = texts[offset : offset + self._batch_size]
+                    pending[executor.submit(self._embed_batch, batch)] = offset
+                    offset += len(batch)
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    start = pending.pop(future)
+                    batch_embs = future.result()
+                    embeddings[start : start + len(batch_embs)] = batch_embs
+                logger.debug(f"Embedded {offset}/{len(texts)} texts, batch size {self._batch_size}")
+        return self._check(embeddings)
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        """
+        Async embed_documents over a pooled httpx client.
+        """
+        embeddings: List[List[float]] = [None] * len(texts)
+        offset = 0
+        pending = {}
+        while offset < len(texts) or pending:
+            while offset < len(texts) and len(pending) < self.max_in_flight:
+                batch = texts[offset : offset + self._batch_size]
+                pending[asyncio.ensure_future(self._aembed_batch(batch))] = offset
+                offset += len(batch)
+            done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                start = pending.pop(task)
+                batch_embs = task.result()
+                embeddings[start : start + len(batch_embs)] = batch_embs
+        return self._check(embeddings)
+
     def embed_query(self, text: str) -> List[float]:
         payload = {"model": self.model, "input": [text]}
-        resp = requests.post(f"{self.base_url}/embeddings", json=payload)
+        resp = self._session.post(f"{self.base_url}/embeddings", json=payload, timeout=self.timeout)
         resp.raise_for_status()
         return resp.json()["data"][0]["embedding"]
 
+    async def aembed_query(self, text: str) -> List[float]:
+        return (await self.aembed_queries([text]))[0]
 
-def load_recipes(csv_path: str) -> List[Document]:
+    async def aembed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        Embed a few queries in a single request, without retries: a failure is raised right away
+        so the caller can go on without retrieval instead of waiting for the backoff.
+        """
+        payload = {"model": self.model, "input": texts}
+        resp = await self._get_async_client().post(f"{self.base_url}/embeddings", json=payload)
+        resp.raise_for_status()
+        vectors = [item["embedding"] for item in resp.json()["data"]]
+        if len(vectors) != len(texts) or not all(vectors):
+            raise EmbeddingError("Embedding server returned incomplete query embeddings", vectors)
+        return vectors
+
+    async def aclose(self):
+        self._session.close()
+        if self._async_client is not None:
+            await self._async_client.aclose()
+            self._async_client = None
+
+
+RECIPE_COLUMNS = ["name", "ingredients", "tags"]
+RECIPE_DTYPES = {"name": str, "ingredients": str, "tags": str}
+# Food.com tags stored as boolean metadata (tag_<name>) so retrieval can filter on them
+DIETARY_TAGS = [
+    "vegan", "vegetarian", "gluten-free", "diabetic", "low-carb", "low-sodium",
+    "low-fat", "low-cholesterol", "low-calorie", "high-protein", "lactose", "egg-free", "nut-free",
+]
+
+
+def tag_metadata_key(tag: str) -> str:
+    return "tag_" + tag.replace("-", "_")
+
+
+def iter_recipe_batches(csv_path: str, batch_size: int = 5000) -> Iterator[List[Document]]:
     """
-    Load CSV of recipes and convert each row into a LangChain Document.
-    Assumes columns: title, ingredients, tags
+    Stream the recipe CSV in chunks of batch_size rows, yielding a list of Documents per chunk.
+    Only the needed columns are read and the page content is assembled column-wise.
     """
-    df = pd.read_csv(csv_path)
-    docs: List[Document] = []
-    df = df.dropna(subset=['name'])
-    for _, row in df.iterrows():
+    import pandas as pd
+
+    reader = pd.read_csv(csv_path, usecols=RECIPE_COLUMNS, dtype=RECIPE_DTYPES, chunksize=batch_size)
+    for df in reader:
+        df = df.dropna(subset=['name'])
         content = (
-            f"Name: {row['name']}\n\n"
-            f"Ingredients:\n{row['ingredients']}\n\n"
-            f"Tags:\n{row['tags']}"
+            "Name: " + df['name']
+            + "\n\nIngredients:\n" + df['ingredients'].fillna("nan")
+            + "\n\nTags:\n" + df['tags'].fillna("nan")
         )
-        docs.append(Document(page_content=content, metadata={"title": row['name']}))
-    return docs
+        tags = df['tags'].fillna("")
+        flags = {tag_metadata_key(tag): tags.str.contains(f"'{tag}'", regex=False).tolist() for tag in DIETARY_TAGS}
+        yield [
+            Document(
+                page_content=page_content,
+                metadata={"title": title, **{key: values[i] for key, values in flags.items()}},
+            )
+            for i, (page_content, title) in enumerate(zip(content.tolist(), df['name'].tolist()))
+        ]
+
+
+def load_recipes(csv_path: str) -> List[Document]:
+    """
+    Load CSV of recipes and convert each row into a LangChain Document.
+    Assumes columns: name, ingredients, tags
+    """
+    return [doc for batch in iter_recipe_batches(csv_path) for doc in batch]
+
+
+def iter_recipe_chunks(
+    csv_path: str, batch_size: int = 5000, chunk_size: int = 1000, chunk_overlap: int = 100
+) -> Iterator[List[Document]]:
+    """
+    Stream split chunks batch by batch, so the whole dataset never sits in memory.
+    """
+    for docs in iter_recipe_batches(csv_path, batch_size):
+        yield split_documents(docs, chunk_size, chunk_overlap)
 
 
 def split_documents(
@@ -92,6 +293,8 @@ def split_documents(
     """
     Split Documents into smaller overlapping chunks.
     """
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
     splitter = RecursiveCharacterTextSplitter(
         chunk_size=chunk_size, chunk_overlap=chunk_overlap
     )
@@ -100,10 +303,12 @@ def split_documents(
 
 def build_vectordb(
     docs: List[Document], persist_directory: str, embedding: Embeddings
-) -> Chroma:
+) -> "Chroma":
     """
     Create and persist a Chroma vector store from documents.
     """
+    from langchain.vectorstores import Chroma
+
     vectordb = Chroma.from_documents(
         documents=docs,
         embedding=embedding,
@@ -112,37 +317,93 @@ def build_vectordb(
     return vectordb
 
 
+def chunk_id(doc: Document) -> str:
+    """
+    Deterministic Chroma id of a chunk: changes whenever its text or metadata changes.
+    """
+    metadata = json.dumps(doc.metadata, sort_keys=True, default=str)
+    return hashlib.sha256(f"{metadata}\n{doc.page_content}".encode("utf-8")).hexdigest()
+
+
+def sync_vectordb(
+    docs: List[Document], persist_directory: str, embedding: Embeddings, batch_size: int = 1000
+) -> "Chroma":
+    """
+    Incrementally update a Chroma store so it holds exactly the given chunks:
+    only new or changed chunks are embedded and added, chunks that disappeared are deleted.
+    """
+    return sync_vectordb_batches([docs], persist_directory, embedding, batch_size)
+
+
+def sync_vectordb_batches(
+    doc_batches: Iterable[List[Document]], persist_directory: str, embedding: Embeddings, batch_size: int = 1000
+) -> "Chroma":
+    """
+    Streaming sync_vectordb: consumes chunk batches one at a time (e.g. from iter_recipe_chunks),
+    keeping only chunk ids in memory.
+    """
+    vectordb = load_vectordb(persist_directory, embedding)
+    existing_ids = set(vectordb.get(include=[])["ids"])
+    seen_ids = set()
+    added = 0
+
+    for docs in doc_batches:
+        new_docs = {}
+        for doc in docs:
+            doc_id = chunk_id(doc)
+            if doc_id not in existing_ids and doc_id not in seen_ids:
+                new_docs[doc_id] = doc
+            seen_ids.add(doc_id)
+        ids = list(new_docs)
+        for i in range(0, len(ids), batch_size):
+            batch_ids = ids[i : i + batch_size]
+            vectordb.add_documents([new_docs[doc_id] for doc_id in batch_ids], ids=batch_ids)
+        added += len(ids)
+
+    removed_ids = list(existing_ids - seen_ids)
+    for i in range(0, len(removed_ids), batch_size):
+        vectordb.delete(ids=removed_ids[i : i + batch_size])
+    logger.info(f"Index sync: {added} chunks added, {len(removed_ids)} deleted, "
+                f"{len(seen_ids) - added} unchanged")
+    return vectordb
+
+
 def load_vectordb(
     persist_directory: str, embedding: Embeddings
-) -> Chroma:
+) -> "Chroma":
     """
     Load an existing Chroma vector store.
     """
+    from langchain.vectorstores import Chroma
+
     return Chroma(
         persist_directory=persist_directory,
         embedding_function=embedding,
     )
 
 
-def get_qa_chain(llm: ChatOpenAI, vectordb: Chroma) -> RetrievalQA:
+def load_vector_store(
+    persist_directory: str, embedding: Embeddings, backend: str = "chroma", index_directory: str | None = None
+):
+    """
+    Load the recipe vector store: the Chroma store, or the in-process NumpyVectorIndex exported from it.
+    """
+    if backend == "chroma":
+        return load_vectordb(persist_directory, embedding)
+    if backend == "numpy":
+        from .vector_index import NumpyVectorIndex
+        return NumpyVectorIndex(index_directory, embedding)
+    raise ValueError(f"Unknown vector store backend {backend}")
+
+
+def get_qa_chain(llm: "ChatOpenAI", vectordb: "Chroma") -> "RetrievalQA":
     """
     Build a RetrievalQA chain with source docs returned.
     """
+    from langchain.chains import RetrievalQA
+
     return RetrievalQA.from_chain_type(
         llm=llm,
         retriever=vectordb.as_retriever(k=100),
         return_source_documents=True,
     )
-
-# csv_path = "./data/RAW_recipes.csv"
-# persist_dir = "chroma_recipes/"
-# embedding_server = "http://localhost:1234/v1"
-
-# recipes = load_recipes(csv_path)[:20000]
-# chunks = split_documents(recipes)
-# print(f"Created {len(chunks)} chunks.")
-
-# embedding = LocalServerEmbeddings(base_url=embedding_server)
-# print("Building vector store (this may take a while)...")
-# vectordb = build_vectordb(chunks, persist_dir, embedding)
-# print("Finished building vector store")
\ No newline at end of file
@@ -0,0 +1,119 @@
+import ast
+import asyncio
+import logging
+import os
+import re
+from typing import List
+
+from dotenv import load_dotenv
+from langchain.schema import Document
+
+from models.user import User
+from .recipe_embedding_service import tag_metadata_key
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+rag_enabled = os.getenv('RAG_ENABLED', 'true').lower() == 'true'
+rag_top_k = int(os.getenv('RAG_TOP_K', '12'))
+rag_fetch_k = int(os.getenv('RAG_FETCH_K', '48'))
+rag_lambda_mult = float(os.getenv('RAG_LAMBDA_MULT', '0.5'))
+
+# words in the user's dietary preferences / medical conditions -> recipe tag that must be present
+TAG_KEYWORDS = {
+    "vegan": ["vegan"],
+    "vegetarian": ["vegetarian"],
+    "gluten-free": ["gluten", "celiac", "coeliac"],
+    "diabetic": ["diabet"],
+    "low-carb": ["low carb", "low-carb", "keto"],
+    "low-sodium": ["low sodium", "low-sodium", "hypertension", "high blood pressure"],
+    "low-cholesterol": ["cholesterol"],
+    "lactose": ["lactose"],
+    "egg-free": ["egg allergy", "egg-free", "no eggs"],
+    "nut-free": ["nut allergy", "nut-free", "peanut"],
+}
+
+
+def dietary_tags(user: User) -> List[str]:
+    """
+    Recipe tags every suggested recipe must carry, derived from the user's profile.
+    """
+    text = f"{user.dietary_preferences or ''} {user.medical_conditions or ''}".lower()
+    tags = [tag for tag, keywords in TAG_KEYWORDS.items() if any(keyword in text for keyword in keywords)]
+    if "vegan" in tags and "vegetarian" in tags:
+        tags.remove("vegetarian")  # every vegan recipe is vegetarian, but not every one is tagged so
+    return tags
+
+
+def build_where(tags: List[str]) -> dict | None:
+    conditions = [{tag_metadata_key(tag): True} for tag in tags]
+    if not conditions:
+        return None
+    if len(conditions) == 1:
+        return conditions[0]
+    return {"$and": conditions}
+
+
+def build_query(user: User) -> str:
+    parts = [user.fitness_goal, user.dietary_preferences, "healthy balanced meals"]
+    return " ".join(part for part in parts if part)
+
+
+def summarize_recipe(doc: Document, max_ingredients: int = 8) -> str:
+    """
+    One-line summary of a recipe chunk: name and its first ingredients.
+    """
+    title = doc.metadata.get("title") or doc.page_content.split("\n", 1)[0].removeprefix("Name: ")
+    match = re.search(r"Ingredients:\n(.*?)(?:\n\n|$)", doc.page_content, flags=re.DOTALL)
+    ingredients = []
+    if match:
+        try:
+            ingredients = list(ast.literal_eval(match.group(1)))
+        except (ValueError, SyntaxError):
+            ingredients = [match.group(1)]
+    if not ingredients:
+        return f"- {title}"
+    suffix = ", ..." if len(ingredients) > max_ingredients else ""
+    return f"- {title} ({', '.join(map(str, ingredients[:max_ingredients]))}{suffix})"
+
+
+class RecipeRetriever:
+    """
+    Retrieves a small, diverse set of recipes matching the user's dietary constraints:
+    metadata filter on recipe tags first, then a top-k MMR vector search over what is left.
+    """
+    def __init__(self, vectordb, embedding, k: int = rag_top_k, fetch_k: int = rag_fetch_k,
+                 lambda_mult: float = rag_lambda_mult):
+        self.vectordb = vectordb
+        self.embedding = embedding
+        self.k = k
+        self.fetch_k = fetch_k
+        self.lambda_mult = lambda_mult
+
+    def retrieve(self, user: User) -> List[Document]:
+        return self.retrieve_by_vector(user, self.embedding.embed_query(build_query(user)))
+
+    def retrieve_by_vector(self, user: User, query_vector: List[float]) -> List[Document]:
+        return self.vectordb.max_marginal_relevance_search_by_vector(
+            query_vector,
+            k=self.k,
+            fetch_k=self.fetch_k,
+            lambda_mult=self.lambda_mult,
+            filter=build_where(dietary_tags(user)),
+        )
+
+    async def arecipe_context(self, user: User) -> str | None:
+        """
+        Compact recipe list to ground the meal plan prompt, or None when retrieval is unavailable.
+        """
+        try:
+            # the query embedding goes through the async (cached, micro-batched) path
+            query_vector = await self.embedding.aembed_query(build_query(user))
+            docs = await asyncio.to_thread(self.retrieve_by_vector, user, query_vector)
+        except Exception as e:
+            logger.warning(f"Recipe retrieval failed, generating without recipes: {e}")
+            return None
+
+        lines = list(dict.fromkeys(summarize_recipe(doc) for doc in docs))
+        return "\n".join(lines) if lines else None
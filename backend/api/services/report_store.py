@@ -0,0 +1,89 @@
+import hashlib
+import logging
+import os
+import threading
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parent.parent.parent    # -> backend/
+report_store_dir = os.getenv('REPORT_STORE_DIR', str(BASE_DIR / "data" / "report_store"))
+report_store_max_bytes = int(os.getenv('REPORT_STORE_MAX_BYTES', str(256 * 1024 * 1024)))
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_upload(uploaded_file) -> str:
+    """
+    SHA-256 of the uploaded bytes, read in chunks. The file is rewound afterwards.
+    """
+    digest = hashlib.sha256()
+    uploaded_file.file.seek(0)
+    for chunk in iter(lambda: uploaded_file.file.read(HASH_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    uploaded_file.file.seek(0)
+    return digest.hexdigest()
+
+
+class ContentStore:
+    """
+    Content-addressed text store on disk: entries are keyed by the hash of the uploaded bytes
+    and a kind ("text" for the extracted text, "summary" for the LLM summary).
+    The least recently used entries are evicted once the store grows past max_bytes.
+    """
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._size = sum(path.stat().st_size for path in self._entries())
+
+    def _entries(self):
+        return (path for path in self.directory.glob("*/*") if path.is_file() and not path.name.endswith(".tmp"))
+
+    def _path(self, digest: str, kind: str) -> Path:
+        return self.directory / digest[:2] / f"{digest}.{kind}"
+
+    def get(self, digest: str, kind: str) -> str | None:
+        path = self._path(digest, kind)
+        try:
+            text = path.read_text(encoding="utf-8")
+        except FileNotFoundError:
+            return None
+        os.utime(path)  # mark as recently used
+        return text
+
+    def put(self, digest: str, kind: str, text: str):
+        path = self._path(digest, kind)
+        path.parent.mkdir(exist_ok=True)
+        data = text.encode("utf-8")
+        tmp_path = path.with_name(path.name + ".tmp")
+        tmp_path.write_bytes(data)
+
+        with self._lock:
+            previous_size = path.stat().st_size if path.exists() else 0
+            os.replace(tmp_path, path)
+            self._size += len(data) - previous_size
+            if self._size > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        entries = sorted(self._entries(), key=lambda path: path.stat().st_mtime)
+        target = self.max_bytes * 0.9
+        for path in entries:
+            if self._size <= target:
+                break
+            try:
+                size = path.stat().st_size
+                path.unlink()
+            except FileNotFoundError:
+                continue
+            self._size -= size
+        logger.info(f"Report store evicted down to {self._size} bytes")
+
+
+report_store = ContentStore(report_store_dir, report_store_max_bytes)
@@ -0,0 +1,113 @@
+import asyncio
+import logging
+import os
+from typing import List
+
+from dotenv import load_dotenv
+
+from models.health_report import HealthReport
+from .llm_service import llm_limiter, gather_or_cancel
+from .prompt_templates import PromptTemplate, count_tokens, truncate_to_tokens
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+report_chunk_tokens = int(os.getenv('REPORT_CHUNK_TOKENS', '2000'))
+report_chunk_overlap = int(os.getenv('REPORT_CHUNK_OVERLAP_TOKENS', '100'))
+report_map_concurrency = int(os.getenv('REPORT_MAP_CONCURRENCY', '4'))
+report_max_rounds = int(os.getenv('REPORT_MAX_REDUCE_ROUNDS', '3'))
+SUMMARY_MAX_CHARS = HealthReport.__table__.c.report_text.type.length
+NO_MEDICAL_HISTORY = "no medical history"
+
+SUMMARY_PROMPT = PromptTemplate(
+    system=f"""You are a helpful assistant specialized in medical tasks. You will be given a health report of any type and should summary it keeping attention to health problems and unhealthy levels.
+The summary should be medical focused and must contain less than {SUMMARY_MAX_CHARS} characters!
+Please respond only in valid text format with no special characters and no additional words other than the report. If the given report text is not medical related at all, or if it is offensive always reply with only the following phrase "{NO_MEDICAL_HISTORY}" without justifying the answer.
+""",
+    sections=[("report", """Report:
+{report}
+""")],
+)
+
+CHUNK_PROMPT = PromptTemplate(
+    system="""You are a helpful assistant specialized in medical tasks. You will be given one part of a longer health report.
+List the medical findings of this part: diagnoses, health problems, abnormal or unhealthy values with their units and medications.
+Be concise and respond only with the findings, no introduction. If this part contains nothing medical, reply with only the word "none".
+""",
+    sections=[("report", """Part {part} of {parts} of the report:
+{report}
+""")],
+)
+
+
+def split_report(text: str) -> List[str]:
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=report_chunk_tokens,
+        chunk_overlap=report_chunk_overlap,
+        length_function=count_tokens,
+    )
+    return splitter.split_text(text)
+
+
+def bound_summary(text: str, max_chars: int = SUMMARY_MAX_CHARS) -> str:
+    """
+    Fit a summary in the report_text column, cutting at a sentence or word boundary.
+    """
+    text = text.strip()
+    if len(text) <= max_chars:
+        return text
+    cut = text[:max_chars]
+    for separator in (". ", " "):
+        index = cut.rfind(separator)
+        if index > max_chars // 2:
+            return cut[:index + 1].rstrip()
+    return cut
+
+
+async def _complete(llm, template: PromptTemplate, **values) -> str:
+    messages, tokens = template.render(**values)
+    logger.debug(f"Report summary prompt tokens: {tokens}")
+    response = await llm_limiter.ainvoke(llm, messages)
+    return response.content.strip()
+
+
+async def summarize_chunks(llm, chunks: List[str]) -> List[str]:
+    """
+    Findings of every chunk, at most REPORT_MAP_CONCURRENCY requests at a time.
+    Chunks without medical content are left out.
+    """
+    semaphore = asyncio.Semaphore(report_map_concurrency)
+
+    async def summarize_chunk(part: int, chunk: str) -> str:
+        async with semaphore:
+            return await _complete(llm, CHUNK_PROMPT, part=part, parts=len(chunks), report=chunk)
+
+    notes = await gather_or_cancel(*(summarize_chunk(part, chunk) for part, chunk in enumerate(chunks, start=1)))
+    return [note for note in notes if note.strip(" .\"'").lower() not in ("", "none")]
+
+
+async def summarize_report(llm, text: str) -> str:
+    """
+    Summary of a health report, at most SUMMARY_MAX_CHARS characters long.
+    Reports within REPORT_CHUNK_TOKENS are summarized in a single call. Longer ones are split into chunks whose
+    findings are extracted concurrently (map), then summarized together (reduce); findings that are still too
+    long are split and condensed again, up to REPORT_MAX_REDUCE_ROUNDS times.
+    """
+    rounds = 0
+    while count_tokens(text) > report_chunk_tokens:
+        if rounds == report_max_rounds:
+            logger.warning(f"Report findings still over {report_chunk_tokens} tokens after {rounds} rounds, truncating")
+            text = truncate_to_tokens(text, report_chunk_tokens)
+            break
+        chunks = split_report(text)
+        logger.info(f"Summarizing report in {len(chunks)} chunks (round {rounds + 1})")
+        notes = await summarize_chunks(llm, chunks)
+        if not notes:
+            return NO_MEDICAL_HISTORY
+        text = "\n\n".join(notes)
+        rounds += 1
+
+    return bound_summary(await _complete(llm, SUMMARY_PROMPT, report=text))
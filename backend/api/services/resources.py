@@ -0,0 +1,205 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import TYPE_CHECKING
+
+import httpx
+from dotenv import load_dotenv
+
+from .llm_service import llm_base_urls, parse_base_urls
+
+# the clients below pull in langchain, so they are imported when first created rather than at startup
+if TYPE_CHECKING:
+    from .embedding_cache import CachedQueryEmbeddings
+    from .recipe_retriever import RecipeRetriever
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = Path(__file__).resolve().parent.parent.parent    # -> backend/
+
+llm_api_key = os.getenv('LLM_API_KEY', 'lm-studio')
+llm_model = os.getenv('LLM_MODEL', 'phi-4')
+llm_timeout = float(os.getenv('LLM_TIMEOUT', '300'))
+llm_max_connections = int(os.getenv('LLM_MAX_CONNECTIONS', '20'))    # per backend
+embedding_base_urls = parse_base_urls(
+    os.getenv('EMBEDDING_BASE_URLS') or os.getenv('EMBEDDING_BASE_URL') or ",".join(llm_base_urls)
+)
+vector_store_backend = os.getenv('VECTOR_STORE', 'chroma')    # chroma or numpy
+chroma_dir = os.getenv('CHROMA_DIR', str(BASE_DIR / 'chroma_recipes'))
+vector_index_dir = os.getenv('VECTOR_INDEX_DIR', str(BASE_DIR / 'recipe_index'))
+query_cache_size = int(os.getenv('QUERY_EMBEDDING_CACHE_SIZE', '4096'))
+query_cache_dir = os.getenv('QUERY_EMBEDDING_CACHE_DIR', '')    # e.g. data/query_embedding_cache, empty keeps it in memory
+warmup_enabled = os.getenv('RESOURCE_WARMUP', 'true').lower() == 'true'
+health_timeout = float(os.getenv('HEALTH_PROBE_TIMEOUT', '2'))
+health_interval = float(os.getenv('LLM_HEALTH_INTERVAL', '15'))    # 0 disables the periodic checks
+
+
+class ResourceRegistry:
+    """
+    Process-wide clients shared by all routers, each created on first use instead of at import time:
+    one chat model balanced over the LLM_BASE_URLS servers, each with its own pooled HTTP client
+    (callers bind their own temperature), the query embeddings balanced over the EMBEDDING_BASE_URLS servers
+    and the recipe vector store / retriever.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._http_clients = []
+        self._llm_router = None
+        self._llm = None
+        self._embedding_router = None
+        self._embeddings = None
+        self._health_task = None
+        self._vector_store = None
+        self._retriever = None
+
+    def llm(self, temperature: float | None = None):
+        from .llm_router import BackendRouter, RoutedChatModel
+
+        with self._lock:
+            if self._llm is None:
+                self._llm_router = BackendRouter("LLM", llm_base_urls, self._make_chat_client)
+                self._llm = RoutedChatModel(self._llm_router)
+        if temperature is None:
+            return self._llm
+        return self._llm.bind(temperature=temperature)
+
+    def _make_chat_client(self, base_url: str):
+        from langchain_openai import ChatOpenAI
+
+        http_client = httpx.AsyncClient(
+            timeout=llm_timeout,
+            limits=httpx.Limits(max_connections=llm_max_connections,
+                                max_keepalive_connections=llm_max_connections),
+        )
+        self._http_clients.append(http_client)
+        return ChatOpenAI(
+            base_url=base_url,
+            api_key=llm_api_key,
+            model=llm_model,
+            http_async_client=http_client,
+        )
+
+    def embeddings(self) -> "CachedQueryEmbeddings":
+        from .embedding_cache import CachedQueryEmbeddings, EmbeddingCache
+        from .llm_router import BackendRouter, RoutedEmbeddings
+        from .recipe_embedding_service import LocalServerEmbeddings
+
+        with self._lock:
+            if self._embeddings is None:
+                self._embedding_router = BackendRouter(
+                    "Embedding", embedding_base_urls, lambda base_url: LocalServerEmbeddings(base_url=base_url)
+                )
+                document_embeddings = RoutedEmbeddings(self._embedding_router)
+                self._embeddings = CachedQueryEmbeddings(
+                    document_embeddings,
+                    max_entries=query_cache_size,
+                    persistent=EmbeddingCache(query_cache_dir, document_embeddings.model) if query_cache_dir else None,
+                )
+            return self._embeddings
+
+    def vector_store(self):
+        from .recipe_embedding_service import load_vector_store
+
+        embeddings = self.embeddings()
+        with self._lock:
+            if self._vector_store is None:
+                self._vector_store = load_vector_store(
+                    persist_directory=chroma_dir,
+                    embedding=embeddings,
+                    backend=vector_store_backend,
+                    index_directory=vector_index_dir,
+                )
+            return self._vector_store
+
+    async def recipe_retriever(self) -> "RecipeRetriever | None":
+        """
+        Shared RecipeRetriever, or None when RAG is disabled or the vector store cannot be opened
+        (generation then runs on the prompt alone and the store is retried on the next call).
+        """
+        from .recipe_retriever import RecipeRetriever, rag_enabled
+
+        if not rag_enabled:
+            return None
+        if self._retriever is None:
+            try:
+                vector_store = await asyncio.to_thread(self.vector_store)
+            except Exception as e:
+                logger.warning(f"Recipe vector store unavailable, generating without recipes: {e}")
+                return None
+            self._retriever = RecipeRetriever(vector_store, self.embeddings())
+        return self._retriever
+
+    async def warm_up(self):
+        """
+        Create every client ahead of the first request, without failing startup.
+        """
+        started = time.monotonic()
+        try:
+            await asyncio.to_thread(self.llm)
+            await self.recipe_retriever()
+        except Exception:
+            logger.exception("Resource warm-up failed")
+            return
+        logger.info(f"Resources warmed up in {time.monotonic() - started:.2f}s")
+
+    async def health(self) -> dict:
+        """
+        Readiness of the model servers (a cheap /models request to every backend, ready when one of them
+        answers) and of the vector store. The probes also eject or restore the backends.
+        """
+        from .recipe_retriever import rag_enabled
+
+        await asyncio.to_thread(self.llm)
+        self.embeddings()
+        async with httpx.AsyncClient(timeout=health_timeout) as client:
+            llm, embeddings = await asyncio.gather(
+                self._llm_router.check(client),
+                self._embedding_router.check(client),
+            )
+        vector_store = {"ok": not rag_enabled or self._vector_store is not None, "loaded": self._vector_store is not None}
+        return {
+            "ok": llm["ok"] and embeddings["ok"] and vector_store["ok"],
+            "llm": llm,
+            "embeddings": embeddings,
+            "vector_store": vector_store,
+        }
+
+    async def _check_backends(self):
+        async with httpx.AsyncClient(timeout=health_timeout) as client:
+            while True:
+                await asyncio.sleep(health_interval)
+                for router in (self._llm_router, self._embedding_router):
+                    if router is not None:
+                        await router.check(client)
+
+    def start_health_checks(self):
+        """
+        Probe the backends every LLM_HEALTH_INTERVAL seconds, so ejected ones come back without a failed request.
+        """
+        if health_interval > 0 and self._health_task is None:
+            self._health_task = asyncio.create_task(self._check_backends())
+
+    async def aclose(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            await asyncio.gather(self._health_task, return_exceptions=True)
+        for http_client in self._http_clients:
+            await http_client.aclose()
+        if self._embeddings is not None:
+            await self._embeddings.embeddings.aclose()
+        self._health_task = None
+        self._http_clients = []
+        self._llm_router = None
+        self._llm = None
+        self._embedding_router = None
+        self._embeddings = None
+        self._vector_store = None
+        self._retriever = None
+
+
+resources = ResourceRegistry()
@@ -0,0 +1,288 @@
+import json
+import logging
+from pathlib import Path
+from typing import List
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+from langchain.schema import Document
+from langchain_community.vectorstores.utils import maximal_marginal_relevance
+
+try:
+    import hnswlib
+except ImportError:  # optional, only needed for mode="hnsw"
+    hnswlib = None
+
+logger = logging.getLogger(__name__)
+
+MODES = ("flat", "int8", "ivf", "hnsw")
+BLOCK_ROWS = 65536
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def _kmeans(matrix: np.ndarray, nlist: int, iterations: int = 10, sample: int = 100_000, seed: int = 0) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    rows = matrix[rng.choice(len(matrix), size=min(sample, len(matrix)), replace=False)].astype(np.float32)
+    centroids = rows[rng.choice(len(rows), size=nlist, replace=False)]
+    for _ in range(iterations):
+        assignment = np.argmax(rows @ centroids.T, axis=1)
+        for i in range(nlist):
+            members = rows[assignment == i]
+            if len(members):
+                centroids[i] = members.mean(axis=0)
+        centroids = _normalize(centroids)
+    return centroids
+
+
+def _top_k(scores: np.ndarray, k: int):
+    """
+    Row-wise top k (indices, scores) of a (queries, rows) score matrix, best first.
+    """
+    k = min(k, scores.shape[1])
+    if k == 0:
+        return np.empty((scores.shape[0], 0), dtype=np.int64), np.empty((scores.shape[0], 0), dtype=np.float32)
+    indices = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, indices, axis=1)
+    order = np.argsort(-top_scores, axis=1)
+    return np.take_along_axis(indices, order, axis=1), np.take_along_axis(top_scores, order, axis=1)
+
+
+class NumpyVectorIndex:
+    """
+    In-process recipe index over the same embeddings as the Chroma store, with a cosine-similarity search.
+
+    Modes:
+      flat - memory-mapped float32/float16 matrix, exact brute-force search
+      int8 - per-row scaled int8 matrix, a quarter of the float32 memory
+      ivf  - k-means inverted lists, only the nprobe closest lists are scanned
+      hnsw - hnswlib graph (optional dependency)
+    Exposes the similarity_search / max_marginal_relevance_search subset of the LangChain
+    vector store API used by RecipeRetriever, including Chroma-style equality / $and metadata filters.
+    """
+    def __init__(self, directory: str, embedding: Embeddings, nprobe: int = 8, mmap: bool = True):
+        self.directory = Path(directory)
+        self.embedding = embedding
+        self.nprobe = nprobe
+        config = json.loads((self.directory / "config.json").read_text())
+        self.mode = config["mode"]
+        mmap_mode = "r" if mmap else None
+
+        self.vectors = np.load(self.directory / "vectors.npy", mmap_mode=mmap_mode)
+        self.scales = np.load(self.directory / "scales.npy") if self.mode == "int8" else None
+        if self.mode == "ivf":
+            self.centroids = np.load(self.directory / "ivf_centroids.npy")
+            self.list_order = np.load(self.directory / "ivf_order.npy")
+            self.list_offsets = np.load(self.directory / "ivf_offsets.npy")
+        if self.mode == "hnsw":
+            if hnswlib is None:
+                raise ImportError("hnswlib is required for mode='hnsw' (pip install hnswlib)")
+            self.hnsw = hnswlib.Index(space="ip", dim=self.vectors.shape[1])
+            self.hnsw.load_index(str(self.directory / "hnsw.bin"), max_elements=len(self.vectors))
+            self.hnsw.set_ef(config.get("ef", 128))
+
+        records = json.loads((self.directory / "documents.json").read_text())
+        self.documents = records["documents"]
+        self.metadatas = records["metadatas"]
+        self._masks = {}
+
+    def __len__(self):
+        return len(self.documents)
+
+    @classmethod
+    def build(cls, directory: str, embedding: Embeddings, vectors, documents: List[str], metadatas: List[dict],
+              mode: str = "flat", dtype: str = "float32", nlist: int | None = None, ef: int = 128):
+        if mode not in MODES:
+            raise ValueError(f"Unknown index mode {mode}, expected one of {MODES}")
+        directory = Path(directory)
+        directory.mkdir(parents=True, exist_ok=True)
+        vectors = _normalize(vectors)
+
+        if mode == "int8":
+            scales = np.maximum(np.abs(vectors).max(axis=1), 1e-12) / 127.0
+            np.save(directory / "scales.npy", scales.astype(np.float32))
+            np.save(directory / "vectors.npy", np.round(vectors / scales[:, None]).astype(np.int8))
+        else:
+            np.save(directory / "vectors.npy", vectors.astype(dtype))
+
+        if mode == "ivf":
+            nlist = nlist or max(1, int(np.sqrt(len(vectors))))
+            centroids = _kmeans(vectors, nlist)
+            assignment = np.concatenate([
+                np.argmax(vectors[i : i + BLOCK_ROWS] @ centroids.T, axis=1) for i in range(0, len(vectors), BLOCK_ROWS)
+            ])
+            order = np.argsort(assignment, kind="stable")
+            offsets = np.searchsorted(assignment[order], np.arange(nlist + 1))
+            np.save(directory / "ivf_centroids.npy", centroids)
+            np.save(directory / "ivf_order.npy", order)
+            np.save(directory / "ivf_offsets.npy", offsets)
+        if mode == "hnsw":
+            if hnswlib is None:
+                raise ImportError("hnswlib is required for mode='hnsw' (pip install hnswlib)")
+            graph = hnswlib.Index(space="ip", dim=vectors.shape[1])
+            graph.init_index(max_elements=len(vectors), ef_construction=200, M=16)
+            graph.add_items(vectors, np.arange(len(vectors)))
+            graph.save_index(str(directory / "hnsw.bin"))
+
+        (directory / "documents.json").write_text(json.dumps({"documents": documents, "metadatas": metadatas}))
+        (directory / "config.json").write_text(json.dumps({"mode": mode, "dtype": dtype, "ef": ef}))
+        logger.info(f"Built {mode} vector index with {len(vectors)} vectors in {directory}")
+        return cls(str(directory), embedding)
+
+    @classmethod
+    def from_chroma(cls, vectordb, directory: str, embedding: Embeddings, page_size: int = 10_000, **kwargs):
+        """
+        Export the vectors of a Chroma store into an in-process index.
+        """
+        vectors, documents, metadatas = [], [], []
+        offset = 0
+        while True:
+            page = vectordb.get(include=["embeddings", "documents", "metadatas"], limit=page_size, offset=offset)
+            if not len(page["ids"]):
+                break
+            vectors.append(np.asarray(page["embeddings"], dtype=np.float32))
+            documents.extend(page["documents"])
+            metadatas.extend(page["metadatas"])
+            offset += len(page["ids"])
+        if not vectors:
+            raise ValueError("Chroma store is empty, build it first")
+        return cls.build(directory, embedding, np.concatenate(vectors), documents, metadatas, **kwargs)
+
+    def _mask(self, where: dict | None) -> np.ndarray | None:
+        if not where:
+            return None
+        if "$and" in where:
+            mask = np.ones(len(self), dtype=bool)
+            for condition in where["$and"]:
+                mask &= self._mask(condition)
+            return mask
+        (key, value), = where.items()
+        if (key, value) not in self._masks:
+            self._masks[(key, value)] = np.fromiter(
+                (metadata.get(key) == value for metadata in self.metadatas), dtype=bool, count=len(self)
+            )
+        return self._masks[(key, value)]
+
+    def _rows(self, rows) -> np.ndarray:
+        block = np.asarray(self.vectors[rows], dtype=np.float32)
+        if self.scales is not None:
+            block *= self.scales[rows][:, None]
+        return block
+
+    def _scan(self, queries: np.ndarray, k: int, rows: np.ndarray | None):
+        """
+        Exact search over the given rows (all rows when None), in blocks to bound memory.
+        """
+        best_indices = np.empty((len(queries), 0), dtype=np.int64)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        total = len(self) if rows is None else len(rows)
+        for start in range(0, total, BLOCK_ROWS):
+            block_rows = np.arange(start, min(start + BLOCK_ROWS, total)) if rows is None else rows[start : start + BLOCK_ROWS]
+            block = self._rows(block_rows) if rows is not None or self.scales is not None \
+                else np.asarray(self.vectors[start : start + BLOCK_ROWS], dtype=np.float32)
+            indices, scores = _top_k(queries @ block.T, k)
+            best_indices = np.concatenate([best_indices, block_rows[indices]], axis=1)
+            best_scores = np.concatenate([best_scores, scores], axis=1)
+            order_indices, best_scores = _top_k(best_scores, k)
+            best_indices = np.take_along_axis(best_indices, order_indices, axis=1)
+        return best_indices, best_scores
+
+    def _probe_rows(self, lists: np.ndarray, k: int, allowed: np.ndarray | None) -> np.ndarray:
+        """
+        Sorted rows of the nprobe lists closest to the query (lists ordered by centroid score) that pass
+        the filter. When fewer than k rows qualify, twice as many lists are probed until k rows do; once
+        every list would be probed, the allowed rows are scanned directly (a flat scan).
+        """
+        wanted = min(k, len(self) if allowed is None else len(allowed))
+        nprobe = min(self.nprobe, len(lists))
+        while True:
+            if nprobe >= len(lists):
+                return np.arange(len(self)) if allowed is None else allowed
+            rows = np.sort(np.concatenate([
+                self.list_order[self.list_offsets[i] : self.list_offsets[i + 1]] for i in lists[:nprobe]
+            ]))
+            if allowed is not None:
+                rows = np.intersect1d(rows, allowed, assume_unique=True)
+            if len(rows) >= wanted:
+                return rows
+            nprobe *= 2
+
+    def search_vectors(self, queries, k: int = 4, filter: dict | None = None):
+        """
+        Batched search: (n, dim) queries -> (n, k) row indices and cosine scores, best first.
+        Rows with fewer than k matches (e.g. a selective filter) are padded with index -1 and score -inf.
+        """
+        queries = _normalize(np.atleast_2d(queries))
+        mask = self._mask(filter)
+        allowed = None if mask is None else np.flatnonzero(mask)
+
+        if self.mode == "ivf":
+            probes = np.argsort(-(queries @ self.centroids.T), axis=1)
+            results = []
+            for query, lists in zip(queries, probes):
+                results.append(self._scan(query[None, :], k, self._probe_rows(lists, k, allowed)))
+            return self._stack(results, k)
+
+        if self.mode == "hnsw":
+            fetch = k if mask is None else min(len(self), k * 8)
+            labels, distances = self.hnsw.knn_query(queries, k=min(fetch, len(self)))
+            results = []
+            for query, row_labels, row_distances in zip(queries, labels, distances):
+                keep = row_labels if mask is None else row_labels[mask[row_labels]]
+                if len(keep) < k and allowed is not None:
+                    # filter too selective for the graph, fall back to scanning the allowed rows
+                    results.append(self._scan(query[None, :], k, allowed))
+                else:
+                    scores = (1 - row_distances) if mask is None else (1 - row_distances)[mask[row_labels]]
+                    results.append((keep[None, :k].astype(np.int64), scores[None, :k].astype(np.float32)))
+            return self._stack(results, k)
+
+        return self._scan(queries, k, allowed)
+
+    @staticmethod
+    def _stack(results, k):
+        """
+        Concatenate per-query results, padding the short ones so that no query loses matches.
+        """
+        width = min(k, max(indices.shape[1] for indices, _ in results))
+        stacked_indices = np.full((len(results), width), -1, dtype=np.int64)
+        stacked_scores = np.full((len(results), width), -np.inf, dtype=np.float32)
+        for i, (indices, scores) in enumerate(results):
+            stacked_indices[i, :indices.shape[1]] = indices[0, :width]
+            stacked_scores[i, :scores.shape[1]] = scores[0, :width]
+        return stacked_indices, stacked_scores
+
+    def _document(self, row: int) -> Document:
+        return Document(page_content=self.documents[row], metadata=self.metadatas[row] or {})
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, filter: dict | None = None, **kwargs):
+        indices, _ = self.search_vectors(embedding, k, filter)
+        return [self._document(row) for row in indices[0] if row >= 0]
+
+    def similarity_search(self, query: str, k: int = 4, filter: dict | None = None, **kwargs) -> List[Document]:
+        return self.similarity_search_by_vector(self.embedding.embed_query(query), k, filter)
+
+    def batch_similarity_search(self, queries: List[str], k: int = 4, filter: dict | None = None) -> List[List[Document]]:
+        indices, _ = self.search_vectors(self.embedding.embed_documents(queries), k, filter)
+        return [[self._document(row) for row in row_indices if row >= 0] for row_indices in indices]
+
+    def max_marginal_relevance_search(self, query: str, k: int = 4, fetch_k: int = 20, lambda_mult: float = 0.5,
+                                      filter: dict | None = None, **kwargs) -> List[Document]:
+        return self.max_marginal_relevance_search_by_vector(
+            self.embedding.embed_query(query), k, fetch_k, lambda_mult, filter
+        )
+
+    def max_marginal_relevance_search_by_vector(self, embedding: List[float], k: int = 4, fetch_k: int = 20,
+                                                lambda_mult: float = 0.5, filter: dict | None = None,
+                                                **kwargs) -> List[Document]:
+        query_vector = _normalize(embedding)
+        indices, _ = self.search_vectors(query_vector, fetch_k, filter)
+        candidates = indices[0][indices[0] >= 0]
+        if not len(candidates):
+            return []
+        selected = maximal_marginal_relevance(query_vector, self._rows(candidates), lambda_mult=lambda_mult, k=k)
+        return [self._document(candidates[i]) for i in selected]
@@ -0,0 +1,31 @@
+import argparse
+import asyncio
+import logging
+
+from data.database import create_async_session
+from api.services.nutrition_service import backfill_macros
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Fill the numeric macro columns of meal plan items saved before they existed.")
+    parser.add_argument("--batch-size", type=int, default=1000, help="items updated per transaction")
+    return parser.parse_args()
+
+
+async def run(batch_size: int):
+    db_session = await create_async_session()
+    try:
+        return await backfill_macros(db_session, batch_size)
+    finally:
+        await db_session.close()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    updated = asyncio.run(run(args.batch_size))
+    logging.info(f"Backfill finished, {updated} items updated")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import argparse
+import logging
+from pathlib import Path
+
+from api.services.recipe_embedding_service import LocalServerEmbeddings
+from api.services.embedding_cache import EmbeddingCache, CachedEmbeddings
+from api.services.index_builder import IndexBuilder
+from api.services.vector_index import NumpyVectorIndex, MODES
+
+BASE_DIR = Path(__file__).resolve().parent    # -> backend/
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Build or update the chroma_recipes vector store from the recipes CSV.")
+    parser.add_argument("--csv", default=str(BASE_DIR / "data" / "RAW_recipes.csv"), help="recipes CSV (name, ingredients, tags)")
+    parser.add_argument("--persist-dir", default=str(BASE_DIR / "chroma_recipes"), help="Chroma persist directory")
+    parser.add_argument("--embedding-server", default="http://127.0.0.1:1234/v1", help="OpenAI-compatible embeddings server")
+    parser.add_argument("--model", default="text-embedding-nomic-embed-text-v1.5", help="embedding model name")
+    parser.add_argument("--cache-dir", default=str(BASE_DIR / "data" / "embedding_cache"), help="embedding cache directory, '' disables it")
+    parser.add_argument("--batch-size", type=int, default=2000, help="CSV rows per pipeline batch (one checkpoint each)")
+    parser.add_argument("--split-workers", type=int, default=2, help="processes splitting documents")
+    parser.add_argument("--embed-workers", type=int, default=2, help="threads sending batches to the embedding server")
+    parser.add_argument("--max-in-flight", type=int, default=4, help="concurrent embedding requests per embed worker")
+    parser.add_argument("--write-batch-size", type=int, default=1000, help="chunks per Chroma upsert")
+    parser.add_argument("--checkpoint", default=None, help="checkpoint file (default: <persist-dir>/index_checkpoint.json)")
+    parser.add_argument("--fresh", action="store_true", help="ignore an existing checkpoint")
+    parser.add_argument("--prune", action="store_true", help="delete chunks that are no longer in the CSV")
+    parser.add_argument("--export-index", default=None, help="also export an in-process index to this directory (e.g. recipe_index)")
+    parser.add_argument("--index-mode", choices=MODES, default="flat", help="in-process index mode")
+    parser.add_argument("--index-dtype", choices=("float32", "float16"), default="float32", help="storage type of flat/ivf/hnsw vectors")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    embedding = LocalServerEmbeddings(base_url=args.embedding_server, model=args.model, max_in_flight=args.max_in_flight)
+    if args.cache_dir:
+        embedding = CachedEmbeddings(embedding, EmbeddingCache(args.cache_dir, args.model))
+
+    builder = IndexBuilder(
+        csv_path=args.csv,
+        persist_directory=args.persist_dir,
+        embedding=embedding,
+        batch_size=args.batch_size,
+        split_workers=args.split_workers,
+        embed_workers=args.embed_workers,
+        write_batch_size=args.write_batch_size,
+        checkpoint_path=args.checkpoint,
+    )
+    vectordb = builder.run(resume=not args.fresh, prune=args.prune)
+
+    if args.export_index:
+        NumpyVectorIndex.from_chroma(vectordb, args.export_index, embedding, mode=args.index_mode, dtype=args.index_dtype)
+
+
+if __name__ == "__main__":
+    main()
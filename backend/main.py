@@ -1,22 +1,46 @@
+import asyncio
 import logging
 import os
+from contextlib import asynccontextmanager
 
-from data.database import get_db_session
+from data.database import get_db_session, init_async_db, engine, async_engine
 from starlette.middleware.cors import CORSMiddleware
 from fastapi import Depends
+from fastapi.responses import JSONResponse
 from models.user import User
 from pydantic import BaseModel
-from api.routes import users, uploaded_files, meal_plans
+from api.routes import users, uploaded_files, meal_plans, nutrition
+from api.services.file_service import shutdown_pdf_pool
+from api.services.ocr_service import close_ocr_backend
+from api.services.resources import resources, warmup_enabled
 
 
 root = logging.getLogger()
 logging.basicConfig(level=logging.DEBUG)
 
 
+@asynccontextmanager
+async def lifespan(_app):
+    await init_async_db()
+    await meal_plans.job_queue.start()
+    # clients are created lazily; warming them up in the background keeps startup fast
+    warm_up = asyncio.create_task(resources.warm_up()) if warmup_enabled else None
+    resources.start_health_checks()
+    yield
+    if warm_up is not None:
+        warm_up.cancel()
+    await meal_plans.job_queue.stop()
+    shutdown_pdf_pool()
+    await close_ocr_backend()
+    await resources.aclose()
+    await async_engine.dispose()
+    engine.dispose()
+
+
 def make_app():
     from fastapi import FastAPI
 
-    _app = FastAPI()
+    _app = FastAPI(lifespan=lifespan)
 
     origins = [
         "http://localhost",
@@ -27,6 +51,7 @@ def make_app():
     _app.include_router(users.router)
     _app.include_router(uploaded_files.router)
     _app.include_router(meal_plans.router)
+    _app.include_router(nutrition.router)
 
 
     _app.add_middleware(
@@ -44,3 +69,14 @@ app = make_app()
 def read_root():
     return {"message": "Welcome to the FastAPI backend!"}
 
+
+@app.get("/health")
+def liveness():
+    return {"status": "ok"}
+
+
+@app.get("/ready")
+async def readiness():
+    health = await resources.health()
+    return JSONResponse(status_code=200 if health["ok"] else 503, content=health)
+
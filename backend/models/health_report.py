@@ -8,7 +8,7 @@ class HealthReport(Base):
     __tablename__ = 'health_reports'
     id = Column(Integer, primary_key=True, autoincrement=True)
     report_text = Column(String(512), nullable=False)
-    user_id = Column(String(255), ForeignKey("users.id"), nullable=False)
+    user_id = Column(String(255), ForeignKey("users.id"), nullable=False, index=True)
     user = relationship(User)
 
     def __init__(self, user_id, text) -> None:
@@ -2,6 +2,7 @@ from sqlalchemy import Column, Integer, String, ForeignKey, Date
 from data.database import Base
 from sqlalchemy.orm import relationship
 from .user import User
+from .meal_plan_version import MealPlanVersion
 
 
 class MealPlan(Base):
@@ -10,8 +11,11 @@ class MealPlan(Base):
     name = Column(String(100))
     description = Column(String(512))
     date_created = Column(Date)
-    user_id = Column(String(255), ForeignKey("users.id"), nullable=False)
+    user_id = Column(String(255), ForeignKey("users.id"), nullable=False, index=True)
+    version_id = Column(Integer, ForeignKey("meal_plan_versions.id"), nullable=True) # history entry this plan comes from
     user = relationship(User)
+    items = relationship("MealPlanItem", back_populates="meal_plan", order_by="MealPlanItem.id",
+                         cascade="all, delete-orphan")
 
     def __init__(self, user_id, name, description, date_created) -> None:
         self.user_id = user_id
@@ -25,4 +29,5 @@ class MealPlan(Base):
                 name: {self.name} \
                 description: {self.description} \
                 date_created: {self.date_created} \
+                version_id: {self.version_id} \
                 user_id: {self.user_id}>'
@@ -13,10 +13,16 @@ class MealPlanItem(Base):
     dinner = Column(String(255))
     snack = Column(String(255))
     macros = Column(String(255))
-    meal_plan_id = Column(Integer, ForeignKey("meal_plans.id", ondelete='CASCADE'), nullable=False)
-    meal_plan = relationship(MealPlan)
+    # parsed from macros, grams except calories (kcal)
+    calories = Column(Float, nullable=True)
+    protein = Column(Float, nullable=True)
+    carbs = Column(Float, nullable=True)
+    fat = Column(Float, nullable=True)
+    meal_plan_id = Column(Integer, ForeignKey("meal_plans.id", ondelete='CASCADE'), nullable=False, index=True)
+    meal_plan = relationship(MealPlan, back_populates="items")
 
-    def __init__(self, breakfast, lunch, dinner, snack, meal_slot, macros, meal_plan_id) -> None:
+    def __init__(self, breakfast, lunch, dinner, snack, meal_slot, macros, meal_plan_id,
+                 calories=None, protein=None, carbs=None, fat=None) -> None:
         self.meal_plan_id = meal_plan_id
         self.meal_slot = meal_slot
         self.breakfast = breakfast
@@ -24,11 +30,14 @@ class MealPlanItem(Base):
         self.dinner = dinner
         self.snack = snack
         self.macros = macros
+        self.calories = calories
+        self.protein = protein
+        self.carbs = carbs
+        self.fat = fat
 
     def __repr__(self) -> str:
         return f'<MealPlanItem:\n \
                 id: {self.id}\n \
-                name: {self.name} \
                 meal_slot: {self.meal_slot} \
                 calories: {self.calories} \
                 meal_plan_id: {self.meal_plan_id}>'
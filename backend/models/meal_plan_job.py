@@ -0,0 +1,32 @@
+from sqlalchemy import Column, String, Text, ForeignKey, DateTime, Boolean
+from data.database import Base
+from sqlalchemy.orm import relationship
+from .user import User
+
+
+class MealPlanJob(Base):
+    __tablename__ = 'meal_plan_jobs'
+    id = Column(String(36), primary_key=True)
+    status = Column(String(20), nullable=False) # pending, running, done, failed
+    result = Column(Text, nullable=True) # generated plan as JSON
+    error = Column(String(512), nullable=True)
+    created_at = Column(DateTime)
+    updated_at = Column(DateTime)
+    batch_id = Column(String(36), nullable=True, index=True) # set for jobs of a batch regeneration
+    use_cache = Column(Boolean, nullable=True)
+    mode = Column(String(20), nullable=True) # generation mode, None for the configured default
+    user_id = Column(String(255), ForeignKey("users.id"), nullable=False, index=True)
+    user = relationship(User)
+
+    def __init__(self, id, user_id, status, created_at) -> None:
+        self.id = id
+        self.user_id = user_id
+        self.status = status
+        self.created_at = created_at
+        self.updated_at = created_at
+
+    def __repr__(self) -> str:
+        return f'<MealPlanJob:\n \
+                id: {self.id}\n \
+                status: {self.status} \
+                user_id: {self.user_id}>'
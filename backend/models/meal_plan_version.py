@@ -0,0 +1,34 @@
+from sqlalchemy import Column, Integer, String, ForeignKey, Date, DateTime, LargeBinary, Index
+from data.database import Base
+from sqlalchemy.orm import relationship
+from .user import User
+
+
+class MealPlanVersion(Base):
+    __tablename__ = 'meal_plan_versions'
+    __table_args__ = (
+        Index('ix_meal_plan_versions_user_id_id', 'user_id', 'id'), # keyset pagination of a user's history
+    )
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    name = Column(String(100))
+    description = Column(String(512))
+    date_created = Column(Date)
+    created_at = Column(DateTime)
+    payload = Column(LargeBinary, nullable=False) # zlib-compressed JSON of the whole plan
+    user_id = Column(String(255), ForeignKey("users.id"), nullable=False)
+    user = relationship(User)
+
+    def __init__(self, user_id, name, description, date_created, created_at, payload) -> None:
+        self.user_id = user_id
+        self.name = name
+        self.description = description
+        self.date_created = date_created
+        self.created_at = created_at
+        self.payload = payload
+
+    def __repr__(self) -> str:
+        return f'<MealPlanVersion:\n \
+                id: {self.id}\n \
+                name: {self.name} \
+                date_created: {self.date_created} \
+                user_id: {self.user_id}>'
@@ -0,0 +1,29 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import pytest
+
+# the backend modules are imported as top-level packages (api, data, models), as uvicorn main:app does
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+# a throwaway SQLite database, set before data.database creates its engines
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp()}/test.db"
+
+
+@pytest.fixture
+def database():
+    """
+    Empty tables (and plan caches) for a test that uses the database.
+    """
+    from api.services.plan_cache import latest_plan_cache, plan_cache
+    from data.database import Base, engine, init_db
+    from models import health_report, meal_plan, meal_plan_item, meal_plan_job, meal_plan_version, user  # noqa: F401
+
+    init_db()
+    yield
+    with engine.begin() as connection:
+        for table in reversed(Base.metadata.sorted_tables):
+            connection.execute(table.delete())
+    latest_plan_cache.clear()
+    plan_cache.clear()
@@ -0,0 +1,17 @@
+from api.services.meal_plan_formatter import WEEK_DAYS
+
+
+def make_day(weekday, **fields):
+    return {
+        "meal_slot": weekday,
+        "breakfast": f"Oats {weekday}",
+        "lunch": f"Salad {weekday}",
+        "dinner": f"Tofu {weekday}",
+        "snack": "Apple",
+        "macros": "Carbs: 200g, Protein: 90g, Fats: 60g, Calories: 1800 kcal",
+        **fields,
+    }
+
+
+def make_plan(name="Plan", days=WEEK_DAYS):
+    return {"name": name, "description": "A week", "plan": [make_day(day) for day in days]}
@@ -0,0 +1,65 @@
+import threading
+
+import numpy as np
+
+from api.services.embedding_cache import EmbeddingCache, text_hash
+
+DIM = 8
+
+
+def vector(text: str) -> list:
+    return np.random.default_rng(int(text_hash(text)[:8], 16)).normal(size=DIM).astype(np.float32).tolist()
+
+
+def test_round_trip(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "model")
+    cache.put_many(["a", "b", "a"], [vector("a"), vector("b"), vector("a")])
+
+    assert len(cache) == 2
+    assert cache.get_many(["b", "missing", "a"]) == [vector("b"), None, vector("a")]
+    assert EmbeddingCache(str(tmp_path), "model").get_many(["a"]) == [vector("a")]
+
+
+def test_two_instances_share_a_directory(tmp_path):
+    first = EmbeddingCache(str(tmp_path), "model")
+    second = EmbeddingCache(str(tmp_path), "model")
+
+    first.put_many(["a"], [vector("a")])
+    # second still counts 0 rows, its append must not reuse row 0
+    second.put_many(["b"], [vector("b")])
+    first.put_many(["c", "b"], [vector("c"), vector("b")])
+
+    for cache in (first, second, EmbeddingCache(str(tmp_path), "model")):
+        assert cache.get_many(["a", "b", "c"]) == [vector("a"), vector("b"), vector("c")]
+
+
+def test_concurrent_writers(tmp_path):
+    caches = [EmbeddingCache(str(tmp_path), "model") for _ in range(4)]
+    texts = [f"text {i}" for i in range(400)]
+
+    def write(cache, offset):
+        for start in range(offset, len(texts), 40):
+            batch = texts[start : start + 10]
+            cache.put_many(batch, [vector(text) for text in batch])
+
+    threads = [threading.Thread(target=write, args=(cache, i * 10)) for i, cache in enumerate(caches)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    reopened = EmbeddingCache(str(tmp_path), "model")
+    assert len(reopened) == len(texts)
+    assert reopened.get_many(texts) == [vector(text) for text in texts]
+
+
+def test_partial_row_is_cut_on_open(tmp_path):
+    cache = EmbeddingCache(str(tmp_path), "model")
+    cache.put_many(["a"], [vector("a")])
+    with open(cache.matrix_path, "ab") as matrix_file:
+        matrix_file.write(b"\0" * 5)  # crash in the middle of an append
+
+    reopened = EmbeddingCache(str(tmp_path), "model")
+    assert cache.matrix_path.stat().st_size == 4 * DIM
+    reopened.put_many(["b"], [vector("b")])
+    assert reopened.get_many(["a", "b"]) == [vector("a"), vector("b")]
@@ -0,0 +1,61 @@
+import asyncio
+
+from api.services.cache import GenerationCache
+from tests.plans import make_plan
+
+
+def test_set_if_current_drops_values_loaded_before_an_invalidate():
+    cache = GenerationCache(10, ttl=60)
+
+    generation = cache.generation("u1")
+    cache.invalidate("u1")  # a plan was written while the old one was being read
+    assert not cache.set_if_current("u1", "old plan", generation)
+    assert cache.get("u1") is None
+
+    assert cache.set_if_current("u1", "new plan", cache.generation("u1"))
+    assert cache.get("u1") == "new plan"
+
+
+def test_zero_size_disables_the_cache():
+    cache = GenerationCache(0, ttl=60)
+
+    cache.set_if_current("u1", "plan", cache.generation("u1"))
+
+    assert cache.get("u1") is None
+
+
+def test_read_racing_a_write_does_not_cache_the_old_plan(database):
+    from data.database import create_async_session
+    from models.user import User
+    from api.services.meal_plan_service import get_latest_meal_plan, replace_meal_plans
+    from api.services.plan_cache import latest_plan_cache
+
+    async def scenario():
+        reader = await create_async_session()
+        writer = await create_async_session()
+        try:
+            writer.add(User("u1"))
+            await writer.commit()
+            await replace_meal_plans(writer, {"u1": make_plan("Old")})
+
+            # the reader misses the cache and loads the old plan; the new one is committed
+            # (and the cache invalidated) before the reader gets to cache what it read
+            scalars = reader.scalars
+
+            async def scalars_then_write(*args, **kwargs):
+                result = await scalars(*args, **kwargs)
+                await replace_meal_plans(writer, {"u1": make_plan("New")})
+                return result
+
+            reader.scalars = scalars_then_write
+            assert (await get_latest_meal_plan(reader, "u1"))["name"] == "Old"
+            assert latest_plan_cache.get("u1") is None
+
+            reader.scalars = scalars
+            assert (await get_latest_meal_plan(reader, "u1"))["name"] == "New"
+            assert latest_plan_cache.get("u1")["name"] == "New"
+        finally:
+            await reader.close()
+            await writer.close()
+
+    asyncio.run(scenario())
@@ -0,0 +1,226 @@
+import asyncio
+import threading
+
+import httpx
+import pytest
+
+from api.services import llm_router
+from api.services.llm_router import BackendRouter, RoutedEmbeddings
+from api.services.recipe_embedding_service import EmbeddingError
+
+URLS = ["http://a/v1", "http://b/v1"]
+
+
+class FakeClient:
+    """
+    Answers with its base_url, or raises the configured error.
+    """
+    def __init__(self, base_url: str):
+        self.base_url = base_url
+        self.model = "fake-embedding"
+        self.error = None
+        self.calls = 0
+
+    def answer(self):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        return self.base_url
+
+    async def complete(self):
+        await asyncio.sleep(0)
+        return self.answer()
+
+    async def stream(self, items: int = 3, fail_after: int | None = None):
+        self.answer()
+        for i in range(items):
+            if fail_after is not None and i == fail_after:
+                raise httpx.ReadError("connection lost")
+            yield f"{self.base_url}:{i}"
+
+    async def aembed_documents(self, texts):
+        self.answer()
+        return [[1.0, 0.0] for _ in texts]
+
+    def embed_documents(self, texts):
+        self.answer()
+        return [[1.0, 0.0] for _ in texts]
+
+
+class StatusError(Exception):
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+@pytest.fixture
+def router():
+    return BackendRouter("Test", URLS, FakeClient)
+
+
+def clients(router):
+    return [backend.client for backend in router.backends]
+
+
+def test_requests_take_turns_between_idle_backends(router):
+    answers = [asyncio.run(router.call(lambda client: client.complete())) for _ in range(4)]
+
+    assert sorted(answers) == sorted(URLS * 2)
+    assert [backend.outstanding for backend in router.backends] == [0, 0]
+
+
+def test_least_outstanding_backend_is_picked(router):
+    router.backends[0].outstanding = 2
+
+    assert router.pick() is router.backends[1]
+
+
+@pytest.mark.parametrize("error", [httpx.ConnectError("refused"), StatusError(503), TimeoutError()])
+def test_backend_failure_fails_over(router, error):
+    first, second = clients(router)
+    first.error = error
+    router.backends[1].outstanding = 1  # send the first attempt to the failing backend
+
+    assert asyncio.run(router.call(lambda client: client.complete())) == second.base_url
+    assert router.backends[0].failures == 1 and router.backends[0].errors == 1
+    assert router.backends[1].failures == 0
+
+
+def test_request_errors_do_not_fail_over(router):
+    first, second = clients(router)
+    first.error = second.error = StatusError(400)
+
+    with pytest.raises(StatusError):
+        asyncio.run(router.call(lambda client: client.complete()))
+    assert first.calls + second.calls == 1
+    assert [backend.failures for backend in router.backends] == [0, 0]
+
+
+def test_last_failure_is_raised(router):
+    for client in clients(router):
+        client.error = httpx.ConnectError("refused")
+
+    with pytest.raises(httpx.ConnectError):
+        asyncio.run(router.call(lambda client: client.complete()))
+    assert [backend.failures for backend in router.backends] == [1, 1]
+
+
+def test_failing_backend_is_ejected_and_restored(router, monkeypatch):
+    monkeypatch.setattr(llm_router, "eject_failures", 2)
+    first, second = clients(router)
+    first.error = httpx.ConnectError("refused")
+
+    for _ in range(4):
+        asyncio.run(router.call(lambda client: client.complete()))
+    assert not router.backends[0].available
+    calls = first.calls
+    for _ in range(4):
+        assert asyncio.run(router.call(lambda client: client.complete())) == second.base_url
+    assert first.calls == calls
+
+    first.error = None
+    router.backends[0].ejected_until = 0.0  # ejection over
+    router.backends[1].outstanding = 1
+    assert asyncio.run(router.call(lambda client: client.complete())) == first.base_url
+    assert router.backends[0].failures == 0
+
+
+def test_all_backends_ejected_uses_the_first_to_come_back(router):
+    router.backends[0].ejected_until = float("inf")
+    router.backends[1].ejected_until = 1e18
+
+    assert router.pick() is router.backends[1]
+
+
+def test_health_check_ejects_and_restores(router, monkeypatch):
+    monkeypatch.setattr(llm_router, "eject_failures", 1)
+    down = {URLS[0]}
+
+    def handler(request):
+        base_url = str(request.url).rsplit("/models", 1)[0]
+        return httpx.Response(503 if base_url in down else 200, json={"data": []})
+
+    async def check():
+        async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as client:
+            return await router.check(client)
+
+    result = asyncio.run(check())
+    assert result["ok"] and [backend["ok"] for backend in result["backends"]] == [False, True]
+    assert not router.backends[0].available
+
+    down.clear()
+    asyncio.run(check())
+    assert router.backends[0].available
+
+
+def test_stream_fails_over_only_before_the_first_item(router):
+    first, second = clients(router)
+    router.backends[1].outstanding = 1
+
+    async def collect(**kwargs):
+        return [item async for item in router.stream(lambda client: client.stream(**kwargs))]
+
+    first.error = httpx.ConnectError("refused")
+    assert asyncio.run(collect()) == [f"{second.base_url}:{i}" for i in range(3)]
+
+    first.error = None
+    router.backends[0].ejected_until = 0.0
+    router.backends[1].outstanding = 1
+    with pytest.raises(httpx.ReadError):
+        asyncio.run(collect(fail_after=1))
+    assert second.calls == 1
+
+
+def test_sync_calls_count_as_outstanding(router):
+    started, release = threading.Event(), threading.Event()
+
+    def slow(client):
+        started.set()
+        release.wait(5)
+        return client.base_url
+
+    thread = threading.Thread(target=router.call_sync, args=(slow,))
+    thread.start()
+    started.wait(5)
+    busy = [backend for backend in router.backends if backend.outstanding == 1]
+    assert len(busy) == 1
+    assert router.pick() is not busy[0]
+    release.set()
+    thread.join()
+    assert [backend.outstanding for backend in router.backends] == [0, 0]
+
+
+def test_embeddings_fail_over_when_a_whole_batch_fails(router):
+    first, second = clients(router)
+    embeddings = RoutedEmbeddings(router)
+    router.backends[1].outstanding = 1
+    first.error = EmbeddingError("all failed", [None, None])
+
+    assert asyncio.run(embeddings.aembed_documents(["a", "b"])) == [[1.0, 0.0], [1.0, 0.0]]
+    assert second.calls == 1 and router.backends[0].failures == 1
+
+
+def test_embeddings_partial_failure_is_raised_without_failover(router):
+    first, second = clients(router)
+    embeddings = RoutedEmbeddings(router)
+    first.error = second.error = EmbeddingError("one failed", [[1.0, 0.0], None])
+
+    with pytest.raises(EmbeddingError):
+        embeddings.embed_documents(["a", "b"])
+    assert first.calls + second.calls == 1
+    assert [backend.failures for backend in router.backends] == [0, 0]
+
+
+def test_llm_concurrency_scales_with_the_backends():
+    import os
+    import subprocess
+    import sys
+    from pathlib import Path
+
+    env = {**os.environ, "LLM_BASE_URLS": "http://a/v1, http://b/v1,http://c/v1", "LLM_MAX_CONCURRENCY": "2"}
+    output = subprocess.run(
+        [sys.executable, "-c", "from api.services.llm_service import llm_limiter; print(llm_limiter.max_concurrency)"],
+        cwd=Path(__file__).resolve().parent.parent, env=env, capture_output=True, text=True, check=True,
+    ).stdout
+
+    assert output.strip() == "6"
@@ -0,0 +1,98 @@
+import json
+
+import pytest
+
+from api.services.meal_plan_formatter import (
+    MEAL_MAX_CHARS, NAME_MAX_CHARS, WEEK_DAYS, MealPlanFormatError, is_complete_meal_plan, parse_macros,
+    parse_meal_plan, repair_json, validate_meal_plan_day,
+)
+from tests.plans import make_day, make_plan
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('Sure! ```json\n{"a": 1, "b": [1, 2,],}\n``` Enjoy!', {"a": 1, "b": [1, 2]}),
+    ("{'a': 'x', b: True, c: None}", {"a": "x", "b": True, "c": None}),
+    ('{"a": "x" "b": 2}', {"a": "x", "b": 2}),
+    ('{"a": 1, // comment\n "b": 2}', {"a": 1, "b": 2}),
+    ('{"name": "P", "plan": [{"meal_slot": "Mon', {"name": "P", "plan": [{"meal_slot": "Mon"}]}),
+])
+def test_repair_json(text, expected):
+    assert json.loads(repair_json(text)) == expected
+
+
+def test_repair_json_without_object():
+    with pytest.raises(MealPlanFormatError):
+        repair_json("I cannot create a meal plan.")
+
+
+def test_parse_meal_plan():
+    header, days = parse_meal_plan("Here is your plan:\n```json\n" + json.dumps(make_plan()) + "\n```")
+
+    assert header == {"name": "Plan", "description": "A week"}
+    assert list(days) == WEEK_DAYS
+    assert days["Friday"]["dinner"] == "Tofu Friday"
+
+
+def test_parse_meal_plan_drops_invalid_and_duplicate_days():
+    plan = make_plan()
+    del plan["plan"][2]["breakfast"]
+    plan["plan"].append(make_day("Monday", dinner="Another dinner"))
+
+    _, days = parse_meal_plan(json.dumps(plan))
+
+    assert "Wednesday" not in days
+    assert len(days) == 6
+    assert days["Monday"]["dinner"] == "Tofu Monday"
+
+
+def test_parse_meal_plan_keeps_the_valid_days_of_a_truncated_response():
+    text = json.dumps(make_plan())
+    _, days = parse_meal_plan(text[: text.index('"Thursday"') + 20])
+
+    assert list(days) == ["Monday", "Tuesday", "Wednesday"]
+
+
+def test_parse_meal_plan_normalizes_weekdays():
+    plan = {"name": "Plan", "description": "A week", "plan": [make_day("day 1 - monday"), make_day("TUESDAY")]}
+
+    _, days = parse_meal_plan(json.dumps(plan), wanted_days=["Monday", "Tuesday"])
+
+    assert [day["meal_slot"] for day in days.values()] == ["Monday", "Tuesday"]
+
+
+def test_over_long_meals_are_invalid():
+    assert validate_meal_plan_day(make_day("Monday", dinner="x" * MEAL_MAX_CHARS)) is not None
+    assert validate_meal_plan_day(make_day("Monday", dinner="x" * (MEAL_MAX_CHARS + 1))) is None
+    assert validate_meal_plan_day(make_day("Monday", macros="Calories: 1800 " * 30)) is None
+
+    plan = make_plan()
+    plan["plan"][4]["lunch"] = "A very long lunch. " * 20
+    _, days = parse_meal_plan(json.dumps(plan))
+    assert "Friday" not in days and len(days) == 6
+
+
+def test_long_plan_name_is_cut():
+    plan = {**make_plan(), "name": "N" * 300}
+
+    header, _ = parse_meal_plan(json.dumps(plan))
+
+    assert header["name"] == "N" * NAME_MAX_CHARS
+
+
+def test_is_complete_meal_plan():
+    assert is_complete_meal_plan(make_plan())
+    assert not is_complete_meal_plan(make_plan(days=WEEK_DAYS[:6]))
+    assert not is_complete_meal_plan(make_plan(days=WEEK_DAYS[::-1]))
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Carbs: 200g, Protein: 90g, Fats: 60g, Calories: 1800 kcal",
+     {"calories": 1800, "protein": 90, "carbs": 200, "fat": 60}),
+    ("Calories: 1,800 kcal, Protein: ~90 g, Fat: 60-70g",
+     {"calories": 1800, "protein": 90, "carbs": None, "fat": 65}),
+    ("about 2000 kcal, 120g protein", {"calories": 2000, "protein": 120, "carbs": None, "fat": None}),
+    ({"protein": "90g"}, {"calories": None, "protein": 90, "carbs": None, "fat": None}),
+    (None, {"calories": None, "protein": None, "carbs": None, "fat": None}),
+])
+def test_parse_macros(text, expected):
+    assert parse_macros(text) == expected
@@ -0,0 +1,181 @@
+import asyncio
+from datetime import datetime, timedelta
+
+from tests.plans import make_plan
+
+
+def run(scenario):
+    """
+    Run scenario(db_session) on a fresh session.
+    """
+    from data.database import create_async_session
+
+    async def main():
+        db_session = await create_async_session()
+        try:
+            return await scenario(db_session)
+        finally:
+            await db_session.close()
+
+    return asyncio.run(main())
+
+
+async def add_users(db_session, *user_ids):
+    from models.user import User
+
+    db_session.add_all([User(user_id) for user_id in user_ids])
+    await db_session.commit()
+
+
+async def wait_for(db_session, job_ids, timeout: float = 5):
+    from models.meal_plan_job import MealPlanJob
+    from sqlalchemy import select
+
+    for _ in range(int(timeout / 0.02)):
+        statuses = (await db_session.execute(
+            select(MealPlanJob.status).where(MealPlanJob.id.in_(job_ids)).execution_options(populate_existing=True)
+        )).scalars().all()
+        if all(status in ("done", "failed") for status in statuses):
+            return
+        await asyncio.sleep(0.02)
+    raise TimeoutError(f"Jobs still running: {statuses}")
+
+
+def make_queue(calls, **kwargs):
+    from api.services.meal_plan_jobs import MealPlanJobQueue
+
+    async def handler(db_session, user_id, use_cache, mode):
+        calls.append(user_id if mode is None else (user_id, mode))
+        await asyncio.sleep(0.05)
+        return make_plan(user_id)
+
+    async def batch_handler(db_session, user_ids, use_cache):
+        calls.append(list(user_ids))
+        return {"regenerated": {user_id: make_plan(user_id) for user_id in user_ids if user_id != "bad"},
+                "failed": {"bad": "LLM error"} if "bad" in user_ids else {}}
+
+    return MealPlanJobQueue(handler=handler, batch_handler=batch_handler, **kwargs)
+
+
+def test_submit_merges_requests_of_the_same_user(database):
+    from api.services.meal_plan_jobs import job_to_dict
+
+    calls = []
+
+    async def scenario(db_session):
+        await add_users(db_session, "u1")
+        queue = make_queue(calls, num_workers=2)
+        await queue.start()
+        try:
+            first = await queue.submit(db_session, "u1")
+            second = await queue.submit(db_session, "u1")
+            assert first.id == second.id
+            await wait_for(db_session, [first.id])
+            await db_session.refresh(first)
+            third = await queue.submit(db_session, "u1")
+            assert third.id != first.id
+            await wait_for(db_session, [third.id])
+            return job_to_dict(first)
+        finally:
+            await queue.stop()
+
+    job = run(scenario)
+    assert job["status"] == "done" and job["result"]["name"] == "u1"
+    assert calls == ["u1", "u1"]
+
+
+def test_a_job_held_by_two_queues_runs_once(database):
+    from models.meal_plan_job import MealPlanJob
+
+    calls = []
+
+    async def scenario(db_session):
+        await add_users(db_session, "u1")
+        db_session.add(MealPlanJob("job-1", "u1", "pending", datetime.now()))
+        await db_session.commit()
+        # two uvicorn workers both queued the pending job and pick it up at the same time
+        queues = [make_queue(calls), make_queue(calls)]
+        await asyncio.gather(*(queue._run("job-1") for queue in queues))
+
+    run(scenario)
+    assert calls == ["u1"]
+
+
+def test_restart_recovers_pending_and_stale_jobs_only(database):
+    from models.meal_plan_job import MealPlanJob
+    from sqlalchemy import select
+
+    calls = []
+
+    async def scenario(db_session):
+        await add_users(db_session, "pending", "stale", "live")
+        now = datetime.now()
+        db_session.add(MealPlanJob("pending-job", "pending", "pending", now))
+        stale = MealPlanJob("stale-job", "stale", "running", now - timedelta(hours=2))
+        live = MealPlanJob("live-job", "live", "running", now - timedelta(seconds=5))
+        db_session.add_all([stale, live])
+        await db_session.commit()
+
+        queue = make_queue(calls, stale_seconds=600)
+        await queue.start()
+        try:
+            await wait_for(db_session, ["pending-job", "stale-job"])
+        finally:
+            await queue.stop()
+        return dict((await db_session.execute(
+            select(MealPlanJob.id, MealPlanJob.status).execution_options(populate_existing=True)
+        )).all())
+
+    statuses = run(scenario)
+    assert sorted(calls) == ["pending", "stale"]
+    assert statuses == {"pending-job": "done", "stale-job": "done", "live-job": "running"}
+
+
+def test_batch_status(database):
+    from api.services.meal_plan_jobs import batch_status
+    from models.meal_plan_job import MealPlanJob
+    from sqlalchemy import select
+
+    calls = []
+
+    async def scenario(db_session):
+        await add_users(db_session, "a", "b", "c", "bad", "busy")
+        queue = make_queue(calls, batch_size=2)
+        await queue.start()
+        try:
+            busy = await queue.submit(db_session, "busy")
+            batch = await queue.submit_batch(db_session, ["a", "b", "a", "ghost", "busy", "c", "bad"])
+            job_ids = (await db_session.scalars(
+                select(MealPlanJob.id).where(MealPlanJob.batch_id == batch["batch_id"])
+            )).all()
+            await wait_for(db_session, [*job_ids, busy.id])
+            return batch, await batch_status(db_session, batch["batch_id"]), await batch_status(db_session, "nope")
+        finally:
+            await queue.stop()
+
+    batch, status, unknown = run(scenario)
+    assert batch["queued"] == 4
+    assert batch["skipped"] == {"ghost": "User not found", "busy": "Already queued"}
+    assert status == {"batch_id": batch["batch_id"], "total": 4, "pending": 0, "running": 0, "done": 3,
+                      "failed": 1, "failed_users": {"bad": "LLM error"}}
+    assert unknown is None
+    batches = [call for call in calls if isinstance(call, list)]
+    assert [len(users) for users in batches] == [2, 2]
+    assert sorted(sum(batches, [])) == ["a", "b", "bad", "c"]
+
+
+def test_job_keeps_its_generation_mode(database):
+    calls = []
+
+    async def scenario(db_session):
+        await add_users(db_session, "u1")
+        queue = make_queue(calls)
+        await queue.start()
+        try:
+            job = await queue.submit(db_session, "u1", mode="outline")
+            await wait_for(db_session, [job.id])
+        finally:
+            await queue.stop()
+
+    run(scenario)
+    assert calls == [("u1", "outline")]
@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+from tests.plans import make_plan
+
+
+def run(scenario):
+    from data.database import create_async_session
+
+    async def main():
+        db_session = await create_async_session()
+        try:
+            return await scenario(db_session)
+        finally:
+            await db_session.close()
+
+    return asyncio.run(main())
+
+
+async def add_user_with_plans(db_session, user_id, names):
+    from models.user import User
+    from api.services.meal_plan_service import save_meal_plan
+
+    db_session.add(User(user_id))
+    await db_session.commit()
+    for name in names:
+        await save_meal_plan(db_session, user_id, make_plan(name))
+
+
+def test_history_pages_follow_next_before(database):
+    from api.services.meal_plan_versions import list_meal_plan_versions
+
+    async def scenario(db_session):
+        await add_user_with_plans(db_session, "u1", [f"Plan {i}" for i in range(5)])
+        await add_user_with_plans(db_session, "u2", ["Other"])
+
+        pages, before = [], None
+        while True:
+            page = await list_meal_plan_versions(db_session, "u1", before=before, limit=2)
+            pages.append([version["name"] for version in page["versions"]])
+            before = page["next_before"]
+            if before is None:
+                return pages
+
+    assert run(scenario) == [["Plan 4", "Plan 3"], ["Plan 2", "Plan 1"], ["Plan 0"]]
+
+
+def test_last_full_page_has_no_next_before(database):
+    from api.services.meal_plan_versions import list_meal_plan_versions
+
+    async def scenario(db_session):
+        await add_user_with_plans(db_session, "u1", ["Plan 0", "Plan 1"])
+        return await list_meal_plan_versions(db_session, "u1", limit=2)
+
+    page = run(scenario)
+
+    assert [version["name"] for version in page["versions"]] == ["Plan 1", "Plan 0"]
+    assert page["next_before"] is None
+
+
+def test_restore_makes_an_old_version_current_without_a_new_entry(database):
+    from api.services.meal_plan_service import get_latest_meal_plan, restore_meal_plan_version
+    from api.services.meal_plan_versions import list_meal_plan_versions
+
+    async def scenario(db_session):
+        await add_user_with_plans(db_session, "u1", ["First", "Second"])
+        first = (await list_meal_plan_versions(db_session, "u1"))["versions"][-1]
+        restored = await restore_meal_plan_version(db_session, "u1", first["version_id"])
+        current = await get_latest_meal_plan(db_session, "u1")
+        history = await list_meal_plan_versions(db_session, "u1")
+        return first, restored, current, history
+
+    first, restored, current, history = run(scenario)
+
+    assert restored == make_plan("First")
+    assert current["name"] == "First" and current["version_id"] == first["version_id"]
+    assert [day["dinner"] for day in current["plan"]] == [day["dinner"] for day in make_plan()["plan"]]
+    assert [version["name"] for version in history["versions"]] == ["Second", "First"]
+
+
+def test_restore_rejects_a_version_of_another_user(database):
+    from api.services.meal_plan_service import get_latest_meal_plan, restore_meal_plan_version
+    from api.services.meal_plan_versions import list_meal_plan_versions
+
+    async def scenario(db_session):
+        await add_user_with_plans(db_session, "u1", ["Mine"])
+        await add_user_with_plans(db_session, "u2", ["Theirs"])
+        theirs = (await list_meal_plan_versions(db_session, "u2"))["versions"][0]
+        with pytest.raises(LookupError):
+            await restore_meal_plan_version(db_session, "u1", theirs["version_id"])
+        return await get_latest_meal_plan(db_session, "u1")
+
+    assert run(scenario)["name"] == "Mine"
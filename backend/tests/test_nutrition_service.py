@@ -0,0 +1,133 @@
+import asyncio
+from datetime import date
+
+from tests.plans import make_day, make_plan
+
+
+def run(scenario):
+    from data.database import create_async_session
+
+    async def main():
+        db_session = await create_async_session()
+        try:
+            return await scenario(db_session)
+        finally:
+            await db_session.close()
+
+    return asyncio.run(main())
+
+
+def plan_with_calories(name, calories, protein=100):
+    plan = make_plan(name)
+    plan["plan"] = [
+        make_day(day["meal_slot"], macros=f"Carbs: 200g, Protein: {protein}g, Fats: 50.5g, Calories: {kcal} kcal")
+        for day, kcal in zip(plan["plan"], calories)
+    ]
+    return plan
+
+
+async def add_user(db_session, user_id, fitness_goal=None):
+    from models.user import User
+
+    user = User(user_id)
+    user.fitness_goal = fitness_goal
+    db_session.add(user)
+    await db_session.commit()
+
+
+def test_weekly_totals_of_the_current_plan(database):
+    from api.services.meal_plan_service import save_meal_plan
+    from api.services.nutrition_service import weekly_totals
+
+    async def scenario(db_session):
+        await add_user(db_session, "u1")
+        await save_meal_plan(db_session, "u1", plan_with_calories("Old", [3000] * 7))
+        await save_meal_plan(db_session, "u1", plan_with_calories("New", [1500, 1600, 1700, 1800, 1900, 2000, 2100]))
+        await add_user(db_session, "u2")
+        return await weekly_totals(db_session, "u1"), await weekly_totals(db_session, "u2")
+
+    totals, no_plan = run(scenario)
+
+    assert totals == {"user_id": "u1", "days": 7, "calories": 12600, "protein": 700, "carbs": 1400, "fat": 353.5}
+    assert no_plan is None
+
+
+def test_user_averages_are_paginated_by_user_id(database):
+    from api.services.meal_plan_service import save_meal_plan
+    from api.services.nutrition_service import user_averages
+
+    async def scenario(db_session):
+        for i, user_id in enumerate(["u3", "u1", "u2"]):
+            await add_user(db_session, user_id)
+            await save_meal_plan(db_session, user_id, plan_with_calories("Plan", [1400 + 100 * i] * 6 + [2100 + 100 * i]))
+        return (await user_averages(db_session, limit=2), await user_averages(db_session, after="u2", limit=2))
+
+    first, second = run(scenario)
+
+    assert [(user["user_id"], user["calories"], user["fat"]) for user in first["users"]] == [
+        ("u1", 1600, 50.5), ("u2", 1700, 50.5),
+    ]
+    assert first["next_after"] == "u2"
+    assert [(user["user_id"], user["calories"]) for user in second["users"]] == [("u3", 1500)]
+    assert second["next_after"] is None
+
+
+def test_cohort_stats_group_users_by_goal(database):
+    from api.services.meal_plan_service import save_meal_plan
+    from api.services.nutrition_service import cohort_stats
+
+    async def scenario(db_session):
+        for user_id, goal, kcal in [("u1", "Lose weight", 1500), ("u2", "Lose weight", 1700), ("u3", "Gain muscle", 2800)]:
+            await add_user(db_session, user_id, goal)
+            await save_meal_plan(db_session, user_id, plan_with_calories("Plan", [kcal] * 7, protein=kcal // 10))
+        return await cohort_stats(db_session, "fitness_goal")
+
+    assert run(scenario) == [
+        {"fitness_goal": "Gain muscle", "users": 1, "calories_avg": 2800, "calories_min": 2800, "calories_max": 2800,
+         "protein_avg": 280, "carbs_avg": 200, "fat_avg": 50.5},
+        {"fitness_goal": "Lose weight", "users": 2, "calories_avg": 1600, "calories_min": 1500, "calories_max": 1700,
+         "protein_avg": 160, "carbs_avg": 200, "fat_avg": 50.5},
+    ]
+
+
+def test_backfill_fills_legacy_items_once(database):
+    from sqlalchemy import select
+    from models.meal_plan import MealPlan
+    from models.meal_plan_item import MealPlanItem
+    from api.services.nutrition_service import backfill_macros
+
+    macros = [
+        "Carbs: 200g, Protein: 90g, Fats: 60g, Calories: 1800 kcal",
+        "2000 kcal, 120g protein",
+        "Balanced",
+        None,
+        "Calories: 1700",
+    ]
+
+    async def scenario(db_session):
+        await add_user(db_session, "u1")
+        plan = MealPlan("u1", "Legacy", "Saved before the macro columns", date.today())
+        db_session.add(plan)
+        await db_session.flush()
+        for text in macros:
+            db_session.add(MealPlanItem("Oats", "Salad", "Tofu", "Apple", "Monday", text, plan.id))
+        await db_session.commit()
+
+        first = await backfill_macros(db_session, batch_size=2)
+        second = await backfill_macros(db_session, batch_size=2)
+        items = (await db_session.execute(
+            select(MealPlanItem.calories, MealPlanItem.protein, MealPlanItem.carbs, MealPlanItem.fat)
+            .order_by(MealPlanItem.id)
+        )).all()
+        return first, second, [tuple(item) for item in items]
+
+    first, second, items = run(scenario)
+
+    assert (first, second) == (3, 0)
+    assert items == [
+        (1800, 90, 200, 60),
+        (2000, 120, None, None),
+        (None, None, None, None),
+        (None, None, None, None),
+        (1700, None, None, None),
+    ]
@@ -0,0 +1,106 @@
+from types import SimpleNamespace
+
+import pytest
+
+from api.services import cache
+from api.services.cache import SQLiteCache, TieredCache, TTLCache
+from api.services.plan_cache import NO_HEALTH_REPORT, plan_cache_key
+from models.user import User
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(cache, "time", SimpleNamespace(monotonic=clock, time=clock))
+    return clock
+
+
+def test_memory_entries_expire(clock):
+    memory = TTLCache(10, ttl=60)
+    memory.set("a", 1)
+
+    clock.now += 59
+    assert memory.get("a") == 1
+    clock.now += 2
+    assert memory.get("a") is None
+    assert len(memory) == 0
+
+
+def test_memory_evicts_least_recently_used():
+    memory = TTLCache(2)
+    memory.set("a", 1)
+    memory.set("b", 2)
+    memory.get("a")
+    memory.set("c", 3)
+
+    assert memory.get("a") == 1 and memory.get("b") is None and memory.get("c") == 3
+
+
+def test_persistent_entries_expire(clock, tmp_path):
+    persistent = SQLiteCache(str(tmp_path / "cache.db"), ttl=60)
+    persistent.set("a", {"plan": [1]})
+
+    clock.now += 59
+    assert persistent.get("a") == {"plan": [1]}
+    clock.now += 2
+    assert persistent.get("a") is None
+
+
+def test_persistent_entries_survive_a_restart(tmp_path):
+    SQLiteCache(str(tmp_path / "cache.db")).set("a", {"plan": [1]})
+
+    assert SQLiteCache(str(tmp_path / "cache.db")).get("a") == {"plan": [1]}
+
+
+def test_persistent_hit_is_promoted_to_memory(clock, tmp_path):
+    persistent = SQLiteCache(str(tmp_path / "cache.db"), ttl=3600)
+    persistent.set("a", {"plan": [1]})
+    tiered = TieredCache(TTLCache(10, ttl=60), persistent)
+
+    assert tiered.get("a") == {"plan": [1]}
+    assert tiered.memory.get("a") == {"plan": [1]}
+    assert tiered.get("a") == {"plan": [1]}
+    assert tiered.get("b") is None
+    assert tiered.stats() | {"hit_rate": None} == {
+        "hits": 2, "persistent_hits": 1, "misses": 1, "hit_rate": None, "memory_entries": 1, "persistent": True,
+    }
+
+    # the memory copy expires first and is promoted again from the persistent tier
+    clock.now += 61
+    assert tiered.get("a") == {"plan": [1]}
+    assert tiered.persistent_hits == 2
+
+
+def test_invalidate_clears_both_tiers(tmp_path):
+    tiered = TieredCache(TTLCache(10), SQLiteCache(str(tmp_path / "cache.db")))
+    tiered.set("a", 1)
+    tiered.invalidate("a")
+
+    assert tiered.get("a") is None and tiered.persistent.get("a") is None
+
+
+def make_user(**fields) -> User:
+    user = User("u1")
+    for name, value in {"sex": "Female", "age": 31, "bmi": 22.4, "fitness_goal": "Lose weight",
+                        "activity_level": "Moderate", "dietary_preferences": "Vegan, gluten free",
+                        "medical_conditions": "None", **fields}.items():
+        setattr(user, name, value)
+    return user
+
+
+def test_cache_key_normalizes_equivalent_profiles():
+    key = plan_cache_key(make_user(), NO_HEALTH_REPORT)
+
+    assert key == plan_cache_key(make_user(sex=" female", age=34, bmi=22.9, fitness_goal="LOSE  weight",
+                                           dietary_preferences="gluten free;vegan", medical_conditions="no"),
+                                 NO_HEALTH_REPORT)
+    assert key != plan_cache_key(make_user(age=35), NO_HEALTH_REPORT)
+    assert plan_cache_key(make_user(), "Cholesterol: high") is None
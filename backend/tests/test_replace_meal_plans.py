@@ -0,0 +1,105 @@
+import asyncio
+
+from sqlalchemy import func, select
+
+from tests.plans import make_plan
+
+
+def run(scenario):
+    from data.database import create_async_session
+
+    async def main():
+        db_session = await create_async_session()
+        try:
+            return await scenario(db_session)
+        finally:
+            await db_session.close()
+
+    return asyncio.run(main())
+
+
+async def add_users(db_session, *user_ids):
+    from models.user import User
+
+    for user_id in user_ids:
+        db_session.add(User(user_id))
+    await db_session.commit()
+
+
+async def count_items(db_session) -> int:
+    from models.meal_plan_item import MealPlanItem
+
+    return await db_session.scalar(select(func.count()).select_from(MealPlanItem))
+
+
+def test_replace_meal_plans_swaps_every_user_plan(database):
+    from api.services.meal_plan_service import get_latest_meal_plan, replace_meal_plans
+
+    async def scenario(db_session):
+        await add_users(db_session, "u1", "u2")
+        await replace_meal_plans(db_session, {"u1": make_plan("Old 1"), "u2": make_plan("Old 2")})
+        await replace_meal_plans(db_session, {"u1": make_plan("New 1"), "u2": make_plan("New 2")})
+
+        plans = [await get_latest_meal_plan(db_session, user_id) for user_id in ("u1", "u2")]
+        return plans, await count_items(db_session)
+
+    (plan_1, plan_2), items = run(scenario)
+
+    assert (plan_1["name"], plan_2["name"]) == ("New 1", "New 2")
+    assert [day["meal_slot"] for day in plan_1["plan"]] == [day["meal_slot"] for day in make_plan()["plan"]]
+    assert plan_1["plan"][0]["calories"] == 1800
+    assert items == 14
+
+
+def test_failed_replace_keeps_the_old_plans(database):
+    from api.services.meal_plan_service import get_latest_meal_plan, replace_meal_plans
+
+    async def scenario(db_session):
+        await add_users(db_session, "u1", "u2")
+        await replace_meal_plans(db_session, {"u1": make_plan("Old 1"), "u2": make_plan("Old 2")})
+        broken = make_plan("New 2")
+        del broken["plan"][3]["dinner"]
+        try:
+            await replace_meal_plans(db_session, {"u1": make_plan("New 1"), "u2": broken})
+        except KeyError:
+            pass
+        else:
+            raise AssertionError("replace_meal_plans accepted a plan without dinner")
+
+        plans = [await get_latest_meal_plan(db_session, user_id) for user_id in ("u1", "u2")]
+        return plans, await count_items(db_session)
+
+    plans, items = run(scenario)
+
+    assert [plan["name"] for plan in plans] == ["Old 1", "Old 2"]
+    assert items == 14
+
+
+def test_regenerate_meal_plans_reports_unknown_and_failed_users(database, monkeypatch):
+    from api.services import meal_plan_service
+    from api.services.meal_plan_formatter import MealPlanFormatError
+
+    async def build_meal_plan(llm, user, health_report_text, use_cache=True, retriever=None, mode=None):
+        if user.id == "u2":
+            raise MealPlanFormatError("Tuesday is missing")
+        return make_plan(f"Plan {user.id}")
+
+    monkeypatch.setattr(meal_plan_service, "build_meal_plan", build_meal_plan)
+
+    async def scenario(db_session):
+        await add_users(db_session, "u1", "u2", "u3")
+        await meal_plan_service.replace_meal_plans(db_session, {"u2": make_plan("Old 2")})
+        outcome = await meal_plan_service.regenerate_meal_plans(
+            None, db_session, ["u1", "u2", "ghost", "u3", "u1"], batch_size=2
+        )
+        names = {
+            user_id: (await meal_plan_service.get_latest_meal_plan(db_session, user_id))["name"]
+            for user_id in ("u1", "u2", "u3")
+        }
+        return outcome, names
+
+    outcome, names = run(scenario)
+
+    assert sorted(outcome["regenerated"]) == ["u1", "u3"]
+    assert outcome["failed"] == {"u2": "Tuesday is missing", "ghost": "User not found"}
+    assert names == {"u1": "Plan u1", "u2": "Old 2", "u3": "Plan u3"}
@@ -0,0 +1,19 @@
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+
+def test_import_main_does_not_load_langchain():
+    script = (
+        "import sys, main\n"
+        "loaded = sorted(name for name in sys.modules if name.split('.')[0] in ('langchain', 'langchain_core', "
+        "'langchain_openai', 'langchain_community', 'chromadb', 'openai'))\n"
+        "print(','.join(loaded))\n"
+    )
+    output = subprocess.run(
+        [sys.executable, "-c", script], cwd=Path(__file__).resolve().parent.parent,
+        env={**os.environ, "RESOURCE_WARMUP": "false"}, capture_output=True, text=True, check=True,
+    ).stdout
+
+    assert output.strip() == ""
@@ -0,0 +1,140 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from api.services.meal_plan_formatter import WEEK_DAYS, IncrementalPlanParser, extract_plan_header
+from tests.plans import make_day, make_plan
+
+PLAN_TEXT = json.dumps(make_plan())
+
+
+def feed_all(chunks) -> list:
+    parser = IncrementalPlanParser()
+    return [day for chunk in chunks for day in parser.feed(chunk)]
+
+
+def split(text: str, size: int) -> list:
+    return [text[i : i + size] for i in range(0, len(text), size)]
+
+
+@pytest.mark.parametrize("size", [1, 2, 7, 50, len(PLAN_TEXT)])
+def test_days_split_across_chunks(size):
+    days = feed_all(split(PLAN_TEXT, size))
+
+    assert days == make_plan()["plan"]
+
+
+def test_days_are_returned_as_soon_as_they_are_closed():
+    parser = IncrementalPlanParser()
+    end_of_monday = PLAN_TEXT.index("}") + 1
+
+    assert parser.feed(PLAN_TEXT[: end_of_monday - 1]) == []
+    assert [day["meal_slot"] for day in parser.feed(PLAN_TEXT[end_of_monday - 1 : end_of_monday + 2])] == ["Monday"]
+
+
+def test_braces_and_quotes_inside_strings():
+    day = make_day("Monday", dinner='Tofu {spicy} with "quoted" sauce \\ and ]')
+    text = json.dumps({"name": "P", "description": "d", "plan": [day]})
+
+    assert feed_all(split(text, 3)) == [day]
+
+
+def test_fenced_and_prefixed_response():
+    text = "Here is your meal plan:\n```json\n" + json.dumps(make_plan(), indent=2) + "\n```\nEnjoy!"
+    parser = IncrementalPlanParser()
+
+    days = [day for chunk in split(text, 11) for day in parser.feed(chunk)]
+
+    assert [day["meal_slot"] for day in days] == WEEK_DAYS
+    assert extract_plan_header(parser.text) == {"name": "Plan", "description": "A week"}
+
+
+def test_stream_ending_before_all_days():
+    truncated = PLAN_TEXT[: PLAN_TEXT.index('"Thursday"') + 30]
+
+    days = feed_all(split(truncated, 5))
+
+    assert [day["meal_slot"] for day in days] == ["Monday", "Tuesday", "Wednesday"]
+
+
+class StreamingLLM:
+    """
+    Streams a fixed completion in small chunks and answers repair requests with a full plan.
+    """
+    def __init__(self, completion: str, repair: str | None = None):
+        self.completion = completion
+        self.repair = repair if repair is not None else PLAN_TEXT
+        self.repairs = 0
+
+    def bind(self, **kwargs):
+        return self
+
+    async def astream(self, messages, **kwargs):
+        for chunk in split(self.completion, 9):
+            await asyncio.sleep(0)
+            yield SimpleNamespace(content=chunk)
+
+    async def ainvoke(self, messages, **kwargs):
+        self.repairs += 1
+        return SimpleNamespace(content=self.repair)
+
+
+def stream(llm, user_id="u1"):
+    from data.database import create_async_session
+    from models.user import User
+    from api.services.meal_plan_service import get_latest_meal_plan, stream_meal_plan
+
+    async def scenario():
+        db_session = await create_async_session()
+        try:
+            db_session.add(User(user_id))
+            await db_session.commit()
+            events = []
+            try:
+                async for event, data in stream_meal_plan(llm, db_session, user_id, use_cache=False):
+                    events.append((event, data))
+            except Exception as e:
+                events.append(("error", e))
+            return events, await get_latest_meal_plan(db_session, user_id)
+        finally:
+            await db_session.close()
+
+    return asyncio.run(scenario())
+
+
+def test_stream_meal_plan_sends_days_then_saves_the_plan(database):
+    llm = StreamingLLM("```json\n" + PLAN_TEXT + "\n```")
+
+    events, saved = stream(llm)
+
+    assert [event for event, _ in events] == ["day"] * 7 + ["done"]
+    assert [data["meal_slot"] for _, data in events[:7]] == WEEK_DAYS
+    assert llm.repairs == 0
+    assert saved["name"] == "Plan" and len(saved["plan"]) == 7
+
+
+def test_stream_meal_plan_repairs_a_truncated_stream(database):
+    plan = make_plan()
+    del plan["plan"][1]["lunch"]  # Tuesday is invalid and must not be sent
+    text = json.dumps(plan)
+    llm = StreamingLLM(text[: text.index('"Friday"') + 30])
+
+    events, saved = stream(llm)
+
+    sent = [data["meal_slot"] for event, data in events if event == "day"]
+    assert sent == ["Monday", "Wednesday", "Thursday", "Tuesday", "Friday", "Saturday", "Sunday"]
+    assert events[-1][0] == "done" and llm.repairs == 1
+    assert [day["meal_slot"] for day in saved["plan"]] == WEEK_DAYS
+
+
+def test_stream_meal_plan_keeps_the_old_plan_when_repair_fails(database):
+    from api.services.meal_plan_formatter import MealPlanFormatError
+
+    llm = StreamingLLM(PLAN_TEXT[: PLAN_TEXT.index('"Wednesday"')], repair="I cannot do that.")
+
+    events, saved = stream(llm)
+
+    assert events[-1][0] == "error" and isinstance(events[-1][1], MealPlanFormatError)
+    assert saved is None
@@ -0,0 +1,136 @@
+import numpy as np
+import pytest
+
+from api.services.vector_index import NumpyVectorIndex
+
+ROWS = 3000
+DIM = 32
+K = 10
+
+
+class FakeEmbeddings:
+    def __init__(self, vectors: dict):
+        self.vectors = vectors
+
+    def embed_query(self, text):
+        return self.vectors[text]
+
+    def embed_documents(self, texts):
+        return [self.vectors[text] for text in texts]
+
+
+@pytest.fixture(scope="module")
+def data():
+    rng = np.random.default_rng(0)
+    centers = rng.normal(size=(16, DIM))
+    vectors = (centers[rng.integers(0, len(centers), ROWS)] + 0.3 * rng.normal(size=(ROWS, DIM))).astype(np.float32)
+    queries = vectors[rng.choice(ROWS, 50, replace=False)] + 0.05 * rng.normal(size=(50, DIM))
+    documents = [f"recipe {i}" for i in range(ROWS)]
+    # "rare" matches 5 rows only, far fewer than the rows of the probed lists
+    metadatas = [{"diet": "vegan" if i % 3 == 0 else "any", "cuisine": "rare" if i % 600 == 0 else "common"}
+                 for i in range(ROWS)]
+    return vectors, queries.astype(np.float32), documents, metadatas
+
+
+def build(tmp_path_factory, data, mode, **kwargs):
+    vectors, _, documents, metadatas = data
+    directory = tmp_path_factory.mktemp(mode)
+    return NumpyVectorIndex.build(str(directory), None, vectors, documents, metadatas, mode=mode, **kwargs)
+
+
+@pytest.fixture(scope="module")
+def flat(tmp_path_factory, data):
+    return build(tmp_path_factory, data, "flat")
+
+
+def recall(found, exact) -> float:
+    return np.mean([len(set(row) & set(exact_row)) / exact.shape[1] for row, exact_row in zip(found, exact)])
+
+
+def test_flat_search_is_exact(flat, data):
+    vectors, queries, _, _ = data
+    indices, scores = flat.search_vectors(queries, K)
+
+    normalized = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    expected = np.argsort(-(queries @ normalized.T), axis=1)[:, :K]
+    assert (indices == expected).all()
+    assert (np.diff(scores, axis=1) <= 1e-6).all()
+
+
+@pytest.mark.parametrize("mode, kwargs, min_recall", [
+    ("int8", {}, 0.9),
+    ("ivf", {"nlist": 32}, 0.95),
+])
+def test_approximate_recall(tmp_path_factory, data, flat, mode, kwargs, min_recall):
+    _, queries, _, _ = data
+    index = build(tmp_path_factory, data, mode, **kwargs)
+
+    assert recall(index.search_vectors(queries, K)[0], flat.search_vectors(queries, K)[0]) >= min_recall
+
+
+@pytest.mark.parametrize("mode", ["flat", "int8", "ivf"])
+def test_filter(tmp_path_factory, data, mode):
+    _, queries, _, metadatas = data
+    index = build(tmp_path_factory, data, mode, nlist=32) if mode == "ivf" else build(tmp_path_factory, data, mode)
+
+    indices, _ = index.search_vectors(queries, K, {"$and": [{"diet": "vegan"}, {"cuisine": "common"}]})
+
+    assert indices.shape == (len(queries), K)
+    assert all(metadatas[row]["diet"] == "vegan" and metadatas[row]["cuisine"] == "common" for row in indices.ravel())
+
+
+def test_ivf_widens_the_probe_for_selective_filters(tmp_path_factory, data, flat):
+    _, queries, _, _ = data
+    index = build(tmp_path_factory, data, "ivf", nlist=32)
+    index.nprobe = 1
+
+    indices, _ = index.search_vectors(queries, 3, {"cuisine": "rare"})
+
+    assert indices.shape == (len(queries), 3)
+    assert (indices >= 0).all()
+    assert all(row % 600 == 0 for row in indices.ravel())
+    # more rows than the filter allows: every allowed row, then padding
+    indices, scores = index.search_vectors(queries, K, {"cuisine": "rare"})
+    assert (np.sort(indices[:, :5], axis=1) == np.arange(0, ROWS, 600)).all()
+    assert (indices[:, 5:] == -1).all() and np.isneginf(scores[:, 5:]).all()
+
+
+def test_filter_without_matches(flat, data):
+    _, queries, _, _ = data
+    indices, _ = flat.search_vectors(queries, K, {"cuisine": "unknown"})
+
+    assert indices.shape == (len(queries), 0)
+
+
+def test_stack_pads_short_results():
+    indices, scores = NumpyVectorIndex._stack([
+        (np.array([[1, 2, 3]]), np.array([[0.9, 0.8, 0.7]], dtype=np.float32)),
+        (np.array([[5]]), np.array([[0.5]], dtype=np.float32)),
+    ], 3)
+
+    assert indices.tolist() == [[1, 2, 3], [5, -1, -1]]
+    assert scores[1, 0] == pytest.approx(0.5) and np.isneginf(scores[1, 1:]).all()
+
+
+def test_document_search(tmp_path_factory, data):
+    vectors, _, documents, _ = data
+    index = build(tmp_path_factory, data, "ivf", nlist=32)
+    index.embedding = FakeEmbeddings({"first": vectors[0].tolist(), "second": vectors[1].tolist()})
+
+    assert index.similarity_search("first", k=1)[0].page_content == documents[0]
+    assert index.similarity_search("first", k=2, filter={"cuisine": "rare"})[0].page_content == documents[0]
+    results = index.batch_similarity_search(["first", "second"], k=1)
+    assert [docs[0].page_content for docs in results] == [documents[0], documents[1]]
+    mmr = index.max_marginal_relevance_search("first", k=3, fetch_k=10, filter={"cuisine": "rare"})
+    assert len(mmr) == 3 and all(doc.metadata["cuisine"] == "rare" for doc in mmr)
+
+
+def test_hnsw_filter(tmp_path_factory, data):
+    pytest.importorskip("hnswlib")
+    _, queries, _, _ = data
+    index = build(tmp_path_factory, data, "hnsw")
+
+    indices, _ = index.search_vectors(queries, 3, {"cuisine": "rare"})
+
+    assert indices.shape == (len(queries), 3)
+    assert all(row % 600 == 0 for row in indices.ravel())